@@ -0,0 +1,36 @@
+"""Sobe a API para benchmark, com o catálogo em SQLite (sem Postgres) ou num Postgres local
+
+    python -m benchmarks.app_server --sqlite /tmp/catalog.db --port 8801
+
+Sem --sqlite, usa o DATABASE_URL do ambiente (aponte para um banco local, nunca o de produção).
+"""
+import argparse
+import logging
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API do Cromaticar para benchmark")
+    parser.add_argument("--sqlite", help="catálogo gerado por benchmarks.catalog_fixture")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8801)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        from benchmarks.catalog_fixture import SQLiteDatabaseService
+        from services.database_service import database_service
+
+        # A instância global é compartilhada por todos os serviços: trocar os métodos dela basta
+        stand_in = SQLiteDatabaseService(args.sqlite)
+        for name in ("fetch_all", "fetch_one", "test_connection", "pool_status"):
+            setattr(database_service, name, getattr(stand_in, name))
+
+    from main import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Buscador e sites de lojas falsos (locais) para medir o caminho de scraping sem internet"""
+import asyncio
+import hashlib
+import random
+from typing import Optional
+
+from aiohttp import web
+
+# CEPs conhecidos (a base local de CEPs do benchmark é gerada a partir destes)
+STORE_CEPS = [f"{1000 + i:05d}-{(i * 37) % 1000:03d}" for i in range(200)]
+
+
+class MockUpstreams:
+    """Um servidor aiohttp com /search (resultados no formato do Google), /loja/{n} e robots.txt"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8900, latency_ms: float = 50,
+                 jitter_ms: float = 20, stores: int = 200, results_per_query: int = 5,
+                 error_rate: float = 0.0, seed: int = 42):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stores = stores
+        self.results_per_query = results_per_query
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = {"search": 0, "store": 0, "not_modified": 0, "errors": 0}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _delay(self):
+        delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+    def _fail(self) -> bool:
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.requests["errors"] += 1
+            return True
+        return False
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.requests["search"] += 1
+        await self._delay()
+        if self._fail():
+            return web.Response(status=503)
+
+        # Resultados determinísticos por consulta (mesma busca → mesmas lojas)
+        query = request.query.get("q", "")
+        first = int(hashlib.sha1(query.encode()).hexdigest(), 16) % self.stores
+        results = "".join(
+            f'<div class="g"><a href="{self.base_url}/loja/{(first + i) % self.stores}">'
+            f'<h3>Loja {(first + i) % self.stores}</h3></a></div>'
+            for i in range(self.results_per_query)
+        )
+        return web.Response(text=f"<html><body>{results}</body></html>", content_type="text/html")
+
+    async def store(self, request: web.Request) -> web.Response:
+        number = int(request.match_info["number"])
+        etag = f'"loja-{number}-v1"'
+        self.requests["store"] += 1
+        if request.headers.get("If-None-Match") == etag:
+            self.requests["not_modified"] += 1
+            await self._delay()
+            return web.Response(status=304, headers={"ETag": etag})
+
+        await self._delay()
+        if self._fail():
+            return web.Response(status=503)
+
+        cep = STORE_CEPS[number % len(STORE_CEPS)]
+        # Texto de catálogo para dar volume à página, como num site real
+        filler = " ".join(
+            f"<li>Tinta automotiva {color} metálico para Gol, Onix, HB20 e Civic</li>"
+            for color in ("prata", "preto", "branco", "vermelho", "azul", "cinza") * 15
+        )
+        html = f"""<html><head><title>Tintas Loja {number} - Tintas Automotivas</title>
+<meta property="og:site_name" content="Tintas Loja {number}"></head>
+<body><h1>Tintas Loja {number}</h1><ul>{filler}</ul>
+<p>Rua das Tintas, {number + 10}, Centro - SP, CEP {cep}</p>
+<p>Telefone (11) 3{number % 1000:03d}-{number % 10000:04d}. Entregamos em todo Brasil, frete grátis.</p>
+</body></html>"""
+        return web.Response(text=html, content_type="text/html", headers={"ETag": etag})
+
+    async def robots(self, request: web.Request) -> web.Response:
+        return web.Response(text="User-agent: *\nDisallow: /privado\n")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/search", self.search)
+        app.router.add_get("/loja/{number}", self.store)
+        app.router.add_get("/robots.txt", self.robots)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,5 +1,7 @@
 import os
 import ssl
+import uuid
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
@@ -32,22 +34,87 @@ class DatabaseConfig:
         sync_url = self.get_connection_string()
         return sync_url.replace('postgresql://', 'postgresql+asyncpg://', 1)
     
+    @property
+    def pooler_mode(self) -> str:
+        """'session' (conexão direta, padrão) ou 'transaction' (pgbouncer/Supavisor)"""
+        return os.getenv("DB_POOLER_MODE", "session").lower()
+    
+    def get_ssl_context(self) -> ssl.SSLContext:
+        """SSL para Supabase (sem verificação do certificado, como no engine)"""
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
+    
+    def get_listen_url(self) -> Optional[str]:
+        """URL para LISTEN (CATALOG_LISTEN_URL ou DATABASE_URL)
+        
+        LISTEN precisa de uma sessão própria: atrás de pgbouncer/Supavisor em modo transação
+        só funciona com a URL de conexão direta; sem ela devolve None.
+        """
+        return self.get_direct_url()
+    
+    def get_direct_url(self) -> Optional[str]:
+        """URL de uma sessão própria no Postgres (LISTEN, travas consultivas de sessão)
+        
+        CATALOG_LISTEN_URL se definida; senão DATABASE_URL, a não ser que ela aponte para um
+        pooler em modo transação (cada comando pode cair num backend diferente): aí None.
+        """
+        url = os.getenv("CATALOG_LISTEN_URL")
+        if url:
+            return url
+        if self.pooler_mode == "transaction":
+            return None
+        return self.get_connection_string()
+    
+    def get_pool_settings(self) -> dict:
+        """Parâmetros do pool de conexões lidos do ambiente"""
+        return {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "300")),
+            # O pre-ping custa um round-trip por checkout; o recycle já descarta conexões velhas
+            "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "false").lower() == "true",
+        }
+    
+    def pool_status(self) -> dict:
+        """Métricas do pool (vazio se o engine ainda não foi criado)"""
+        if self._async_engine is None:
+            return {}
+        pool = self._async_engine.pool
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+    
     def init_engines(self):
         """Inicializa os engines de conexão"""
         # Usaremos apenas o driver assíncrono (asyncpg) para evitar dependência de psycopg2
         async_url = self.get_async_connection_string()
 
         # SSL para Supabase (asyncpg aceita connect_args via SQLAlchemy)
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
+        pool_settings = self.get_pool_settings()
+        connect_args = {"ssl": self.get_ssl_context()}
+        
+        if self.pooler_mode == "transaction":
+            # pgbouncer/Supavisor em modo transação não suportam prepared statements nomeados
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+        else:
+            # Cache de prepared statements do asyncpg (por conexão)
+            connect_args["prepared_statement_cache_size"] = int(
+                os.getenv("DB_STATEMENT_CACHE_SIZE", "500")
+            )
 
         self._async_engine = create_async_engine(
             async_url,
             echo=False,  # Desativa logs de queries em produção
-            pool_pre_ping=True,
-            pool_recycle=300,
-            connect_args={"ssl": ssl_context}
+            connect_args=connect_args,
+            **pool_settings
         )
         
         # Session factory assíncrona
@@ -68,6 +135,27 @@ class DatabaseConfig:
             self.init_engines()
         return self._async_engine
     
+    @asynccontextmanager
+    async def driver_connection(self):
+        """Conexão asyncpg do pool, para o que o SQLAlchemy não expõe (COPY, DDL, advisory locks)"""
+        async with self.async_engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            yield raw.driver_connection
+    
+    @asynccontextmanager
+    async def direct_connection(self):
+        """Conexão asyncpg própria, fora do pool (ver get_direct_url); ValueError se não há URL direta"""
+        import asyncpg
+        
+        url = self.get_direct_url()
+        if url is None:
+            raise ValueError("Com DB_POOLER_MODE=transaction, defina CATALOG_LISTEN_URL (conexão direta)")
+        conn = await asyncpg.connect(url, ssl=self.get_ssl_context(), statement_cache_size=0)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+    
     @property
     def async_session(self):
         if self._async_session is None:
@@ -1,11 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
+import time
 
 from config.database import db_config
 from services.database_service import database_service
+from migrations.runner import connect as migrations_connect, pending_migrations
+from services.catalog_service import catalog_service
+from services.catalog_change_feed import catalog_change_feed
+from services.lazy_service import fetch, store_search
+from services.color_match_service import color_match_service
+from services.photo_color_service import photo_color_service
+from services.snapshot_store import default_shared_dir
+from services.search_job_service import search_job_service
+from services.single_flight import single_flight_stats
+from services.http_cache import CachePolicy, HTTPCache
+from services.metrics_service import metrics_service, HTTP_REQUEST_SECONDS, server_timing
 from routes.colors import router as colors_router
 from routes.automotive import router as automotive_router  # ← ESTAVA FALTANDO!
 
@@ -13,19 +27,73 @@ from routes.automotive import router as automotive_router  # ← ESTAVA FALTANDO
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def warm_up():
+    """Prepara o worker antes de ele se declarar pronto: pool aberto, catálogo e índices em memória"""
+    started = time.perf_counter()
+    
+    # Conexões abertas agora não pagam o handshake na primeira requisição
+    connections = await database_service.warm_up()
+    logger.info(f"🔌 Pool aquecido: {connections} conexões")
+    
+    # As consultas servidas pelo banco dependem das views criadas pelas migrações
+    try:
+        async with migrations_connect() as conn:
+            pending = await pending_migrations(conn)
+        if pending:
+            logger.warning(
+                f"⚠️ Migrações pendentes: {', '.join(m.name for m in pending)} "
+                f"(rode python -m migrations.runner upgrade)"
+            )
+    except Exception as e:
+        logger.warning(f"Não foi possível verificar as migrações: {e}")
+    
+    # Carregar catálogo em memória (do snapshot compartilhado, se outro worker já o carregou);
+    # o índice de busca é reconstruído pelo listener do catálogo
+    if await catalog_service.refresh():
+        snapshot = catalog_service.snapshot
+        await asyncio.to_thread(color_match_service.get_index, snapshot)
+    
+    logger.info(f"🔥 Aquecimento concluído em {time.perf_counter() - started:.2f}s")
+
+# Aquecimento opcional do que é carregado sob demanda; roda em segundo plano depois que o
+# worker fica pronto, então não atrasa o cold start
+PRELOADERS = {
+    "store_search": store_search.load,
+    "photo": photo_color_service.warm_up,
+}
+
+async def preload(names):
+    """Carrega os serviços de PRELOAD_SERVICES (ex.: 'store_search,photo')"""
+    for name in names:
+        started = time.perf_counter()
+        try:
+            await PRELOADERS[name]()
+            logger.info(f"📦 {name} pré-carregado em {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.warning(f"Não foi possível pré-carregar {name}: {e}")
+
+def preload_names() -> list:
+    names = [name.strip() for name in os.getenv("PRELOAD_SERVICES", "photo").split(",") if name.strip()]
+    unknown = [name for name in names if name not in PRELOADERS]
+    if unknown:
+        logger.warning(f"PRELOAD_SERVICES desconhecidos: {', '.join(unknown)} (disponíveis: {', '.join(PRELOADERS)})")
+    return [name for name in names if name in PRELOADERS]
+
+def is_ready() -> bool:
+    """Pronto = aquecimento terminado e catálogo carregado"""
+    return getattr(app.state, "warmed_up", False) and catalog_service.snapshot is not None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Iniciando Cromaticar API...")
+    app.state.warmed_up = False
     
     try:
         # Testar conexão com banco
         if await database_service.test_connection():
             logger.info("✅ Conectado ao Supabase")
-            
-            # Verificar se temos dados
-            result = await database_service.fetch_one("SELECT COUNT(*) FROM montadora")
-            logger.info(f"📊 Montadoras no banco: {result[0]}")
+            await warm_up()
             
         else:
             logger.error("❌ Não foi possível conectar ao Supabase")
@@ -34,10 +102,27 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ Erro na inicialização: {e}")
     
+    # Sem catálogo o worker segue "não pronto" até a recarga periódica conseguir carregá-lo
+    app.state.warmed_up = True
+    
+    # Recarga periódica (também recupera o catálogo se o banco estava fora no startup)
+    catalog_service.start_background_refresh()
+    # Edições no Supabase chegam em ~1s pelo LISTEN; a recarga periódica fica como rede de segurança
+    catalog_change_feed.start()
+    # Pool de fotos (padrão) e, se pedido, a busca de lojas sobem sem segurar o readiness
+    app.state.preload_task = asyncio.create_task(preload(preload_names()))
+    
     yield
     
     # Shutdown
     logger.info("👋 Encerrando Cromaticar API...")
+    app.state.preload_task.cancel()
+    await catalog_change_feed.stop()
+    await catalog_service.stop()
+    await search_job_service.stop()
+    if fetch.loaded:
+        await fetch.get().close()
+    await photo_color_service.close()
 
 app = FastAPI(
     title="Cromaticar API",
@@ -55,6 +140,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _policy(prefix: str, max_age: int, stale: int, versioned: bool = True) -> CachePolicy:
+    return CachePolicy(
+        int(os.getenv(f"HTTP_CACHE_{prefix}_MAX_AGE", str(max_age))),
+        int(os.getenv(f"HTTP_CACHE_{prefix}_STALE_SECONDS", str(stale))),
+        versioned
+    )
+
+# Catálogo: muda só quando o snapshot muda (o ETag carrega a versão); revalidar é barato
+CATALOG_POLICY = _policy("CATALOG", 300, 86400)
+SEARCH_POLICY = _policy("SEARCH", 60, 600)
+# CEP → coordenadas praticamente não muda; o ETag é o hash da resposta
+LOCATION_POLICY = _policy("LOCATION", 86400, 604800, versioned=False)
+
+ROUTE_CACHE_POLICIES = {
+    "/api/brands": CATALOG_POLICY,
+    "/api/brands/{brand_id}/years": CATALOG_POLICY,
+    "/api/brands/{brand_id}/years/{year_id}/models": CATALOG_POLICY,
+    "/api/models/{model_id}/years/{year_id}/colors": CATALOG_POLICY,
+    "/api/catalog/tree": CATALOG_POLICY,
+    "/api/search": SEARCH_POLICY,
+    "/api/brands/search": SEARCH_POLICY,
+    "/api/colors/search": SEARCH_POLICY,
+    "/api/colors/nearest": SEARCH_POLICY,
+    "/api/automotive-search/user-location": LOCATION_POLICY,
+}
+
+# Registrado antes das métricas para que os 304 também sejam medidos
+app.middleware("http")(HTTPCache(
+    app, ROUTE_CACHE_POLICIES,
+    lambda: catalog_service.snapshot.version if catalog_service.snapshot else None
+))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Duração por rota (histograma) e, se habilitado, o cabeçalho Server-Timing por etapa"""
+    started = time.perf_counter()
+    with metrics_service.request_scope() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    
+    # Rota como template (/api/brands/{brand_id}/years) para não explodir a cardinalidade
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed, request.method, getattr(route, "path", "unmatched"), str(response.status_code)
+    )
+    if metrics_service.timing_headers:
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
+
 # Incluir rotas (AGORA COMPLETO)
 app.include_router(colors_router)
 app.include_router(automotive_router)  # ← AGORA INCLUÍDO!
@@ -71,6 +205,28 @@ async def root():
         }
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas no formato texto do Prometheus"""
+    return PlainTextResponse(metrics_service.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: o processo está de pé e o event loop responde (não consulta o banco)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 só depois do aquecimento e com o catálogo em memória; senão 503"""
+    snapshot = catalog_service.snapshot
+    body = {
+        "ready": is_ready(),
+        "warmed_up": getattr(app.state, "warmed_up", False),
+        "catalog_version": snapshot.version if snapshot else None,
+        "pid": os.getpid()
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
 @app.get("/health")
 async def health_check():
     """Health check completo"""
@@ -82,12 +238,24 @@ async def health_check():
             result = await database_service.fetch_one("SELECT COUNT(*) FROM montadora")
             brands_count = result[0] if result else 0
         
+        snapshot = catalog_service.snapshot
+        
         return {
             "status": "healthy" if db_healthy else "degraded",
+            "ready": is_ready(),
             "database": {
                 "connected": db_healthy,
-                "brands_count": brands_count
+                "brands_count": brands_count,
+                "pool": database_service.pool_status()
+            },
+            "catalog": {
+                "loaded": snapshot is not None,
+                "loaded_at": snapshot.loaded_at if snapshot else None,
+                "change_feed": catalog_change_feed.status()
             },
+            "single_flight": single_flight_stats(),
+            "outbound": fetch.get().host_status() if fetch.loaded else {},
+            "lazy_services": {"store_search": store_search.status(), "fetch": fetch.status()},
             "service": "cromaticar-api"
         }
     except Exception as e:
@@ -101,10 +269,24 @@ if __name__ == "__main__":
     
     port = int(os.getenv("PORT", 8000))
     debug = os.getenv("DEBUG", "false").lower() == "true"
+    workers = int(os.getenv("WEB_CONCURRENCY", os.getenv("WORKERS", "1")))
     
-    uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=port,
-        reload=debug
-    )
\ No newline at end of file
+    if workers > 1 and not debug:
+        # Caches compartilhados entre os workers (herdados pelo ambiente de cada processo):
+        # o catálogo em memória compartilhada e o cache de scraping em SQLite
+        os.environ.setdefault(
+            "CATALOG_SHARED_SNAPSHOT",
+            os.path.join(default_shared_dir(), f"catalog-{port}.json")
+        )
+        os.environ.setdefault("SCRAPING_CACHE_DB", os.path.join("data", "cache.db"))
+        logger.info(f"🧵 Subindo {workers} workers na porta {port}")
+        
+        # Com vários workers o uvicorn precisa importar o app em cada processo
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(
+            app, 
+            host="0.0.0.0", 
+            port=port,
+            reload=debug
+        )
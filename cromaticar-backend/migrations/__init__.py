@@ -0,0 +1,7 @@
+"""Migrações do banco mantidas pelo backend (índices e views materializadas do catálogo)
+
+    python -m migrations.runner status
+    python -m migrations.runner upgrade
+    python -m migrations.runner refresh
+    python -m migrations.runner explain
+"""
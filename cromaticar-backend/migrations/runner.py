@@ -0,0 +1,319 @@
+"""Aplica as migrações de migrations/sql, atualiza as views materializadas e confere os planos
+
+    python -m migrations.runner status
+    python -m migrations.runner upgrade
+    python -m migrations.runner refresh [--blocking]
+    python -m migrations.runner explain [--analyze] [--force-index]
+
+Usa o DATABASE_URL do ambiente, com o mesmo SSL e modo de pooler da API. O upgrade segura uma
+trava consultiva de sessão, então roda numa conexão direta (CATALOG_LISTEN_URL atrás de um pooler
+em modo transação).
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from config.database import db_config
+from services.catalog_queries import ENDPOINT_QUERIES
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+
+# Views materializadas do catálogo, na ordem de atualização
+CATALOG_VIEWS = ("mv_brand_years", "mv_brand_year_models", "mv_model_year_colors")
+
+# Trava consultiva: dois deploys simultâneos não aplicam a mesma migração duas vezes
+ADVISORY_LOCK_KEY = 0x43524F4D  # "CROM"
+# Trava da atualização das views pelos workers (uma atualização por vez no cluster)
+VIEW_REFRESH_LOCK_KEY = ADVISORY_LOCK_KEY + 1
+
+SCHEMA_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+# Nós de plano que indicam que a consulta saiu do index-only scan
+REGRESSION_NODES = {
+    "Seq Scan", "Index Scan", "Bitmap Heap Scan", "Hash Join", "Merge Join",
+    "Nested Loop", "Sort", "Incremental Sort", "HashAggregate",
+}
+
+
+class Migration:
+    """Um arquivo NNNN_nome.sql; '-- no-transaction' na primeira linha roda comando a comando"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.version = self.name.split("_", 1)[0]
+        with open(path, encoding="utf-8") as file:
+            self.sql = file.read()
+        self.checksum = hashlib.sha1(self.sql.encode()).hexdigest()[:16]
+        self.transactional = not self.sql.lstrip().startswith("-- no-transaction")
+
+    def statements(self) -> List[str]:
+        """Comandos do arquivo (terminados por ';' no fim da linha), sem os comentários
+
+        Corpos de função entre $$ podem ter ';' no fim da linha sem encerrar o comando.
+        """
+        statements = []
+        current: List[str] = []
+        in_body = False
+        for line in self.sql.splitlines():
+            if not in_body and line.strip().startswith("--"):
+                continue
+            current.append(line)
+            if line.count("$$") % 2:
+                in_body = not in_body
+            if not in_body and line.rstrip().endswith(";"):
+                statements.append("\n".join(current).strip().rstrip(";").strip())
+                current = []
+        tail = "\n".join(current).strip()
+        if tail:
+            statements.append(tail)
+        return [statement for statement in statements if statement]
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    return [Migration(path) for path in sorted(glob.glob(os.path.join(directory, "*.sql")))]
+
+
+def connect():
+    """Conexão asyncpg tirada do engine configurado (comandos DDL vão direto ao driver)"""
+    return db_config.driver_connection()
+
+
+def direct_connect():
+    """Conexão própria, fora do pool: travas de sessão atrás de um pooler em modo transação
+    seriam liberadas (ou não) em outro backend"""
+    return db_config.direct_connection()
+
+
+async def applied_migrations(conn) -> Dict[str, Dict]:
+    """Migrações já registradas em schema_migrations (vazio se a tabela não existe)"""
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return {}
+    rows = await conn.fetch("SELECT version, name, checksum, applied_at FROM schema_migrations")
+    return {row["version"]: dict(row) for row in rows}
+
+
+async def pending_migrations(conn) -> List[Migration]:
+    applied = await applied_migrations(conn)
+    return [migration for migration in load_migrations() if migration.version not in applied]
+
+
+async def upgrade(conn) -> List[str]:
+    """Aplica as migrações pendentes em ordem; devolve os nomes aplicados
+
+    A trava é de sessão (as migrações '-- no-transaction' não cabem numa transação): conn
+    precisa ser uma conexão direta (direct_connect).
+    """
+    await conn.execute(SCHEMA_TABLE)
+    await conn.execute("SELECT pg_advisory_lock($1)", ADVISORY_LOCK_KEY)
+    try:
+        applied = await applied_migrations(conn)
+        done = []
+        for migration in load_migrations():
+            record = applied.get(migration.version)
+            if record is not None:
+                if record["checksum"] != migration.checksum:
+                    logger.warning(f"Migração {migration.name} mudou depois de aplicada (checksum diferente)")
+                continue
+
+            started = time.perf_counter()
+            register = ("INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)",
+                        migration.version, migration.name, migration.checksum)
+            if migration.transactional:
+                async with conn.transaction():
+                    for statement in migration.statements():
+                        await conn.execute(statement)
+                    await conn.execute(*register)
+            else:
+                # Comandos idempotentes (IF NOT EXISTS): se falhar no meio, rodar de novo completa
+                for statement in migration.statements():
+                    await conn.execute(statement)
+                await conn.execute(*register)
+            logger.info(f"✅ Migração {migration.name} aplicada em {time.perf_counter() - started:.1f}s")
+            done.append(migration.name)
+
+        if done:
+            await vacuum_views(conn)
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_KEY)
+
+
+async def vacuum_views(conn):
+    """VACUUM ANALYZE das views: o mapa de visibilidade é o que dispensa a leitura do heap no index-only scan"""
+    for view in CATALOG_VIEWS:
+        await conn.execute(f"VACUUM (ANALYZE) {view}")
+
+
+async def _refresh(conn, concurrently: bool) -> Dict[str, float]:
+    timings = {}
+    mode = " CONCURRENTLY" if concurrently else ""
+    for view in CATALOG_VIEWS:
+        started = time.perf_counter()
+        await conn.execute(f"REFRESH MATERIALIZED VIEW{mode} {view}")
+        timings[view] = time.perf_counter() - started
+    return timings
+
+
+async def refresh_views(conn, concurrently: bool = True) -> Dict[str, float]:
+    """Atualiza as views do catálogo; CONCURRENTLY mantém as leituras funcionando durante a carga"""
+    timings = await _refresh(conn, concurrently)
+    await vacuum_views(conn)
+    return timings
+
+
+async def try_refresh_views(conn) -> Optional[Dict[str, float]]:
+    """refresh_views, a não ser que outro processo já esteja atualizando (aí devolve None)
+
+    Usado pelos workers a cada mudança do feed: todos recebem o mesmo aviso, então pular quando
+    outro está no meio da atualização não perde nada — quem está atualizando também o recebeu e
+    atualiza de novo em seguida.
+
+    A trava é da transação que faz o REFRESH: o commit (ou o rollback) a libera no mesmo backend,
+    inclusive atrás de um pooler em modo transação, onde uma trava de sessão podia vazar.
+    """
+    async with conn.transaction():
+        if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", VIEW_REFRESH_LOCK_KEY):
+            return None
+        timings = await _refresh(conn, concurrently=True)
+    # VACUUM não roda dentro de transação
+    await vacuum_views(conn)
+    return timings
+
+
+def plan_nodes(plan: Dict) -> List[Dict]:
+    """Todos os nós do plano (o próprio e os filhos), em profundidade"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+async def explain_endpoints(conn, analyze: bool = False, force_index: bool = False) -> List[Dict]:
+    """Plano de cada consulta de endpoint; 'regressions' lista o que impede o index-only scan
+
+    force_index desliga seq scan e sort para conferir se os índices cobrem a consulta mesmo
+    em bancos pequenos, onde o planner prefere ler a tabela inteira.
+    """
+    options = "FORMAT JSON, ANALYZE, BUFFERS" if analyze else "FORMAT JSON"
+    results = []
+    for endpoint, (query, sample_query) in ENDPOINT_QUERIES.items():
+        params = []
+        if sample_query:
+            sample = await conn.fetchrow(sample_query)
+            if sample is None:
+                results.append({"endpoint": endpoint, "nodes": [], "regressions": ["view vazia"]})
+                continue
+            params = list(sample)
+
+        async with conn.transaction():
+            if force_index:
+                await conn.execute("SET LOCAL enable_seqscan = off; SET LOCAL enable_sort = off")
+            raw = await conn.fetchval(f"EXPLAIN ({options}) {query}", *params)
+
+        explained = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+        plan = explained["Plan"]
+        nodes = plan_nodes(plan)
+        node_types = [node["Node Type"] for node in nodes]
+        regressions = [node_type for node_type in node_types if node_type in REGRESSION_NODES]
+        if "Index Only Scan" not in node_types:
+            regressions.append("sem Index Only Scan")
+
+        results.append({
+            "endpoint": endpoint,
+            "params": params,
+            "nodes": node_types,
+            "indexes": [node["Index Name"] for node in nodes if "Index Name" in node],
+            "regressions": regressions,
+            # Heap fetches > 0: mapa de visibilidade desatualizado (rodar refresh/VACUUM)
+            "heap_fetches": sum(node.get("Heap Fetches", 0) for node in nodes) if analyze else None,
+            "total_cost": plan.get("Total Cost"),
+            "execution_ms": explained.get("Execution Time"),
+        })
+    return results
+
+
+async def run_command(args) -> int:
+    try:
+        async with connect() as conn:
+            if args.command == "status":
+                applied = await applied_migrations(conn)
+                for migration in load_migrations():
+                    record = applied.get(migration.version)
+                    if record is None:
+                        state = "pendente"
+                    elif record["checksum"] != migration.checksum:
+                        state = f"aplicada em {record['applied_at']:%Y-%m-%d %H:%M} (ALTERADA depois)"
+                    else:
+                        state = f"aplicada em {record['applied_at']:%Y-%m-%d %H:%M}"
+                    print(f"{migration.name}: {state}")
+                return 0
+
+            if args.command == "upgrade":
+                async with direct_connect() as direct:
+                    done = await upgrade(direct)
+                print(f"✅ {len(done)} migrações aplicadas" if done else "Nada pendente")
+                return 0
+
+            if args.command == "refresh":
+                timings = await refresh_views(conn, concurrently=not args.blocking)
+                for view, seconds in timings.items():
+                    print(f"🔄 {view}: {seconds:.2f}s")
+                return 0
+
+            results = await explain_endpoints(conn, analyze=args.analyze, force_index=args.force_index)
+            if args.json:
+                print(json.dumps(results, indent=2, default=str))
+            else:
+                for result in results:
+                    mark = "❌" if result["regressions"] else "✅"
+                    print(f"{mark} {result['endpoint']}: {' → '.join(result['nodes'])}")
+                    if result["regressions"]:
+                        print(f"   regressões: {', '.join(result['regressions'])}")
+                    if result.get("heap_fetches"):
+                        print(f"   ⚠️  {result['heap_fetches']} heap fetches (rode o refresh)")
+            return 1 if any(result["regressions"] for result in results) else 0
+    finally:
+        await db_config.async_engine.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Migrações e views do catálogo")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="Lista as migrações e se já foram aplicadas")
+    commands.add_parser("upgrade", help="Aplica as migrações pendentes")
+
+    refresh_parser = commands.add_parser("refresh", help="Atualiza as views materializadas")
+    refresh_parser.add_argument("--blocking", action="store_true",
+                                help="sem CONCURRENTLY (mais rápido, mas bloqueia leituras)")
+
+    explain_parser = commands.add_parser("explain", help="Confere o plano das consultas dos endpoints")
+    explain_parser.add_argument("--analyze", action="store_true", help="executa (EXPLAIN ANALYZE)")
+    explain_parser.add_argument("--force-index", action="store_true",
+                                help="desliga seq scan/sort (bancos pequenos)")
+    explain_parser.add_argument("--json", action="store_true")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(run_command(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+-- no-transaction
+-- Índices de cobertura das tabelas do catálogo. CONCURRENTLY não bloqueia escritas no Supabase,
+-- mas não roda dentro de transação: cada comando é executado e confirmado isoladamente.
+
+-- Vínculos por modelo/ano com a cor no próprio índice (cores de um modelo/ano, anos de um modelo)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_modelo_ano_cor_covering
+    ON modelo_ano_cor (id_modelo, id_ano, id_cor);
+
+-- Modelos de uma montadora sem ler a tabela
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_modelo_montadora
+    ON modelo (id_montadora) INCLUDE (id_modelo, nome);
+
+-- Lista de montadoras já na ordem do endpoint
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_montadora_nome
+    ON montadora (nome) INCLUDE (id_montadora);
+
+ANALYZE montadora;
+ANALYZE modelo;
+ANALYZE modelo_ano_cor;
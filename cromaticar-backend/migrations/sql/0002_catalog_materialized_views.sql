@@ -0,0 +1,34 @@
+-- Views materializadas do drill-down do catálogo (atualizar com: python -m migrations.runner refresh).
+-- Cada uma tem um índice único (exigido pelo REFRESH ... CONCURRENTLY) com as colunas na ordem
+-- do endpoint, para que a consulta seja um index-only scan sem sort nem join.
+
+-- Montadora → anos
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_brand_years AS
+SELECT DISTINCT m.id_montadora, a.id_ano, a.ano
+FROM modelo_ano_cor mac
+JOIN modelo m ON mac.id_modelo = m.id_modelo
+JOIN ano a ON mac.id_ano = a.id_ano;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_brand_years_key
+    ON mv_brand_years (id_montadora, ano DESC, id_ano);
+
+-- Montadora + ano → modelos
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_brand_year_models AS
+SELECT DISTINCT m.id_montadora, mac.id_ano, m.id_modelo, m.nome
+FROM modelo_ano_cor mac
+JOIN modelo m ON mac.id_modelo = m.id_modelo;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_brand_year_models_key
+    ON mv_brand_year_models (id_montadora, id_ano, nome, id_modelo);
+
+-- Modelo + ano → cores (os dados da cor vão no INCLUDE do índice de ordenação)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_model_year_colors AS
+SELECT DISTINCT mac.id_modelo, mac.id_ano, c.id_cor, c.nome_cor, c.codigo_cor, c.rgb
+FROM modelo_ano_cor mac
+JOIN cor c ON mac.id_cor = c.id_cor;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_model_year_colors_key
+    ON mv_model_year_colors (id_modelo, id_ano, id_cor);
+
+CREATE INDEX IF NOT EXISTS mv_model_year_colors_by_name
+    ON mv_model_year_colors (id_modelo, id_ano, nome_cor) INCLUDE (id_cor, codigo_cor, rgb);
@@ -0,0 +1,70 @@
+-- Feed de mudanças do catálogo: cada alteração avisa os workers (LISTEN catalog_changes) com a
+-- montadora afetada. Avisos idênticos na mesma transação são entregues uma vez só, então uma carga
+-- em massa gera um aviso por montadora, não um por linha.
+
+-- Montadora de uma linha alterada (NULL: não dá para saber, ex. ano e cor valem para todas)
+CREATE OR REPLACE FUNCTION catalog_change_brand(table_name text, changed jsonb) RETURNS integer
+LANGUAGE sql STABLE AS $$
+    SELECT CASE table_name
+        WHEN 'montadora' THEN (changed->>'id_montadora')::integer
+        WHEN 'modelo' THEN (changed->>'id_montadora')::integer
+        WHEN 'modelo_ano_cor' THEN (
+            SELECT id_montadora FROM modelo WHERE id_modelo = (changed->>'id_modelo')::integer
+        )
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION catalog_notify_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('catalog_changes', json_build_object('table', TG_TABLE_NAME, 'brand', NULL)::text);
+        RETURN NULL;
+    END IF;
+    -- UPDATE avisa a montadora antiga e a nova (um modelo pode mudar de montadora)
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'brand', catalog_change_brand(TG_TABLE_NAME, to_jsonb(OLD)))::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'brand', catalog_change_brand(TG_TABLE_NAME, to_jsonb(NEW)))::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS catalog_change ON montadora;
+CREATE TRIGGER catalog_change AFTER INSERT OR UPDATE OR DELETE ON montadora
+    FOR EACH ROW EXECUTE FUNCTION catalog_notify_change();
+DROP TRIGGER IF EXISTS catalog_truncate ON montadora;
+CREATE TRIGGER catalog_truncate AFTER TRUNCATE ON montadora
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify_change();
+
+DROP TRIGGER IF EXISTS catalog_change ON ano;
+CREATE TRIGGER catalog_change AFTER INSERT OR UPDATE OR DELETE ON ano
+    FOR EACH ROW EXECUTE FUNCTION catalog_notify_change();
+DROP TRIGGER IF EXISTS catalog_truncate ON ano;
+CREATE TRIGGER catalog_truncate AFTER TRUNCATE ON ano
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify_change();
+
+DROP TRIGGER IF EXISTS catalog_change ON modelo;
+CREATE TRIGGER catalog_change AFTER INSERT OR UPDATE OR DELETE ON modelo
+    FOR EACH ROW EXECUTE FUNCTION catalog_notify_change();
+DROP TRIGGER IF EXISTS catalog_truncate ON modelo;
+CREATE TRIGGER catalog_truncate AFTER TRUNCATE ON modelo
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify_change();
+
+DROP TRIGGER IF EXISTS catalog_change ON cor;
+CREATE TRIGGER catalog_change AFTER INSERT OR UPDATE OR DELETE ON cor
+    FOR EACH ROW EXECUTE FUNCTION catalog_notify_change();
+DROP TRIGGER IF EXISTS catalog_truncate ON cor;
+CREATE TRIGGER catalog_truncate AFTER TRUNCATE ON cor
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify_change();
+
+DROP TRIGGER IF EXISTS catalog_change ON modelo_ano_cor;
+CREATE TRIGGER catalog_change AFTER INSERT OR UPDATE OR DELETE ON modelo_ano_cor
+    FOR EACH ROW EXECUTE FUNCTION catalog_notify_change();
+DROP TRIGGER IF EXISTS catalog_truncate ON modelo_ano_cor;
+CREATE TRIGGER catalog_truncate AFTER TRUNCATE ON modelo_ano_cor
+    FOR EACH STATEMENT EXECUTE FUNCTION catalog_notify_change();
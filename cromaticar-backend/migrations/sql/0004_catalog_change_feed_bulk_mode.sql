@@ -0,0 +1,25 @@
+-- Cargas em massa (python -m services.catalog_ingest) ligam cromaticar.bulk_load na transação:
+-- os triggers deixam de avisar linha a linha e a carga avisa uma vez por montadora no fim.
+
+CREATE OR REPLACE FUNCTION catalog_notify_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF current_setting('cromaticar.bulk_load', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('catalog_changes', json_build_object('table', TG_TABLE_NAME, 'brand', NULL)::text);
+        RETURN NULL;
+    END IF;
+    -- UPDATE avisa a montadora antiga e a nova (um modelo pode mudar de montadora)
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'brand', catalog_change_brand(TG_TABLE_NAME, to_jsonb(OLD)))::text);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'brand', catalog_change_brand(TG_TABLE_NAME, to_jsonb(NEW)))::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 # Schemas para o DER
 class Brand(BaseModel):
@@ -21,6 +21,22 @@ class Color(BaseModel):
     codigo_cor: Optional[str] = None
     rgb: str
 
+class ColorMatch(Color):
+    distance: float  # distância perceptual (CIE76 ou CIEDE2000) até a cor pedida
+
+class PhotoColor(BaseModel):
+    rgb: str  # média dos pixels do grupo, '#RRGGBB'
+    lab: List[float]  # centro do grupo em CIE Lab (usado na busca)
+    share: float  # fração dos pixels da tinta que caíram neste grupo
+    matches: List[ColorMatch]
+
+class SearchHit(BaseModel):
+    type: str  # 'brand', 'model' ou 'color'
+    id: int
+    label: str
+    score: float
+    data: Dict[str, Any]
+
 # Schemas para busca de lojas
 class StoreResult(BaseModel):
     name: str
@@ -42,4 +58,11 @@ class AutomotiveSearchRequest(BaseModel):
     car_year: str
     user_cep: Optional[str] = None
     user_lat: Optional[float] = None
-    user_lng: Optional[float] = None
\ No newline at end of file
+    user_lng: Optional[float] = None
+
+class SearchJobStatus(BaseModel):
+    job_id: str
+    status: str  # 'queued', 'running', 'done' ou 'error'
+    partial_results: List[StoreResult] = []
+    results: Optional[List[StoreResult]] = None
+    error: Optional[str] = None
\ No newline at end of file
@@ -1,11 +1,12 @@
+import json
 from fastapi import APIRouter, HTTPException
-from services.scraping_service import AutomotiveScrapingService
-from services.location_service import LocationService
-from models.schemas import AutomotiveSearchRequest, StoreResult
+from fastapi.responses import StreamingResponse
+# A busca de lojas (scraping, CEPs, cadastro) só é importada na primeira chamada destas rotas
+from services.lazy_service import store_search
+from services.search_job_service import search_job_service
+from models.schemas import AutomotiveSearchRequest, StoreResult, SearchJobStatus
 
 router = APIRouter(prefix="/api/automotive-search", tags=["Automotive Search"])
-scraping_service = AutomotiveScrapingService()
-location_service = LocationService()
 
 @router.post("/search-stores", response_model=list[StoreResult])
 async def search_automotive_stores(request: AutomotiveSearchRequest):
@@ -13,82 +14,68 @@ async def search_automotive_stores(request: AutomotiveSearchRequest):
     Busca lojas de tintas automotivas e autopeças
     """
     try:
-        # 1. Obter localização do usuário
-        user_location = location_service.get_user_coordinates(
-            request.user_cep, 
-            request.user_lat, 
-            request.user_lng
-        )
-        
-        # 2. Buscar lojas físicas
-        physical_stores = scraping_service.search_automotive_stores(
-            request.color_name,
-            request.car_model,
-            user_location
-        )
-        
-        # 3. Buscar lojas online
-        online_stores = scraping_service.search_online_stores(
-            request.color_code,
-            request.car_model,
-            request.user_cep or ""
-        )
-        
-        # 4. Calcular distâncias para lojas físicas
-        for store in physical_stores:
-            if store.get('lat') and store.get('lng') and user_location:
-                distance_info = location_service.calculate_distance_haversine(
-                    user_location["lat"], user_location["lng"],
-                    store["lat"], store["lng"]
-                )
-                store.update(distance_info)
-        
-        # 5. Combinar e formatar resultados
-        results = []
-        
-        # Lojas físicas
-        for store in physical_stores:
-            results.append(StoreResult(
-                name=store["name"],
-                url=store["url"],
-                type="physical",
-                address=store.get("address"),
-                phone=store.get("phone"),
-                distance_km=store.get("distance_km"),
-                time_min=store.get("time_min"),
-                ships_to_cep=False,
-                has_product=store["has_product"],
-                product_match=store["product_match"]
-            ))
-        
-        # Lojas online
-        for store in online_stores:
-            results.append(StoreResult(
-                name=store["name"],
-                url=store["url"],
-                type="online",
-                ships_to_cep=store["ships_to_cep"],
-                has_product=store["has_product"],
-                product_match=store["product_match"]
-            ))
-        
-        # 6. Ordenar resultados
-        physical_results = [r for r in results if r.type == "physical"]
-        online_results = [r for r in results if r.type == "online"]
-        
-        physical_results.sort(key=lambda x: x.distance_km or float('inf'))
-        
-        final_results = physical_results + online_results
-        
-        return final_results[:10]
+        store_search_service = await store_search.load()
+        return await store_search_service.search(request)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na busca: {str(e)}")
 
+@router.post("/jobs", response_model=SearchJobStatus, status_code=202)
+async def create_search_job(request: AutomotiveSearchRequest):
+    """
+    Inicia a busca de lojas em segundo plano e retorna o id do job imediatamente.
+    Buscas idênticas em andamento reaproveitam o mesmo job.
+    """
+    job = search_job_service.submit(request)
+    return job.to_dict()
+
+def _get_job(job_id: str):
+    job = search_job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=SearchJobStatus)
+async def get_search_job(job_id: str, since: int = 0):
+    """Polling: status do job e lojas encontradas até agora (a partir do índice `since`)"""
+    return _get_job(job_id).to_dict(since)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_search_job_events(job_id: str):
+    """Server-Sent Events: um evento 'store' por loja encontrada e, no fim, 'done' ou 'error'"""
+    job = _get_job(job_id)
+    
+    async def event_stream():
+        async for event in job.events():
+            if event["type"] == "keepalive":
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_search_job_ndjson(job_id: str):
+    """Mesmos eventos do /events, em NDJSON (um JSON por linha)"""
+    job = _get_job(job_id)
+    
+    async def ndjson_stream():
+        async for event in job.events():
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
 @router.get("/user-location")
 async def get_user_location(cep: str = None):
     """Obtém localização por CEP"""
-    location = location_service.get_coordinates_from_cep(cep) if cep else None
+    location = None
+    if cep:
+        location_service = (await store_search.load()).location_service
+        location = await location_service.get_coordinates_from_cep(cep)
     
     if location:
         return location
@@ -1,50 +1,109 @@
-from fastapi import APIRouter, HTTPException
-from models.schemas import Brand, Year, Model, Color
+import asyncio
+import hmac
+import os
+from concurrent.futures.process import BrokenProcessPool
+from operator import attrgetter
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import Response
+from models.schemas import Brand, Year, Model, Color, ColorMatch, PhotoColor, SearchHit
+from services.catalog_queries import (
+    BRANDS_QUERY, YEARS_BY_BRAND_QUERY, MODELS_BY_BRAND_YEAR_QUERY, COLORS_BY_MODEL_YEAR_QUERY,
+    catalog_queries
+)
+from services.catalog_service import catalog_service, COLOR_FIELDS
+from services.color_match_service import color_match_service, parse_rgb, rgb_to_lab, METRICS
+from services.database_service import database_service
+from services.http_cache import EncodedPayload, cached_response, rows_to_json
+from services.photo_color_service import photo_color_service, PhotoBusy, PhotoError
+from services.search_service import search_service, KINDS
 
 router = APIRouter(prefix="/api", tags=["Colors"])
 
+# Campos de cada schema, na ordem das colunas das consultas
+BRAND_FIELDS = ("id_montadora", "nome")
+YEAR_FIELDS = ("id_ano", "ano")
+MODEL_FIELDS = ("id_modelo", "nome", "id_montadora")
+COLOR_ROW_FIELDS = ("id_cor", "nome_cor", "codigo_cor", "rgb")
+
+# Token exigido no POST /catalog/refresh (cabeçalho X-Admin-Token); sem ele, a rota fica desligada
+CATALOG_ADMIN_TOKEN = os.getenv("CATALOG_ADMIN_TOKEN")
+
+def _snapshot_list(request: Request, snapshot, cache_key: Tuple, items: Sequence,
+                   fields: Tuple[str, ...]) -> Response:
+    """Lista do snapshot serializada em bytes uma vez por versão do catálogo
+
+    Mesmo formato do response_model, mas sem montar e validar um modelo Pydantic por item
+    a cada requisição (quem recebe um Response pronto pula a validação do FastAPI).
+    """
+    payload = snapshot.response_cache.get(cache_key)
+    if payload is None:
+        getter = attrgetter(*fields)
+        body = rows_to_json((getter(item) for item in items), fields)
+        etag = ".".join(str(part) for part in (snapshot.version, *cache_key))
+        payload = snapshot.response_cache[cache_key] = EncodedPayload(body, etag)
+    return cached_response(request, payload)
+
+def _rows_response(rows, fields: Tuple[str, ...]) -> Response:
+    """Linhas do banco direto para JSON (caminho sem snapshot)"""
+    return Response(content=rows_to_json(rows, fields), media_type="application/json")
+
+async def _require_snapshot():
+    """Snapshot do catálogo; tenta carregar se ainda não existe, senão 503"""
+    snapshot = catalog_service.snapshot
+    if snapshot is None and await catalog_service.refresh():
+        snapshot = catalog_service.snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Catálogo indisponível no momento")
+    return snapshot
+
+async def _require_search_index():
+    snapshot = await _require_snapshot()
+    if not search_service.is_ready(snapshot):
+        await search_service.update(snapshot)
+    return snapshot
+
 @router.get("/brands", response_model=list[Brand])
-async def get_brands():
+async def get_brands(request: Request):
     """Retorna todas as montadoras - CONSULTA"""
     try:
-        from services.database_service import database_service
-        result = await database_service.fetch_all(
-            "SELECT id_montadora, nome FROM montadora ORDER BY nome"
-        )
+        # Catálogo em memória; o banco só é consultado se o snapshot não carregou
+        snapshot = catalog_service.snapshot
+        if snapshot is not None:
+            return _snapshot_list(request, snapshot, ("brands",), snapshot.brands, BRAND_FIELDS)
         
-        brands = [
-            Brand(id_montadora=row[0], nome=row[1]) 
-            for row in result
-        ]
+        result = await database_service.fetch_all(BRANDS_QUERY)
         
-        return brands
+        return _rows_response(result, BRAND_FIELDS)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar montadoras: {str(e)}")
 
+@router.get("/brands/search", response_model=list[Brand])
+async def search_brands(q: str, limit: int = Query(10, ge=1, le=50)):
+    """Busca montadoras por nome (sem acento, por prefixo e tolerante a erros)"""
+    await _require_search_index()
+    hits = search_service.search(q, limit, kinds={"brand"})
+    return [hit["data"] for hit in hits]
+
 @router.get("/brands/{brand_id}/years", response_model=list[Year])
-async def get_years_by_brand(brand_id: int):
+async def get_years_by_brand(request: Request, brand_id: int):
     """Retorna anos disponíveis para uma montadora - CONSULTA"""
     try:
-        from services.database_service import database_service
-        result = await database_service.fetch_all('''
-            SELECT DISTINCT a.id_ano, a.ano
-            FROM modelo_ano_cor mac
-            JOIN modelo m ON mac.id_modelo = m.id_modelo
-            JOIN ano a ON mac.id_ano = a.id_ano
-            WHERE m.id_montadora = $1
-            ORDER BY a.ano DESC
-        ''', {"1": brand_id})
+        snapshot = catalog_service.snapshot
+        if snapshot is not None:
+            years = snapshot.get_years(brand_id)
+            if years:
+                return _snapshot_list(request, snapshot, ("years", brand_id), years, YEAR_FIELDS)
+        else:
+            result = await catalog_queries.fetch_all(
+                YEARS_BY_BRAND_QUERY, {"1": brand_id})
+            if result:
+                return _rows_response(result, YEAR_FIELDS)
         
-        years = [
-            Year(id_ano=row[0], ano=row[1]) 
-            for row in result
-        ]
-        
-        if not years:
-            raise HTTPException(status_code=404, detail="Nenhum ano encontrado para esta montadora")
-        
-        return years
+        raise HTTPException(status_code=404, detail="Nenhum ano encontrado para esta montadora")
         
     except HTTPException:
         raise
@@ -52,27 +111,22 @@ async def get_years_by_brand(brand_id: int):
         raise HTTPException(status_code=500, detail=f"Erro ao buscar anos: {str(e)}")
 
 @router.get("/brands/{brand_id}/years/{year_id}/models", response_model=list[Model])
-async def get_models_by_brand_and_year(brand_id: int, year_id: int):
+async def get_models_by_brand_and_year(request: Request, brand_id: int, year_id: int):
     """Retorna modelos disponíveis para montadora e ano - CONSULTA"""
     try:
-        from services.database_service import database_service
-        result = await database_service.fetch_all('''
-            SELECT DISTINCT m.id_modelo, m.nome, m.id_montadora
-            FROM modelo_ano_cor mac
-            JOIN modelo m ON mac.id_modelo = m.id_modelo
-            WHERE m.id_montadora = $1 AND mac.id_ano = $2
-            ORDER BY m.nome
-        ''', {"1": brand_id, "2": year_id})
-        
-        models = [
-            Model(id_modelo=row[0], nome=row[1], id_montadora=row[2])
-            for row in result
-        ]
+        snapshot = catalog_service.snapshot
+        if snapshot is not None:
+            models = snapshot.get_models(brand_id, year_id)
+            if models:
+                cache_key = ("models", brand_id, year_id)
+                return _snapshot_list(request, snapshot, cache_key, models, MODEL_FIELDS)
+        else:
+            result = await catalog_queries.fetch_all(
+                MODELS_BY_BRAND_YEAR_QUERY, {"1": brand_id, "2": year_id})
+            if result:
+                return _rows_response(result, MODEL_FIELDS)
         
-        if not models:
-            raise HTTPException(status_code=404, detail="Nenhum modelo encontrado para esta combinação")
-        
-        return models
+        raise HTTPException(status_code=404, detail="Nenhum modelo encontrado para esta combinação")
         
     except HTTPException:
         raise
@@ -80,29 +134,238 @@ async def get_models_by_brand_and_year(brand_id: int, year_id: int):
         raise HTTPException(status_code=500, detail=f"Erro ao buscar modelos: {str(e)}")
 
 @router.get("/models/{model_id}/years/{year_id}/colors", response_model=list[Color])
-async def get_colors_by_model_and_year(model_id: int, year_id: int):
+async def get_colors_by_model_and_year(request: Request, model_id: int, year_id: int):
     """Retorna cores disponíveis para modelo e ano - CONSULTA"""
     try:
-        from services.database_service import database_service
-        result = await database_service.fetch_all('''
-            SELECT c.id_cor, c.nome_cor, c.codigo_cor, c.rgb
-            FROM modelo_ano_cor mac
-            JOIN cor c ON mac.id_cor = c.id_cor
-            WHERE mac.id_modelo = $1 AND mac.id_ano = $2
-            ORDER BY c.nome_cor
-        ''', {"1": model_id, "2": year_id})
-        
-        colors = [
-            Color(id_cor=row[0], nome_cor=row[1], codigo_cor=row[2], rgb=row[3])
-            for row in result
-        ]
-        
-        if not colors:
-            raise HTTPException(status_code=404, detail="Nenhuma cor encontrada para este modelo/ano")
+        snapshot = catalog_service.snapshot
+        if snapshot is not None:
+            colors = snapshot.get_colors(model_id, year_id)
+            if colors:
+                # A montadora na chave deixa a resposta sobreviver a mudanças em outras montadoras
+                brand_id = snapshot.models[model_id].id_montadora
+                cache_key = ("colors", brand_id, model_id, year_id)
+                return _snapshot_list(request, snapshot, cache_key, colors, COLOR_ROW_FIELDS)
+        else:
+            result = await catalog_queries.fetch_all(
+                COLORS_BY_MODEL_YEAR_QUERY, {"1": model_id, "2": year_id})
+            if result:
+                return _rows_response(result, COLOR_ROW_FIELDS)
         
-        return colors
+        raise HTTPException(status_code=404, detail="Nenhuma cor encontrada para este modelo/ano")
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar cores: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar cores: {str(e)}")
+
+@router.get("/catalog/tree")
+async def get_catalog_tree(request: Request, brand_id: Optional[int] = None, fields: Optional[str] = None):
+    """Retorna a árvore montadora → ano → modelo → cores em uma única chamada
+    
+    - brand_id: restringe a uma montadora (sem ele, o catálogo inteiro)
+    - fields: campos das cores, separados por vírgula (nome_cor, codigo_cor, rgb)
+    
+    A versão do catálogo vai no ETag, não no corpo.
+    """
+    if fields:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        invalid = requested - set(COLOR_FIELDS)
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(sorted(invalid))}")
+        color_fields = tuple(field for field in COLOR_FIELDS if field in requested)
+    else:
+        color_fields = COLOR_FIELDS
+    
+    snapshot = await _require_snapshot()
+    
+    # Árvore serializada e comprimida uma vez por versão do catálogo
+    cache_key = ("tree", brand_id, color_fields)
+    payload = snapshot.response_cache.get(cache_key)
+    if payload is None:
+        def build():
+            tree = snapshot.build_tree(brand_id, color_fields)
+            if tree is None:
+                return None
+            etag = f"{snapshot.version}.{brand_id or 'all'}.{'.'.join(color_fields)}"
+            return EncodedPayload.from_data(tree, etag)
+        
+        payload = await asyncio.to_thread(build)
+        if payload is None:
+            raise HTTPException(status_code=404, detail="Montadora não encontrada")
+        snapshot.response_cache[cache_key] = payload
+    
+    return cached_response(request, payload)
+
+@router.get("/search", response_model=list[SearchHit])
+async def search_catalog(q: str, limit: int = Query(10, ge=1, le=50), types: Optional[str] = None):
+    """Busca unificada em montadoras, modelos, cores e códigos de tinta
+    
+    - types: restringe os tipos, separados por vírgula (brand, model, color)
+    """
+    kinds = None
+    if types:
+        kinds = {kind.strip() for kind in types.split(",") if kind.strip()}
+        invalid = kinds - set(KINDS)
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Tipos inválidos: {', '.join(sorted(invalid))}")
+    
+    await _require_search_index()
+    return search_service.search(q, limit, kinds=kinds)
+
+@router.get("/colors/search", response_model=list[Color])
+async def search_colors(
+    q: Optional[str] = None,
+    id_montadora: Optional[int] = None,
+    id_modelo: Optional[int] = None,
+    id_ano: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Busca cores por nome ou código, opcionalmente filtrando por montadora, modelo e ano"""
+    snapshot = await _require_search_index()
+    
+    allowed = None
+    if id_modelo is not None:
+        if id_ano is not None:
+            allowed = {color.id_cor for color in snapshot.get_colors(id_modelo, id_ano)}
+        else:
+            allowed = snapshot.color_ids_by_model.get(id_modelo, set())
+    if id_montadora is not None or (id_ano is not None and id_modelo is None):
+        by_brand_year = snapshot.get_color_ids(id_montadora, id_ano)
+        allowed = by_brand_year if allowed is None else allowed & by_brand_year
+    
+    if not q or not q.strip():
+        if allowed is None:
+            raise HTTPException(status_code=400, detail="Informe q ou algum filtro")
+        colors = [snapshot.colors[id_cor] for id_cor in allowed]
+        colors.sort(key=lambda c: c.nome_cor or "")
+        return colors[:limit]
+    
+    accept = None if allowed is None else (lambda doc: doc.id in allowed)
+    hits = search_service.search(q, limit, kinds={"color"}, accept=accept)
+    return [hit["data"] for hit in hits]
+
+@router.get("/colors/nearest", response_model=list[ColorMatch])
+async def get_nearest_colors(
+    rgb: Optional[str] = None,
+    lab: Optional[str] = None,
+    k: int = Query(5, ge=1, le=50),
+    metric: str = "ciede2000",
+    brand_id: Optional[int] = None,
+    year_id: Optional[int] = None
+):
+    """Retorna as k cores de fábrica mais próximas de uma cor medida
+    
+    - rgb: '#RRGGBB', 'RRGGBB' ou 'r,g,b'
+    - lab: 'L,a,b' (alternativa ao rgb)
+    - metric: ciede2000 (padrão) ou cie76
+    - brand_id / year_id: restringe às cores usadas pela montadora/ano
+    """
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Métrica inválida: use {' ou '.join(METRICS)}")
+    
+    if lab:
+        try:
+            target = np.array([float(v) for v in lab.split(",")], dtype=np.float64)
+        except ValueError:
+            target = None
+        # nan/inf passam pelo float() e derrubariam a busca no índice
+        if target is None or target.shape != (3,) or not np.isfinite(target).all():
+            raise HTTPException(status_code=400, detail="Lab inválido: use 'L,a,b'")
+        target[0] = np.clip(target[0], 0.0, 100.0)
+    elif rgb:
+        parsed = parse_rgb(rgb)
+        if parsed is None:
+            raise HTTPException(status_code=400, detail="RGB inválido: use '#RRGGBB' ou 'r,g,b'")
+        target = rgb_to_lab(np.array([parsed]))[0]
+    else:
+        raise HTTPException(status_code=400, detail="Informe rgb ou lab")
+    
+    snapshot = await _require_snapshot()
+    
+    # A primeira consulta de cada versão monta o índice fora do event loop
+    if not color_match_service.is_ready(snapshot):
+        await asyncio.to_thread(color_match_service.get_index, snapshot)
+    
+    return color_match_service.nearest(snapshot, target, k, metric, brand_id, year_id)
+
+@router.post("/colors/from-photo", response_model=list[PhotoColor])
+async def match_photo_colors(
+    request: Request,
+    k: int = Query(3, ge=1, le=8),
+    matches: int = Query(5, ge=1, le=20),
+    crop: float = Query(0.8, gt=0, le=1),
+    metric: str = "ciede2000",
+    brand_id: Optional[int] = None,
+    model_id: Optional[int] = None,
+    year_id: Optional[int] = None
+):
+    """Cores de fábrica mais próximas das cores dominantes de uma foto do carro
+    
+    O corpo é a própria imagem (Content-Type image/jpeg, image/png...), sem multipart.
+    - k: quantas cores dominantes extrair (reflexos e sombras são descartados)
+    - matches: cores de fábrica por cor dominante
+    - crop: fração central da foto considerada (o carro costuma estar no meio)
+    - brand_id / model_id / year_id: restringe às cores usadas pela montadora/modelo/ano
+    """
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Métrica inválida: use {' ou '.join(METRICS)}")
+    if not photo_color_service.available:
+        raise HTTPException(status_code=503, detail="Leitura de fotos indisponível (Pillow não instalado)")
+    
+    # Lê o corpo com limite, sem esperar o upload inteiro de algo grande demais
+    max_bytes = photo_color_service.max_bytes
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Foto acima de {max_bytes // (1024 * 1024)} MB")
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Foto acima de {max_bytes // (1024 * 1024)} MB")
+        chunks.append(chunk)
+    if not size:
+        raise HTTPException(status_code=400, detail="Envie a imagem no corpo da requisição")
+    
+    snapshot = await _require_snapshot()
+    
+    try:
+        extracted = await photo_color_service.dominant_colors(b"".join(chunks), k, crop)
+    except PhotoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (PhotoBusy, BrokenProcessPool):
+        raise HTTPException(status_code=503, detail="Muitas fotos em processamento, tente novamente",
+                            headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="A foto demorou demais para ser processada")
+    
+    if not color_match_service.is_ready(snapshot):
+        await asyncio.to_thread(color_match_service.get_index, snapshot)
+    
+    return [
+        {
+            **color,
+            "matches": color_match_service.nearest(
+                snapshot, np.array(color["lab"]), matches, metric, brand_id, year_id, model_id
+            ),
+        }
+        for color in extracted["colors"]
+    ]
+
+@router.post("/catalog/refresh")
+async def refresh_catalog(x_admin_token: Optional[str] = Header(None)):
+    """Recarrega o catálogo em memória a partir do banco (exige o token de administração)"""
+    if not CATALOG_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Recarga manual desativada (CATALOG_ADMIN_TOKEN)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), CATALOG_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de administração inválido")
+    
+    if not await catalog_service.refresh(force=True):
+        raise HTTPException(status_code=503, detail="Não foi possível recarregar o catálogo")
+    
+    snapshot = catalog_service.snapshot
+    return {
+        "status": "ok",
+        "brands_count": len(snapshot.brands),
+        "loaded_at": snapshot.loaded_at
+    }
\ No newline at end of file
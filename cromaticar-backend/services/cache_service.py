@@ -0,0 +1,181 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from services.metrics_service import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_key_part(value: Optional[str]) -> str:
+    """Normaliza um termo de busca: minúsculas, sem acentos e espaços repetidos"""
+    if not value:
+        return ""
+    folded = unicodedata.normalize("NFKD", value)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return " ".join(folded.lower().split())
+
+
+def make_key(*parts: Optional[str]) -> str:
+    """Monta a chave de cache a partir dos termos normalizados"""
+    return "|".join(normalize_key_part(part) for part in parts)
+
+
+class SQLiteCacheBackend:
+    """Armazenamento em disco (SQLite) para o cache sobreviver a reinícios"""
+
+    def __init__(self, path: str, namespace: str, max_entries: int):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Vários workers podem abrir o mesmo arquivo; o WAL deixa leitores e um escritor em paralelo
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                )
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), expires_at, time.time())
+            )
+            self._writes += 1
+            # Limpeza periódica: remove expirados e aplica o limite (LRU por acesso)
+            if self._writes % 100 == 0:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        self._conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, time.time())
+        )
+        self._conn.execute('''
+            DELETE FROM cache_entries WHERE namespace = ? AND key NOT IN (
+                SELECT key FROM cache_entries WHERE namespace = ?
+                ORDER BY accessed_at DESC LIMIT ?
+            )
+        ''', (self.namespace, self.namespace, self.max_entries))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+
+class TTLCache:
+    """Cache LRU em memória com TTL e, opcionalmente, persistência em SQLite"""
+
+    def __init__(self, namespace: str, ttl: float, max_entries: int = 1000,
+                 disk_path: Optional[str] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._disk = None
+        if disk_path:
+            try:
+                self._disk = SQLiteCacheBackend(disk_path, namespace, max_entries * 10)
+            except sqlite3.Error as e:
+                logger.error(f"Cache em disco indisponível ({disk_path}): {e}")
+
+        self.hits = 0
+        self.misses = 0
+
+    def _get_memory(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Retorna uma cópia do valor em cache, ou None se ausente/expirado"""
+        value = self._get_memory(key)
+        if value is None and self._disk is not None:
+            try:
+                stored = await asyncio.to_thread(self._disk.get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao ler cache em disco ({self.namespace}): {e}")
+                stored = None
+            if stored is not None:
+                value, expires_at = stored
+                self._set_memory(key, value, expires_at)
+
+        if value is None:
+            self.misses += 1
+            CACHE_REQUESTS.inc(self.namespace, "miss")
+            return None
+        self.hits += 1
+        CACHE_REQUESTS.inc(self.namespace, "hit")
+        return copy.deepcopy(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Grava uma cópia do valor (precisa ser serializável em JSON para o disco)"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        value = copy.deepcopy(value)
+        self._set_memory(key, value, expires_at)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, value, expires_at)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Falha ao gravar cache em disco ({self.namespace}): {e}")
+
+    async def clear(self):
+        self._entries.clear()
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.clear)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Optional, Set
+
+from migrations.runner import connect as migrations_connect, try_refresh_views
+from services.catalog_queries import catalog_queries
+
+logger = logging.getLogger(__name__)
+
+# Canal usado pelos triggers de migrations/sql/0003_catalog_change_feed.sql
+CHANNEL = "catalog_changes"
+TABLES = ("montadora", "ano", "modelo", "cor", "modelo_ano_cor")
+
+
+class CatalogChangeFeed:
+    """Escuta (LISTEN) as mudanças do catálogo numa conexão dedicada por worker
+
+    Os avisos chegam com a tabela e a montadora afetada; são agrupados por uma janela curta e
+    aplicados no CatalogService de uma vez. Se a conexão cai, reconecta com backoff e faz uma
+    recarga completa, porque avisos enviados enquanto estava fora se perderam.
+    """
+
+    def __init__(self, catalog_service, db_config):
+        self.catalog_service = catalog_service
+        self.db_config = db_config
+        self.enabled = os.getenv("CATALOG_CHANGE_FEED", "true").lower() == "true"
+        # Janela para juntar os avisos de uma mesma carga numa só atualização
+        self.debounce = float(os.getenv("CATALOG_CHANGE_DEBOUNCE_SECONDS", "0.2"))
+        self.heartbeat = float(os.getenv("CATALOG_CHANGE_HEARTBEAT_SECONDS", "15"))
+        self.max_backoff = float(os.getenv("CATALOG_CHANGE_MAX_BACKOFF_SECONDS", "60"))
+        # As views materializadas do fallback pelo banco também acompanham as mudanças
+        self.refresh_views = os.getenv("CATALOG_CHANGE_REFRESH_VIEWS", "true").lower() == "true"
+        self.view_refreshes = 0
+        self.connected = False
+        self.events = 0
+        self.reconnects = 0
+        self.last_event_at: Optional[float] = None
+        self._pending: Dict[str, Optional[Set[int]]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            url = self.db_config.get_listen_url()
+        except ValueError:
+            # DATABASE_URL não configurada: o resto da API já avisa no startup
+            return
+        if url is None:
+            logger.warning("Feed de mudanças do catálogo desativado: defina CATALOG_LISTEN_URL "
+                           "(conexão direta) para usar LISTEN atrás de um pooler em modo transação")
+            return
+        self._task = asyncio.create_task(self._run(url))
+
+    async def stop(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "connected": self.connected,
+            "events": self.events,
+            "reconnects": self.reconnects,
+            "last_event_at": self.last_event_at,
+            "view_refreshes": self.view_refreshes,
+        }
+
+    def _on_notification(self, connection, pid, channel, payload):
+        """Callback do asyncpg (síncrono): só acumula o aviso e agenda a aplicação"""
+        try:
+            change = json.loads(payload)
+            table = change["table"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Aviso de mudança inválido: {payload!r}")
+            return
+        if table not in TABLES:
+            return
+
+        self.events += 1
+        self.last_event_at = time.time()
+        brand = change.get("brand")
+        if brand is None:
+            self._pending[table] = None
+        elif self._pending.get(table, ()) is not None:
+            self._pending.setdefault(table, set()).add(int(brand))
+
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.debounce, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        task = asyncio.create_task(self._flush())
+        # Referência forte até terminar (o event loop guarda só referências fracas)
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self):
+        changes, self._pending = self._pending, {}
+        if changes:
+            started = time.perf_counter()
+            await self.catalog_service.apply_changes(changes)
+            logger.info(f"🔔 Mudanças no catálogo aplicadas ({', '.join(sorted(changes))}) "
+                        f"em {time.perf_counter() - started:.2f}s")
+            await self._refresh_views()
+
+    async def _refresh_views(self):
+        """REFRESH das views do catálogo (se existem); só um worker por vez atualiza"""
+        if not self.refresh_views or not await catalog_queries.views_available():
+            return
+        try:
+            async with migrations_connect() as conn:
+                timings = await try_refresh_views(conn)
+        except Exception as e:
+            logger.warning(f"Não foi possível atualizar as views do catálogo: {e}")
+            return
+        if timings is not None:
+            self.view_refreshes += 1
+            logger.info(f"🔄 Views do catálogo atualizadas em {sum(timings.values()):.2f}s")
+
+    async def _connect(self, url: str):
+        import asyncpg
+
+        return await asyncpg.connect(url, ssl=self.db_config.get_ssl_context(), statement_cache_size=0)
+
+    async def _run(self, url: str):
+        backoff = 1.0
+        attempts = 0
+        while True:
+            connection = None
+            try:
+                connection = await self._connect(url)
+                await connection.add_listener(CHANNEL, self._on_notification)
+                self.connected = True
+                backoff = 1.0
+                logger.info(f"👂 Escutando mudanças do catálogo ({CHANNEL})")
+
+                # Avisos enviados enquanto estávamos desconectados se perderam
+                if attempts or self.catalog_service.snapshot is None:
+                    await self.catalog_service.refresh(force=True)
+                    await self._refresh_views()
+
+                # A queda da conexão só aparece quando algo é enviado por ela
+                while True:
+                    await asyncio.sleep(self.heartbeat)
+                    await connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.connected:
+                    self.reconnects += 1
+                logger.warning(f"Feed de mudanças do catálogo desconectado: {e}")
+            finally:
+                self.connected = False
+                if connection is not None:
+                    try:
+                        await asyncio.wait_for(connection.close(), timeout=5)
+                    except Exception:
+                        connection.terminate()
+
+            attempts += 1
+            # Backoff exponencial com jitter para N workers não reconectarem juntos
+            await asyncio.sleep(random.uniform(0, backoff))
+            backoff = min(backoff * 2, self.max_backoff)
+
+
+# Instância global
+from config.database import db_config
+from services.catalog_service import catalog_service
+catalog_change_feed = CatalogChangeFeed(catalog_service, db_config)
@@ -0,0 +1,424 @@
+"""Carga em massa do catálogo a partir de CSV ou Parquet (uma linha por modelo/ano/cor)
+
+    python -m services.catalog_ingest carga-2025.csv
+    python -m services.catalog_ingest carga-2025.parquet --batch-size 100000 --dry-run
+
+Colunas (os nomes mais comuns são reconhecidos): montadora, modelo, ano, nome_cor, codigo_cor, rgb.
+Montadora, modelo, ano e cor são resolvidos pelo nome/código para os ids existentes; os que não
+existem ganham id novo. Códigos de tinta se repetem entre montadoras, então a cor é procurada só
+entre as da mesma montadora; nome/rgb de cores existentes só mudam com --update-colors. As linhas
+vão por COPY para tabelas de staging e entram no catálogo com INSERT/UPDATE em lote, tudo numa
+transação só (--dry-run desfaz no fim). As views materializadas são atualizadas pelos workers da
+API ao receberem os avisos da carga (feed de mudanças).
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# pyarrow é opcional; sem ele só CSV
+try:
+    import pyarrow.parquet as parquet
+except ModuleNotFoundError:
+    parquet = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = {
+    "brand": ("montadora", "marca", "brand", "make"),
+    "model": ("modelo", "model"),
+    "year": ("ano", "year", "ano_modelo"),
+    "color": ("nome_cor", "cor", "color", "color_name"),
+    "code": ("codigo_cor", "codigo", "paint_code", "color_code"),
+    "rgb": ("rgb", "hex", "cor_hex"),
+}
+
+# Tabela → coluna de id (para gerar ids novos e acertar a sequence no fim)
+ID_COLUMNS = {"montadora": "id_montadora", "ano": "id_ano", "modelo": "id_modelo", "cor": "id_cor"}
+
+# Colunas carregadas de cada dimensão (as demais ficam com o default da tabela)
+DIMENSION_COLUMNS = {
+    "montadora": "id_montadora, nome",
+    "ano": "id_ano, ano",
+    "modelo": "id_modelo, nome, id_montadora",
+    "cor": "id_cor, nome_cor, codigo_cor, rgb",
+}
+
+# Tabelas temporárias da carga (somem no fim da transação)
+STAGING = [
+    "CREATE TEMP TABLE stage_montadora (id_montadora INTEGER, nome TEXT) ON COMMIT DROP",
+    "CREATE TEMP TABLE stage_ano (id_ano INTEGER, ano INTEGER) ON COMMIT DROP",
+    "CREATE TEMP TABLE stage_modelo (id_modelo INTEGER, nome TEXT, id_montadora INTEGER) ON COMMIT DROP",
+    "CREATE TEMP TABLE stage_cor (id_cor INTEGER, nome_cor TEXT, codigo_cor TEXT, rgb TEXT) ON COMMIT DROP",
+    "CREATE TEMP TABLE stage_cor_update (id_cor INTEGER, nome_cor TEXT, rgb TEXT) ON COMMIT DROP",
+    "CREATE TEMP TABLE stage_links (id_modelo INTEGER, id_ano INTEGER, id_cor INTEGER) ON COMMIT DROP",
+]
+
+
+def _key(value: str) -> str:
+    """Chave natural: sem espaços extras e sem diferença de caixa"""
+    return " ".join(value.split()).casefold()
+
+
+def _column_map(fieldnames: List[str]) -> Dict[str, str]:
+    normalized = {name.strip().lower(): name for name in fieldnames if name}
+    columns = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[field] = normalized[alias]
+                break
+    missing = {"brand", "model", "year"} - columns.keys()
+    if missing or not {"color", "code"} & columns.keys():
+        raise ValueError(f"Colunas obrigatórias ausentes: montadora, modelo, ano e nome_cor/codigo_cor "
+                         f"(encontradas: {', '.join(fieldnames)})")
+    return columns
+
+
+def read_csv(path: str, batch_size: int, delimiter: Optional[str] = None) -> Iterator[List[Dict]]:
+    """Lotes de linhas do CSV (o arquivo é lido aos poucos, nunca inteiro na memória)"""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        if delimiter is None:
+            sample = file.read(64 * 1024)
+            file.seek(0)
+            delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+        reader = csv.DictReader(file, delimiter=delimiter)
+        columns = _column_map(reader.fieldnames or [])
+        batch = []
+        for row in reader:
+            batch.append({field: row.get(column) for field, column in columns.items()})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def read_parquet(path: str, batch_size: int) -> Iterator[List[Dict]]:
+    if parquet is None:
+        raise RuntimeError("Leitura de Parquet requer pyarrow: python -m pip install pyarrow")
+    file = parquet.ParquetFile(path)
+    columns = _column_map(file.schema_arrow.names)
+    names = {column: field for field, column in columns.items()}
+    for record_batch in file.iter_batches(batch_size=batch_size, columns=list(columns.values())):
+        yield [
+            {names[column]: value for column, value in row.items()}
+            for row in record_batch.to_pylist()
+        ]
+
+
+class CatalogMaps:
+    """Chaves naturais → ids do catálogo, em memória; registra o que precisa ser inserido
+
+    update_colors: cor existente com nome/rgb diferentes na carga é atualizada (senão, mantida).
+    """
+
+    def __init__(self, update_colors: bool = False):
+        self.update_colors = update_colors
+        self.brands: Dict[str, int] = {}
+        self.years: Dict[int, int] = {}
+        self.models: Dict[Tuple[int, str], int] = {}
+        # (montadora, chave da cor) → id: o mesmo código de tinta é outra cor em outra montadora
+        self.colors: Dict[Tuple[int, str], int] = {}
+        self.color_data: Dict[int, Tuple[str, Optional[str]]] = {}
+        self.model_brand: Dict[int, int] = {}
+        self.next_ids: Dict[str, int] = {}
+        self.new: Dict[str, List[Tuple]] = {table: [] for table in ID_COLUMNS}
+        self.color_updates: Dict[int, Tuple] = {}
+        self.inserted = {table: 0 for table in ID_COLUMNS}
+
+    @staticmethod
+    def color_key(name: Optional[str], code: Optional[str]) -> str:
+        # Código de tinta identifica a cor; sem código, vale o nome
+        return "code:" + _key(code) if code and code.strip() else "name:" + _key(name or "")
+
+    async def load(self, conn):
+        for row in await conn.fetch("SELECT id_montadora, nome FROM montadora"):
+            self.brands[_key(row["nome"])] = row["id_montadora"]
+        for row in await conn.fetch("SELECT id_ano, ano FROM ano"):
+            self.years[row["ano"]] = row["id_ano"]
+        for row in await conn.fetch("SELECT id_modelo, nome, id_montadora FROM modelo"):
+            self.models[(row["id_montadora"], _key(row["nome"]))] = row["id_modelo"]
+            self.model_brand[row["id_modelo"]] = row["id_montadora"]
+        color_keys = {}
+        for row in await conn.fetch("SELECT id_cor, nome_cor, codigo_cor, rgb FROM cor"):
+            color_keys[row["id_cor"]] = self.color_key(row["nome_cor"], row["codigo_cor"])
+            self.color_data[row["id_cor"]] = (row["nome_cor"], row["rgb"])
+        # Montadoras de cada cor, pelos vínculos (cor sem vínculo não é reaproveitada)
+        for row in await conn.fetch('''
+            SELECT DISTINCT m.id_montadora, mac.id_cor
+            FROM modelo_ano_cor mac
+            JOIN modelo m ON mac.id_modelo = m.id_modelo
+            ORDER BY mac.id_cor
+        '''):
+            self.colors.setdefault((row["id_montadora"], color_keys[row["id_cor"]]), row["id_cor"])
+        for table, column in ID_COLUMNS.items():
+            self.next_ids[table] = (await conn.fetchval(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")) + 1
+
+    def _new_id(self, table: str) -> int:
+        new_id = self.next_ids[table]
+        self.next_ids[table] += 1
+        return new_id
+
+    def resolve(self, row: Dict) -> Tuple[int, int, int]:
+        """(id_modelo, id_ano, id_cor) de uma linha; ValueError se a linha é inválida"""
+        brand_name = (row.get("brand") or "").strip()
+        model_name = (row.get("model") or "").strip()
+        color_name = (row.get("color") or "").strip() or None
+        code = (row.get("code") or "").strip() or None
+        rgb = (row.get("rgb") or "").strip() or None
+        if not brand_name or not model_name or not (color_name or code):
+            raise ValueError("montadora, modelo e cor são obrigatórios")
+        try:
+            year = int(str(row.get("year")).strip())
+        except ValueError:
+            raise ValueError(f"ano inválido: {row.get('year')!r}")
+        if rgb and not rgb.startswith("#"):
+            rgb = f"#{rgb}"
+        # Valida a linha inteira antes de criar ids: uma linha recusada não pode deixar
+        # montadora/ano/modelo novos em self.new (viram linhas órfãs no banco)
+        key = self.color_key(color_name, code)
+        brand_id = self.brands.get(_key(brand_name))
+        color_id = self.colors.get((brand_id, key)) if brand_id is not None else None
+        if color_id is None and not rgb:
+            raise ValueError(f"cor nova sem rgb: {color_name or code}")
+
+        if brand_id is None:
+            brand_id = self.brands[_key(brand_name)] = self._new_id("montadora")
+            self.new["montadora"].append((brand_id, brand_name))
+
+        year_id = self.years.get(year)
+        if year_id is None:
+            year_id = self.years[year] = self._new_id("ano")
+            self.new["ano"].append((year_id, year))
+
+        model_id = self.models.get((brand_id, _key(model_name)))
+        if model_id is None:
+            model_id = self.models[(brand_id, _key(model_name))] = self._new_id("modelo")
+            self.model_brand[model_id] = brand_id
+            self.new["modelo"].append((model_id, model_name, brand_id))
+
+        if color_id is None:
+            color_id = self.colors[(brand_id, key)] = self._new_id("cor")
+            self.color_data[color_id] = (color_name or code, rgb)
+            self.new["cor"].append((color_id, color_name or code, code, rgb))
+        elif self.update_colors:
+            # Cor existente com nome/rgb diferentes na carga: atualiza (só com --update-colors)
+            current_name, current_rgb = self.color_data[color_id]
+            name, new_rgb = color_name or current_name, rgb or current_rgb
+            if (name, new_rgb) != (current_name, current_rgb):
+                self.color_data[color_id] = (name, new_rgb)
+                self.color_updates[color_id] = (color_id, name, new_rgb)
+
+        return model_id, year_id, color_id
+
+    def take_new(self) -> Tuple[Dict[str, List[Tuple]], List[Tuple]]:
+        """Linhas novas e cores alteradas desde a última chamada"""
+        new, self.new = self.new, {table: [] for table in ID_COLUMNS}
+        updates, self.color_updates = list(self.color_updates.values()), {}
+        for table, rows in new.items():
+            self.inserted[table] += len(rows)
+        return new, updates
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.rejected = 0
+        self.errors: List[str] = []
+        self.links_inserted = 0
+        self.colors_updated = 0
+        self.inserted: Dict[str, int] = {}
+        # Montadoras com vínculos na carga (avisadas ao feed de mudanças no fim)
+        self.brands: Set[int] = set()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def reject(self, line: int, error: str):
+        self.rejected += 1
+        if len(self.errors) < 10:
+            self.errors.append(f"linha {line}: {error}")
+
+
+async def _copy_upsert(conn, new: Dict[str, List[Tuple]], color_updates: List[Tuple],
+                       links: Set[Tuple[int, int, int]]) -> Tuple[int, int]:
+    """COPY para staging e INSERT/UPDATE em lote; devolve (vínculos inseridos, cores atualizadas)"""
+    # Dimensões antes dos vínculos (chaves estrangeiras)
+    for table in ("montadora", "ano", "modelo", "cor"):
+        if new[table]:
+            await conn.copy_records_to_table(f"stage_{table}", records=new[table])
+            columns = DIMENSION_COLUMNS[table]
+            await conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM stage_{table}")
+            await conn.execute(f"TRUNCATE stage_{table}")
+
+    updated = 0
+    if color_updates:
+        await conn.copy_records_to_table("stage_cor_update", records=color_updates)
+        status = await conn.execute('''
+            UPDATE cor c SET nome_cor = s.nome_cor, rgb = s.rgb
+            FROM stage_cor_update s
+            WHERE c.id_cor = s.id_cor AND (c.nome_cor, c.rgb) IS DISTINCT FROM (s.nome_cor, s.rgb)
+        ''')
+        updated = int(status.split()[-1])
+        await conn.execute("TRUNCATE stage_cor_update")
+
+    inserted = 0
+    if links:
+        await conn.copy_records_to_table("stage_links", records=list(links))
+        # Só os vínculos que ainda não existem (usa o índice de cobertura da migração 0001)
+        status = await conn.execute('''
+            INSERT INTO modelo_ano_cor (id_modelo, id_ano, id_cor)
+            SELECT s.id_modelo, s.id_ano, s.id_cor
+            FROM stage_links s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM modelo_ano_cor mac
+                WHERE mac.id_modelo = s.id_modelo AND mac.id_ano = s.id_ano AND mac.id_cor = s.id_cor
+            )
+        ''')
+        inserted = int(status.split()[-1])
+        await conn.execute("TRUNCATE stage_links")
+    return inserted, updated
+
+
+async def _sync_sequences(conn):
+    """Ids novos foram gerados aqui: a sequence (se houver) precisa andar junto"""
+    for table, column in ID_COLUMNS.items():
+        sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, $2)", table, column)
+        if sequence:
+            await conn.execute(
+                f"SELECT setval($1, (SELECT COALESCE(MAX({column}), 1) FROM {table}))", sequence
+            )
+
+
+async def _notify_changes(conn, stats: IngestStats, maps: CatalogMaps):
+    """Um aviso por montadora afetada para o feed de mudanças (entregue no commit)"""
+    notices = [{"table": "modelo_ano_cor", "brand": brand_id} for brand_id in sorted(stats.brands)]
+    if maps.inserted["ano"]:
+        notices.append({"table": "ano", "brand": None})
+    if maps.inserted["cor"] or stats.colors_updated:
+        notices.append({"table": "cor", "brand": None})
+    for notice in notices:
+        await conn.execute("SELECT pg_notify('catalog_changes', $1)", json.dumps(notice))
+
+
+async def ingest(conn, batches: Iterator[List[Dict]], dry_run: bool = False,
+                 progress: Optional[Callable[[IngestStats], None]] = None,
+                 update_colors: bool = False) -> IngestStats:
+    """Carrega os lotes numa transação; o próximo lote é lido enquanto o atual vai para o banco"""
+    stats = IngestStats()
+    maps = CatalogMaps(update_colors)
+    next_batch: Optional[asyncio.Future] = None
+
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        # Leituras continuam livres; outras escritas no catálogo esperam a carga terminar
+        await conn.execute("LOCK TABLE montadora, ano, modelo, cor, modelo_ano_cor IN SHARE ROW EXCLUSIVE MODE")
+        await conn.execute("SET LOCAL cromaticar.bulk_load = 'on'")
+        for statement in STAGING:
+            await conn.execute(statement)
+        await maps.load(conn)
+
+        next_batch = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+        while True:
+            batch = await next_batch
+            if batch is None:
+                break
+            next_batch = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+
+            links = set()
+            for row in batch:
+                stats.rows += 1
+                try:
+                    link = maps.resolve(row)
+                except ValueError as e:
+                    stats.reject(stats.rows + 1, str(e))  # +1: cabeçalho do CSV
+                    continue
+                links.add(link)
+                stats.brands.add(maps.model_brand[link[0]])
+
+            new, color_updates = maps.take_new()
+            inserted, updated = await _copy_upsert(conn, new, color_updates, links)
+            stats.links_inserted += inserted
+            stats.colors_updated += updated
+            if progress:
+                progress(stats)
+
+        await _sync_sequences(conn)
+        await _notify_changes(conn, stats, maps)
+    except BaseException:
+        await transaction.rollback()
+        if next_batch is not None:
+            # A thread do leitor não para com cancel(): espera ela soltar o arquivo
+            await asyncio.gather(next_batch, return_exceptions=True)
+        raise
+
+    if dry_run:
+        await transaction.rollback()
+    else:
+        await transaction.commit()
+    stats.inserted = maps.inserted
+    return stats
+
+
+def _print_progress(stats: IngestStats):
+    rate = stats.rows / stats.elapsed if stats.elapsed else 0
+    print(f"⏳ {stats.rows:,} linhas lidas, {stats.links_inserted:,} vínculos novos, "
+          f"{stats.rejected:,} rejeitadas ({rate:,.0f} linhas/s)", flush=True)
+
+
+async def run(args) -> int:
+    from config.database import db_config
+
+    if args.format == "parquet" or (args.format is None and args.path.lower().endswith(".parquet")):
+        batches = read_parquet(args.path, args.batch_size)
+    else:
+        batches = read_csv(args.path, args.batch_size, args.delimiter)
+
+    try:
+        async with db_config.driver_connection() as conn:
+            stats = await ingest(conn, batches, dry_run=args.dry_run, progress=_print_progress,
+                                 update_colors=args.update_colors)
+
+            rate = stats.rows / stats.elapsed if stats.elapsed else 0
+            inserted = ", ".join(f"{count:,} {table}" for table, count in stats.inserted.items())
+            print(f"{'🧪 Simulação (desfeita)' if args.dry_run else '✅ Carga concluída'}: "
+                  f"{stats.rows:,} linhas em {stats.elapsed:.1f}s ({rate:,.0f} linhas/s)")
+            print(f"   novos: {inserted}, {stats.links_inserted:,} vínculos; "
+                  f"{stats.colors_updated:,} cores atualizadas; {stats.rejected:,} linhas rejeitadas")
+            for error in stats.errors:
+                print(f"   ⚠️  {error}")
+
+            if not args.dry_run:
+                # As views ficam com os workers (feed de mudanças), que já recebem os avisos da carga
+                await conn.execute("ANALYZE montadora, ano, modelo, cor, modelo_ano_cor")
+        return 0
+    finally:
+        await db_config.async_engine.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Carga em massa do catálogo (CSV ou Parquet)")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="padrão: pela extensão")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", "50000")))
+    parser.add_argument("--delimiter", help="separador do CSV (padrão: detectado)")
+    parser.add_argument("--dry-run", action="store_true", help="valida e desfaz no fim")
+    parser.add_argument("--update-colors", action="store_true",
+                        help="atualiza nome/rgb de cores já cadastradas que vierem diferentes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
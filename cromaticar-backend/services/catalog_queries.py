@@ -0,0 +1,121 @@
+"""Consultas de drill-down do catálogo servidas pelo banco
+
+Leem as views materializadas de migrations/sql/0002 (cada uma é um index-only scan);
+o `python -m migrations.runner explain` verifica o plano destas mesmas consultas. Num banco
+sem as migrações aplicadas, CatalogQueries usa as consultas equivalentes nas tabelas.
+"""
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BRANDS_QUERY = "SELECT id_montadora, nome FROM montadora ORDER BY nome"
+
+YEARS_BY_BRAND_QUERY = """
+    SELECT id_ano, ano
+    FROM mv_brand_years
+    WHERE id_montadora = $1
+    ORDER BY ano DESC
+"""
+
+MODELS_BY_BRAND_YEAR_QUERY = """
+    SELECT id_modelo, nome, id_montadora
+    FROM mv_brand_year_models
+    WHERE id_montadora = $1 AND id_ano = $2
+    ORDER BY nome
+"""
+
+COLORS_BY_MODEL_YEAR_QUERY = """
+    SELECT id_cor, nome_cor, codigo_cor, rgb
+    FROM mv_model_year_colors
+    WHERE id_modelo = $1 AND id_ano = $2
+    ORDER BY nome_cor
+"""
+
+# Mesmas consultas direto nas tabelas (joins), para quando as views não existem
+BASE_TABLE_QUERIES = {
+    YEARS_BY_BRAND_QUERY: """
+        SELECT DISTINCT a.id_ano, a.ano
+        FROM modelo_ano_cor mac
+        JOIN modelo m ON mac.id_modelo = m.id_modelo
+        JOIN ano a ON mac.id_ano = a.id_ano
+        WHERE m.id_montadora = $1
+        ORDER BY a.ano DESC
+    """,
+    MODELS_BY_BRAND_YEAR_QUERY: """
+        SELECT DISTINCT m.id_modelo, m.nome, m.id_montadora
+        FROM modelo_ano_cor mac
+        JOIN modelo m ON mac.id_modelo = m.id_modelo
+        WHERE m.id_montadora = $1 AND mac.id_ano = $2
+        ORDER BY m.nome
+    """,
+    COLORS_BY_MODEL_YEAR_QUERY: """
+        SELECT c.id_cor, c.nome_cor, c.codigo_cor, c.rgb
+        FROM modelo_ano_cor mac
+        JOIN cor c ON mac.id_cor = c.id_cor
+        WHERE mac.id_modelo = $1 AND mac.id_ano = $2
+        ORDER BY c.nome_cor
+    """,
+}
+
+VIEWS_EXIST_QUERY = """
+    SELECT to_regclass('mv_brand_years') IS NOT NULL
+       AND to_regclass('mv_brand_year_models') IS NOT NULL
+       AND to_regclass('mv_model_year_colors') IS NOT NULL
+"""
+
+# Endpoint → (consulta, consulta que devolve parâmetros de exemplo para o EXPLAIN)
+ENDPOINT_QUERIES = {
+    "/api/brands": (BRANDS_QUERY, None),
+    "/api/brands/{brand_id}/years": (
+        YEARS_BY_BRAND_QUERY,
+        "SELECT id_montadora FROM mv_brand_years LIMIT 1",
+    ),
+    "/api/brands/{brand_id}/years/{year_id}/models": (
+        MODELS_BY_BRAND_YEAR_QUERY,
+        "SELECT id_montadora, id_ano FROM mv_brand_year_models LIMIT 1",
+    ),
+    "/api/models/{model_id}/years/{year_id}/colors": (
+        COLORS_BY_MODEL_YEAR_QUERY,
+        "SELECT id_modelo, id_ano FROM mv_model_year_colors LIMIT 1",
+    ),
+}
+
+
+class CatalogQueries:
+    """Executa as consultas do drill-down nas views, ou nas tabelas se as views não existem"""
+
+    # Sem as views, confere de novo depois disso (alguém pode ter rodado o upgrade)
+    RECHECK_SECONDS = 300
+
+    def __init__(self, database_service):
+        self.database_service = database_service
+        self._views: Optional[bool] = None
+        self._checked_at = 0.0
+
+    async def views_available(self) -> bool:
+        if self._views is None or (not self._views and time.monotonic() - self._checked_at > self.RECHECK_SECONDS):
+            self._checked_at = time.monotonic()
+            try:
+                row = await self.database_service.fetch_one(VIEWS_EXIST_QUERY)
+            except Exception as e:
+                # Ex.: banco sem to_regclass; as tabelas sempre funcionam
+                logger.warning(f"Não foi possível verificar as views do catálogo: {e}")
+                self._views = False
+                return False
+            self._views = bool(row and row[0])
+            if not self._views:
+                logger.warning("Views do catálogo ausentes: consultando as tabelas "
+                               "(rode python -m migrations.runner upgrade)")
+        return self._views
+
+    async def fetch_all(self, query: str, params: Dict = None) -> List[Any]:
+        if query in BASE_TABLE_QUERIES and not await self.views_available():
+            query = BASE_TABLE_QUERIES[query]
+        return await self.database_service.fetch_all(query, params)
+
+
+# Instância global
+from services.database_service import database_service
+catalog_queries = CatalogQueries(database_service)
@@ -0,0 +1,422 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import unicodedata
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from models.schemas import Brand, Year, Model, Color
+from services.snapshot_store import SharedSnapshotStore
+
+logger = logging.getLogger(__name__)
+
+# Campos de cor que podem ser pedidos na árvore (além do id, que é a chave)
+COLOR_FIELDS = ("nome_cor", "codigo_cor", "rgb")
+
+
+def _sort_key(value: Optional[str]) -> Tuple[str, str]:
+    """Ordenação próxima da collation do Postgres (ignora acentos e caixa)"""
+    value = value or ""
+    folded = unicodedata.normalize("NFKD", value)
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return folded.casefold(), value
+
+
+class CatalogSnapshot:
+    """Fotografia imutável do catálogo, indexada para as consultas de drill-down"""
+
+    def __init__(self, brands: List[Brand],
+                 years_by_brand: Dict[int, List[Year]],
+                 models_by_brand_year: Dict[Tuple[int, int], List[Model]],
+                 colors_by_model_year: Dict[Tuple[int, int], List[Color]],
+                 colors: Optional[Dict[int, Color]] = None,
+                 models: Optional[Dict[int, Model]] = None,
+                 brands_by_id: Optional[Dict[int, Brand]] = None,
+                 color_ids_by_filter: Optional[Dict[Tuple[Optional[int], Optional[int]], Set[int]]] = None,
+                 color_ids_by_model: Optional[Dict[int, Set[int]]] = None,
+                 version: str = ""):
+        self.brands = brands
+        self.years_by_brand = years_by_brand
+        self.models_by_brand_year = models_by_brand_year
+        self.colors_by_model_year = colors_by_model_year
+        self.colors = colors or {}
+        self.models = models or {}
+        self.brands_by_id = brands_by_id or {}
+        # Cores disponíveis por (montadora, ano); None = qualquer
+        self.color_ids_by_filter = color_ids_by_filter or {}
+        self.color_ids_by_model = color_ids_by_model or {}
+        self.version = version
+        self.loaded_at = time.time()
+        # Respostas derivadas deste snapshot (descartadas junto com ele)
+        self.response_cache: Dict = {}
+
+    @classmethod
+    def from_rows(cls, brand_rows, year_rows, model_rows, color_rows, link_rows) -> "CatalogSnapshot":
+        """Monta os índices a partir das linhas de montadora, ano, modelo, cor e modelo_ano_cor"""
+        # Versão = hash do conteúdo; só muda quando os dados mudam
+        digest = hashlib.sha1()
+        for rows in (brand_rows, year_rows, model_rows, color_rows):
+            digest.update(repr(sorted((tuple(row) for row in rows), key=lambda row: row[0])).encode())
+            digest.update(b"|")
+        digest.update(repr(sorted(tuple(row) for row in link_rows)).encode())
+        
+        brands = [Brand(id_montadora=row[0], nome=row[1]) for row in brand_rows]
+        brands.sort(key=lambda b: _sort_key(b.nome))
+
+        years = {row[0]: Year(id_ano=row[0], ano=row[1]) for row in year_rows}
+        models = {row[0]: Model(id_modelo=row[0], nome=row[1], id_montadora=row[2]) for row in model_rows}
+        colors = {row[0]: Color(id_cor=row[0], nome_cor=row[1], codigo_cor=row[2], rgb=row[3]) for row in color_rows}
+        brands_by_id = {brand.id_montadora: brand for brand in brands}
+
+        years_by_brand: Dict[int, Dict[int, Year]] = {}
+        models_by_brand_year: Dict[Tuple[int, int], Dict[int, Model]] = {}
+        colors_by_model_year: Dict[Tuple[int, int], List[Color]] = {}
+        color_ids_by_filter: Dict[Tuple[Optional[int], Optional[int]], Set[int]] = {}
+        color_ids_by_model: Dict[int, Set[int]] = {}
+
+        # Agrupa os vínculos por (modelo, ano) numa única passada; o resto é derivado por grupo
+        color_ids_by_model_year: Dict[Tuple[int, int], List[int]] = {}
+        for id_modelo, id_ano, id_cor in link_rows:
+            group = color_ids_by_model_year.get((id_modelo, id_ano))
+            if group is None:
+                group = color_ids_by_model_year[(id_modelo, id_ano)] = []
+            group.append(id_cor)
+
+        # Equivale aos JOINs das consultas originais: ignora vínculos órfãos
+        for (id_modelo, id_ano), color_ids in color_ids_by_model_year.items():
+            model = models.get(id_modelo)
+            year = years.get(id_ano)
+            if model is None or year is None:
+                continue
+
+            years_by_brand.setdefault(model.id_montadora, {})[id_ano] = year
+            models_by_brand_year.setdefault((model.id_montadora, id_ano), {})[id_modelo] = model
+
+            group_colors = [colors[id_cor] for id_cor in color_ids if id_cor in colors]
+            if group_colors:
+                colors_by_model_year[(id_modelo, id_ano)] = group_colors
+                group_ids = {color.id_cor for color in group_colors}
+                for key in ((model.id_montadora, id_ano), (model.id_montadora, None), (None, id_ano)):
+                    color_ids_by_filter.setdefault(key, set()).update(group_ids)
+                color_ids_by_model.setdefault(id_modelo, set()).update(group_ids)
+
+        # Chaves de ordenação calculadas uma vez por modelo/cor, não por vínculo
+        model_keys = {id_modelo: _sort_key(model.nome) for id_modelo, model in models.items()}
+        color_keys = {id_cor: _sort_key(color.nome_cor) for id_cor, color in colors.items()}
+
+        return cls(
+            brands=brands,
+            years_by_brand={
+                brand_id: sorted(by_id.values(), key=lambda y: y.ano, reverse=True)
+                for brand_id, by_id in years_by_brand.items()
+            },
+            models_by_brand_year={
+                key: sorted(by_id.values(), key=lambda m: model_keys[m.id_modelo])
+                for key, by_id in models_by_brand_year.items()
+            },
+            colors_by_model_year={
+                key: sorted(items, key=lambda c: color_keys[c.id_cor])
+                for key, items in colors_by_model_year.items()
+            },
+            colors=colors,
+            models=models,
+            brands_by_id=brands_by_id,
+            color_ids_by_filter=color_ids_by_filter,
+            color_ids_by_model=color_ids_by_model,
+            version=digest.hexdigest()[:16],
+        )
+
+    def carry_over_responses(self, previous: "CatalogSnapshot", brand_ids: Set[int]):
+        """Reaproveita as respostas cacheadas de montadoras que uma mudança não afetou
+
+        Chaves de response_cache no formato (tipo, id_montadora, ...); sem montadora (ou None)
+        a resposta depende do catálogo inteiro e é descartada.
+        """
+        for key, payload in previous.response_cache.items():
+            if len(key) > 1 and key[1] is not None and key[1] not in brand_ids:
+                self.response_cache.setdefault(key, payload)
+
+    def get_years(self, brand_id: int) -> List[Year]:
+        return self.years_by_brand.get(brand_id, [])
+
+    def get_models(self, brand_id: int, year_id: int) -> List[Model]:
+        return self.models_by_brand_year.get((brand_id, year_id), [])
+
+    def get_colors(self, model_id: int, year_id: int) -> List[Color]:
+        return self.colors_by_model_year.get((model_id, year_id), [])
+
+    def get_color_ids(self, brand_id: Optional[int] = None,
+                      year_id: Optional[int] = None) -> Optional[Set[int]]:
+        """Ids de cores usadas por montadora e/ou ano (None = sem filtro)"""
+        if brand_id is None and year_id is None:
+            return None
+        return self.color_ids_by_filter.get((brand_id, year_id), set())
+
+    def build_tree(self, brand_id: Optional[int] = None,
+                   color_fields: Tuple[str, ...] = COLOR_FIELDS) -> Optional[Dict]:
+        """Árvore montadora → ano → modelo → cores; as cores vêm uma vez só em 'colors'"""
+        brands = self.brands
+        if brand_id is not None:
+            brands = [b for b in brands if b.id_montadora == brand_id]
+            if not brands:
+                return None
+
+        colors: Dict[int, Dict] = {}
+        tree = []
+        for brand in brands:
+            years = []
+            for year in self.get_years(brand.id_montadora):
+                models = []
+                for model in self.get_models(brand.id_montadora, year.id_ano):
+                    color_ids = []
+                    for color in self.get_colors(model.id_modelo, year.id_ano):
+                        color_ids.append(color.id_cor)
+                        if color.id_cor not in colors:
+                            colors[color.id_cor] = {
+                                field: getattr(color, field) for field in color_fields
+                            }
+                    models.append({
+                        "id_modelo": model.id_modelo,
+                        "nome": model.nome,
+                        "colors": color_ids
+                    })
+                years.append({"id_ano": year.id_ano, "ano": year.ano, "models": models})
+            tree.append({"id_montadora": brand.id_montadora, "nome": brand.nome, "years": years})
+
+        # Sem a versão no corpo: a árvore de uma montadora que não mudou é reaproveitada entre
+        # versões (carry_over_responses); a versão vai no ETag
+        return {
+            "brands": tree,
+            "colors": {str(id_cor): data for id_cor, data in colors.items()}
+        }
+
+
+class CatalogService:
+    """Mantém o catálogo em memória e o recarrega periodicamente em segundo plano"""
+
+    def __init__(self, database_service):
+        self.database_service = database_service
+        self.refresh_interval = float(os.getenv("CATALOG_REFRESH_SECONDS", "600"))
+        self._snapshot: Optional[CatalogSnapshot] = None
+        # Linhas do último carregamento; o feed de mudanças troca só as fatias afetadas
+        self._rows: Optional[Tuple[List[Tuple], ...]] = None
+        # Hora (relógio de parede) da consulta da última mudança aplicada; arquivos compartilhados
+        # com linhas consultadas antes disso desfariam a mudança e são ignorados
+        self._applied_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[CatalogSnapshot], Awaitable[None]]] = []
+        # Com vários workers, um só consulta o banco e os outros leem as linhas do arquivo compartilhado
+        shared_path = os.getenv("CATALOG_SHARED_SNAPSHOT")
+        self.shared_store = SharedSnapshotStore(shared_path) if shared_path else None
+
+    def add_listener(self, listener: Callable[[CatalogSnapshot], Awaitable[None]]):
+        """Registra uma corrotina chamada a cada novo snapshot (ex.: reconstruir índices)"""
+        self._listeners.append(listener)
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """Snapshot atual (None enquanto o catálogo não foi carregado)"""
+        return self._snapshot
+
+    async def _query_rows(self) -> Tuple[List[Tuple], ...]:
+        fetch_all = self.database_service.fetch_all
+        results = await asyncio.gather(
+            fetch_all("SELECT id_montadora, nome FROM montadora"),
+            fetch_all("SELECT id_ano, ano FROM ano"),
+            fetch_all("SELECT id_modelo, nome, id_montadora FROM modelo"),
+            fetch_all("SELECT id_cor, nome_cor, codigo_cor, rgb FROM cor"),
+            fetch_all("SELECT id_modelo, id_ano, id_cor FROM modelo_ano_cor"),
+        )
+        return tuple([tuple(row) for row in rows] for rows in results)
+
+    async def _load_rows(self, force: bool) -> Tuple[List[Tuple], ...]:
+        """Linhas do catálogo, do arquivo compartilhado se outro worker já as carregou"""
+        store = self.shared_store
+        if store is None:
+            return await self._query_rows()
+
+        # O arquivo vale por um intervalo de recarga; quem chegar depois disso consulta o banco
+        max_age = self.refresh_interval if self.refresh_interval > 0 else None
+        if not force:
+            rows = await asyncio.to_thread(self._load_shared, max_age)
+            if rows is not None:
+                return rows
+
+        async with store.lock():
+            # Outro worker pode ter carregado enquanto esperávamos a trava
+            if not force:
+                rows = await asyncio.to_thread(self._load_shared, max_age)
+                if rows is not None:
+                    return rows
+            queried_at = time.time()
+            rows = await self._query_rows()
+            await self._save_shared(rows, queried_at)
+            return rows
+
+    def _load_shared(self, max_age: Optional[float]) -> Optional[Tuple[List[Tuple], ...]]:
+        """Linhas do arquivo compartilhado (JSON: as listas voltam a ser tuplas)
+
+        Recusa o arquivo se as linhas foram consultadas antes da última mudança que este worker
+        aplicou (outro worker gravou antes de receber o mesmo NOTIFY).
+        """
+        data = self.shared_store.load(max_age)
+        if not isinstance(data, dict) or not isinstance(data.get("rows"), list) or len(data["rows"]) != 5:
+            return None
+        queried_at = data.get("queried_at")
+        if not isinstance(queried_at, (int, float)) or queried_at < self._applied_at:
+            return None
+        return tuple([tuple(row) for row in rows] for rows in data["rows"])
+
+    async def _save_shared(self, rows: Tuple[List[Tuple], ...], queried_at: float):
+        if self.shared_store is None:
+            return
+        try:
+            await asyncio.to_thread(self.shared_store.save, {"rows": rows, "queried_at": queried_at})
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o catálogo compartilhado: {e}")
+
+    def _install(self, rows: Tuple[List[Tuple], ...], snapshot: CatalogSnapshot, started: float) -> bool:
+        """Publica o snapshot novo; False se a versão é a mesma (mantém o atual e seus caches)"""
+        self._rows = rows
+        if self._snapshot is not None and self._snapshot.version == snapshot.version:
+            return False
+        
+        # Troca atômica: leitores veem o snapshot antigo ou o novo, nunca um parcial
+        self._snapshot = snapshot
+        logger.info(
+            f"📚 Catálogo carregado: {len(snapshot.brands)} montadoras "
+            f"em {time.perf_counter() - started:.2f}s"
+        )
+        return True
+
+    async def _notify_listeners(self, snapshot: CatalogSnapshot):
+        for listener in self._listeners:
+            try:
+                await listener(snapshot)
+            except Exception as e:
+                logger.error(f"Erro ao atualizar índice derivado do catálogo: {e}")
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Recarrega o catálogo; em caso de erro mantém o snapshot anterior
+
+        force=True ignora o arquivo compartilhado e consulta o banco (recarga manual).
+        """
+        async with self._refresh_lock:
+            try:
+                started = time.perf_counter()
+                rows = await self._load_rows(force)
+                # Montar os índices é CPU puro; roda fora do event loop
+                snapshot = await asyncio.to_thread(CatalogSnapshot.from_rows, *rows)
+            except Exception as e:
+                logger.error(f"Erro ao carregar catálogo: {e}")
+                return False
+            
+            if not self._install(rows, snapshot, started):
+                return True
+            
+        await self._notify_listeners(snapshot)
+        return True
+
+    async def _query_slices(self, brand_ids: Set[int], tables: Set[str]) -> Dict[str, List[Tuple]]:
+        """Linhas atuais das montadoras afetadas (e de ano/cor inteiras, se mudaram)"""
+        fetch_all = self.database_service.fetch_all
+        queries = {}
+        if brand_ids:
+            params = {"1": sorted(brand_ids)}
+            queries["montadora"] = fetch_all(
+                "SELECT id_montadora, nome FROM montadora WHERE id_montadora = ANY($1)", params)
+            queries["modelo"] = fetch_all(
+                "SELECT id_modelo, nome, id_montadora FROM modelo WHERE id_montadora = ANY($1)", params)
+            queries["modelo_ano_cor"] = fetch_all('''
+                SELECT mac.id_modelo, mac.id_ano, mac.id_cor
+                FROM modelo_ano_cor mac
+                JOIN modelo m ON mac.id_modelo = m.id_modelo
+                WHERE m.id_montadora = ANY($1)
+            ''', params)
+        if "ano" in tables:
+            queries["ano"] = fetch_all("SELECT id_ano, ano FROM ano")
+        if "cor" in tables:
+            queries["cor"] = fetch_all("SELECT id_cor, nome_cor, codigo_cor, rgb FROM cor")
+        
+        results = await asyncio.gather(*queries.values())
+        return {table: [tuple(row) for row in rows] for table, rows in zip(queries, results)}
+
+    @staticmethod
+    def _splice(rows: Tuple[List[Tuple], ...], brand_ids: Set[int],
+                fresh: Dict[str, List[Tuple]]) -> Tuple[List[Tuple], ...]:
+        """Troca as linhas das montadoras afetadas (e ano/cor, se vieram) pelas atuais"""
+        brand_rows, year_rows, model_rows, color_rows, link_rows = rows
+        if brand_ids:
+            # Vínculos saem pelo modelo antigo: um modelo que mudou de montadora sai da fatia velha
+            old_models = {row[0] for row in model_rows if row[2] in brand_ids}
+            brand_rows = [row for row in brand_rows if row[0] not in brand_ids] + fresh["montadora"]
+            model_rows = [row for row in model_rows if row[2] not in brand_ids] + fresh["modelo"]
+            link_rows = [row for row in link_rows if row[0] not in old_models] + fresh["modelo_ano_cor"]
+        return (
+            brand_rows,
+            fresh.get("ano", year_rows),
+            model_rows,
+            fresh.get("cor", color_rows),
+            link_rows,
+        )
+
+    async def apply_changes(self, changes: Dict[str, Optional[Set[int]]]) -> bool:
+        """Aplica mudanças do catálogo: {tabela: montadoras afetadas, ou None se não dá para saber}
+
+        Com montadoras conhecidas só as linhas delas são relidas, e as respostas cacheadas das
+        demais continuam valendo; senão (ou sem catálogo carregado) faz uma recarga completa.
+        """
+        brand_tables = {"montadora", "modelo", "modelo_ano_cor"} & changes.keys()
+        if self._rows is None or any(changes[table] is None for table in brand_tables):
+            return await self.refresh(force=True)
+        brand_ids = set().union(*(changes[table] for table in brand_tables))
+        
+        async with self._refresh_lock:
+            try:
+                started = time.perf_counter()
+                queried_at = time.time()
+                fresh = await self._query_slices(brand_ids, set(changes))
+                rows = self._splice(self._rows, brand_ids, fresh)
+                snapshot = await asyncio.to_thread(CatalogSnapshot.from_rows, *rows)
+            except Exception as e:
+                logger.error(f"Erro ao aplicar mudanças do catálogo: {e}")
+                return False
+            
+            # Mudança em ano ou cor vale para todas as montadoras: nada é reaproveitado
+            previous = self._snapshot
+            if previous is not None and not {"ano", "cor"} & changes.keys():
+                snapshot.carry_over_responses(previous, brand_ids)
+            installed = self._install(rows, snapshot, started)
+            self._applied_at = queried_at
+            # Workers que subirem agora leem o catálogo já atualizado
+            await self._save_shared(rows, queried_at)
+        
+        if installed:
+            await self._notify_listeners(snapshot)
+        return True
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def start_background_refresh(self):
+        """Agenda a recarga periódica (CATALOG_REFRESH_SECONDS; 0 desativa)"""
+        if self.refresh_interval > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+
+# Instância global
+from services.database_service import database_service
+catalog_service = CatalogService(database_service)
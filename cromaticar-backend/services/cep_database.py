@@ -0,0 +1,266 @@
+"""Base local de CEPs (CEP → lat/lng, cidade, UF) em arquivo binário ordenado e mapeado em memória
+
+Gerar o arquivo a partir de um CSV (colunas cep, latitude, longitude, cidade, uf — os nomes
+mais comuns de datasets abertos são reconhecidos):
+
+    python -m services.cep_database build ceps.csv data/ceps.bin
+
+Consultar:
+
+    python -m services.cep_database lookup 01310-100
+"""
+import argparse
+import bisect
+import csv
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ceps.bin")
+
+MAGIC = b"CEPGEO01"
+# magic, nº de CEPs, nº de prefixos de 5 dígitos, nº de localidades
+HEADER = struct.Struct("<8sIII")
+# cep (8 dígitos ou prefixo de 5), lat, lng, índice da localidade
+RECORD = struct.Struct("<IffI")
+OFFSET = struct.Struct("<I")
+
+CSV_COLUMNS = {
+    "cep": ("cep", "postcode", "postal_code", "zipcode"),
+    "lat": ("lat", "latitude"),
+    "lng": ("lng", "lon", "long", "longitude"),
+    "city": ("cidade", "city", "localidade", "municipio", "município"),
+    "state": ("uf", "estado", "state"),
+}
+
+
+def clean_cep(cep: Optional[str]) -> Optional[str]:
+    """Só os dígitos do CEP; None se não tiver 8 dígitos"""
+    digits = re.sub(r'\D', '', cep or "")
+    return digits if len(digits) == 8 else None
+
+
+class _Column:
+    """Visão da coluna de CEPs de uma tabela do arquivo, para o bisect (sem copiar nada)"""
+
+    def __init__(self, buffer, offset: int, count: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position: int) -> int:
+        return OFFSET.unpack_from(self.buffer, self.offset + position * RECORD.size)[0]
+
+
+class CepDatabase:
+    """Consulta de CEPs por busca binária sobre o arquivo mapeado em memória
+
+    O mmap é somente leitura, então vários workers compartilham as mesmas páginas do cache do SO.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.cep_count, self.prefix_count, self.place_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Arquivo de CEPs inválido: {path}")
+
+        self._ceps_offset = HEADER.size
+        self._prefixes_offset = self._ceps_offset + self.cep_count * RECORD.size
+        self._places_offset = self._prefixes_offset + self.prefix_count * RECORD.size
+        self._strings_offset = self._places_offset + (self.place_count + 1) * OFFSET.size
+
+        self._ceps = _Column(self._mmap, self._ceps_offset, self.cep_count)
+        self._prefixes = _Column(self._mmap, self._prefixes_offset, self.prefix_count)
+        self._places: Dict[int, Tuple[str, str]] = {}
+
+    def __len__(self):
+        return self.cep_count
+
+    def close(self):
+        self._mmap.close()
+
+    def _place(self, index: int) -> Tuple[str, str]:
+        """(cidade, UF) da localidade — poucas e repetidas, então ficam decodificadas em memória"""
+        place = self._places.get(index)
+        if place is None:
+            start, end = struct.unpack_from("<II", self._mmap, self._places_offset + index * OFFSET.size)
+            raw = self._mmap[self._strings_offset + start:self._strings_offset + end].decode("utf-8")
+            city, _, state = raw.rpartition("|")
+            place = self._places[index] = (city, state)
+        return place
+
+    def _find(self, column: _Column, offset: int, key: int) -> Optional[Tuple[float, float, int]]:
+        position = bisect.bisect_left(column, key)
+        if position < len(column) and column[position] == key:
+            _, lat, lng, place = RECORD.unpack_from(self._mmap, offset + position * RECORD.size)
+            return lat, lng, place
+        return None
+
+    def lookup(self, cep: str) -> Optional[Dict]:
+        """CEP exato ou, se não houver, o centroide do prefixo de 5 dígitos"""
+        digits = clean_cep(cep)
+        if digits is None:
+            return None
+
+        found = self._find(self._ceps, self._ceps_offset, int(digits))
+        precision = "cep"
+        if found is None:
+            found = self._find(self._prefixes, self._prefixes_offset, int(digits[:5]))
+            precision = "prefix"
+        if found is None:
+            return None
+
+        lat, lng, place = found
+        city, state = self._place(place)
+        return {
+            "lat": round(lat, 6),
+            "lng": round(lng, 6),
+            "city": city,
+            "state": state,
+            "cep": f"{digits[:5]}-{digits[5:]}",
+            "precision": precision,
+        }
+
+
+def _resolve_columns(fieldnames: List[str]) -> Dict[str, str]:
+    normalized = {name.strip().lower(): name for name in fieldnames if name}
+    columns = {}
+    for column, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[column] = normalized[alias]
+                break
+        else:
+            raise ValueError(f"Coluna '{column}' não encontrada no CSV (aceitos: {', '.join(aliases)})")
+    return columns
+
+
+def read_csv(path: str) -> Iterable[Tuple[int, float, float, str, str]]:
+    """Linhas válidas do CSV como (cep, lat, lng, cidade, UF)"""
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        sample = file.read(64 * 1024)
+        file.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        reader = csv.DictReader(file, dialect=dialect)
+        columns = _resolve_columns(reader.fieldnames or [])
+
+        for row in reader:
+            digits = clean_cep(row.get(columns["cep"]))
+            try:
+                lat = float(row[columns["lat"]].replace(",", "."))
+                lng = float(row[columns["lng"]].replace(",", "."))
+            except (TypeError, ValueError, AttributeError):
+                continue
+            if digits is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                continue
+            yield (int(digits), lat, lng,
+                   (row.get(columns["city"]) or "").strip(), (row.get(columns["state"]) or "").strip().upper())
+
+
+def build(rows: Iterable[Tuple[int, float, float, str, str]], output: str) -> Dict[str, int]:
+    """Grava o arquivo binário: CEPs ordenados, centroides por prefixo e tabela de localidades"""
+    ceps: Dict[int, Tuple[float, float, int]] = {}
+    places: Dict[str, int] = {}
+
+    for cep, lat, lng, city, state in rows:
+        key = f"{city}|{state}"
+        place = places.get(key)
+        if place is None:
+            place = places[key] = len(places)
+        # CEP repetido: vale a última linha
+        ceps[cep] = (lat, lng, place)
+
+    # Centroide e localidade mais frequente de cada prefixo de 5 dígitos
+    groups: Dict[int, List[Tuple[float, float, int]]] = defaultdict(list)
+    for cep, record in ceps.items():
+        groups[cep // 1000].append(record)
+    prefixes = {}
+    for prefix, records in groups.items():
+        lat = sum(r[0] for r in records) / len(records)
+        lng = sum(r[1] for r in records) / len(records)
+        place = Counter(r[2] for r in records).most_common(1)[0][0]
+        prefixes[prefix] = (lat, lng, place)
+
+    strings = [key.encode("utf-8") for key, _ in sorted(places.items(), key=lambda item: item[1])]
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    temporary = f"{output}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(ceps), len(prefixes), len(strings)))
+        for table in (ceps, prefixes):
+            for key in sorted(table):
+                lat, lng, place = table[key]
+                file.write(RECORD.pack(key, lat, lng, place))
+
+        position = 0
+        file.write(OFFSET.pack(position))
+        for raw in strings:
+            position += len(raw)
+            file.write(OFFSET.pack(position))
+        for raw in strings:
+            file.write(raw)
+    # Troca atômica: workers com o arquivo antigo mapeado continuam lendo a versão anterior
+    os.replace(temporary, output)
+
+    return {"ceps": len(ceps), "prefixes": len(prefixes), "places": len(strings)}
+
+
+def open_database(path: Optional[str] = None) -> Optional[CepDatabase]:
+    """Abre a base configurada em CEP_DB_PATH; None se o arquivo não existir"""
+    path = path or os.getenv("CEP_DB_PATH", DEFAULT_PATH)
+    if not os.path.exists(path):
+        return None
+    try:
+        database = CepDatabase(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"Erro abrindo base de CEPs {path}: {e}")
+        return None
+    logger.info(f"📮 Base de CEPs carregada: {len(database)} CEPs ({path})")
+    return database
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Base local de CEPs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Gera o arquivo binário a partir de um CSV")
+    build_parser.add_argument("csv")
+    build_parser.add_argument("output", nargs="?", default=os.getenv("CEP_DB_PATH", DEFAULT_PATH))
+
+    lookup_parser = commands.add_parser("lookup", help="Consulta CEPs na base")
+    lookup_parser.add_argument("ceps", nargs="+")
+    lookup_parser.add_argument("--db", default=os.getenv("CEP_DB_PATH", DEFAULT_PATH))
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        counts = build(read_csv(args.csv), args.output)
+        print(f"✅ {counts['ceps']} CEPs, {counts['prefixes']} prefixos e {counts['places']} localidades "
+              f"gravados em {args.output} ({time.perf_counter() - started:.1f}s)")
+        return
+
+    database = open_database(args.db)
+    if database is None:
+        sys.exit(f"Base de CEPs não encontrada: {args.db}")
+    for cep in args.ceps:
+        print(cep, database.lookup(cep))
+
+
+if __name__ == "__main__":
+    main()
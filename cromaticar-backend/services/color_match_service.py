@@ -0,0 +1,253 @@
+import functools
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("cie76", "ciede2000")
+
+# Branco de referência D65
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+
+_HEX_PATTERN = re.compile(r'^#?([0-9a-fA-F]{6}|[0-9a-fA-F]{3})$')
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+@functools.lru_cache(maxsize=None)
+def _kd_tree_class():
+    """cKDTree do scipy, importado só ao montar o primeiro índice (scipy.spatial leva centenas de ms)
+
+    É opcional; sem ele a busca é força bruta vetorizada (também rápida).
+    """
+    try:
+        from scipy.spatial import cKDTree
+    except ModuleNotFoundError:
+        return None
+    return cKDTree
+
+
+def parse_rgb(value: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """Interpreta '#RRGGBB', 'RRGGBB', '#RGB', 'rgb(r, g, b)' ou 'r,g,b'"""
+    if not value:
+        return None
+    value = value.strip()
+
+    match = _HEX_PATTERN.match(value)
+    if match:
+        digits = match.group(1)
+        if len(digits) == 3:
+            digits = "".join(ch * 2 for ch in digits)
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+    numbers = _NUMBER_PATTERN.findall(value)
+    if len(numbers) == 3:
+        rgb = tuple(int(round(float(n))) for n in numbers)
+        if all(0 <= channel <= 255 for channel in rgb):
+            return rgb
+    return None
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Converte um array (N, 3) de sRGB 0-255 para CIE Lab (D65)"""
+    srgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(srgb > 0.04045, ((srgb + 0.055) / 1.055) ** 2.4, srgb / 12.92)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE_D65
+
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+
+    lab = np.empty_like(f)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def ciede2000(reference: np.ndarray, labs: np.ndarray) -> np.ndarray:
+    """Distância CIEDE2000 entre uma cor Lab (3,) e um array (N, 3)"""
+    L1, a1, b1 = reference
+    L2, a2, b2 = labs[:, 0], labs[:, 1], labs[:, 2]
+
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    C_mean7 = ((C1 + C2) / 2) ** 7
+    G = 0.5 * (1 - np.sqrt(C_mean7 / (C_mean7 + 25 ** 7)))
+
+    a1p = (1 + G) * a1
+    a2p = (1 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, dhp)
+    dhp = np.where(dhp < -180, dhp + 360, dhp)
+    dhp = np.where(C1p * C2p == 0, 0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp) / 2)
+
+    Lp_mean = (L1 + L2) / 2
+    Cp_mean = (C1p + C2p) / 2
+
+    h_sum = h1p + h2p
+    h_mean = np.where(
+        np.abs(h1p - h2p) > 180,
+        np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2),
+        h_sum / 2
+    )
+    h_mean = np.where(C1p * C2p == 0, h_sum, h_mean)
+
+    T = (1
+         - 0.17 * np.cos(np.radians(h_mean - 30))
+         + 0.24 * np.cos(np.radians(2 * h_mean))
+         + 0.32 * np.cos(np.radians(3 * h_mean + 6))
+         - 0.20 * np.cos(np.radians(4 * h_mean - 63)))
+
+    d_theta = 30 * np.exp(-(((h_mean - 275) / 25) ** 2))
+    Cp_mean7 = Cp_mean ** 7
+    R_C = 2 * np.sqrt(Cp_mean7 / (Cp_mean7 + 25 ** 7))
+    S_L = 1 + (0.015 * (Lp_mean - 50) ** 2) / np.sqrt(20 + (Lp_mean - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_mean
+    S_H = 1 + 0.015 * Cp_mean * T
+    R_T = -np.sin(np.radians(2 * d_theta)) * R_C
+
+    return np.sqrt(
+        (dLp / S_L) ** 2
+        + (dCp / S_C) ** 2
+        + (dHp / S_H) ** 2
+        + R_T * (dCp / S_C) * (dHp / S_H)
+    )
+
+
+class ColorIndex:
+    """Array Lab de todas as cores do catálogo (+ KD-tree quando disponível)"""
+
+    # Quantos candidatos por CIE76 são reordenados por CIEDE2000
+    CANDIDATE_FACTOR = 8
+    MIN_CANDIDATES = 64
+
+    def __init__(self, colors):
+        ids = []
+        rgbs = []
+        for color in colors:
+            rgb = parse_rgb(color.rgb)
+            if rgb is not None:
+                ids.append(color.id_cor)
+                rgbs.append(rgb)
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.positions: Dict[int, int] = {id_cor: pos for pos, id_cor in enumerate(ids)}
+        self.lab = rgb_to_lab(np.array(rgbs, dtype=np.float64).reshape(-1, 3))
+        tree_class = _kd_tree_class()
+        self.tree = tree_class(self.lab) if tree_class is not None and len(ids) else None
+        self._subsets: Dict[Tuple, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def subset(self, key: Tuple, allowed_ids: Set[int]) -> np.ndarray:
+        """Posições das cores permitidas por um filtro (calculadas uma vez por filtro)"""
+        positions = self._subsets.get(key)
+        if positions is None:
+            positions = np.fromiter(
+                (self.positions[i] for i in allowed_ids if i in self.positions), dtype=np.int64
+            )
+            self._subsets[key] = positions
+        return positions
+
+    def _candidates(self, lab: np.ndarray, count: int,
+                    allowed: Optional[np.ndarray]) -> np.ndarray:
+        """Posições das `count` cores mais próximas em CIE76 (Euclidiana em Lab)"""
+        if allowed is None:
+            if self.tree is not None:
+                _, positions = self.tree.query(lab, k=count)
+                return np.atleast_1d(positions)
+            positions = np.arange(len(self.ids))
+        else:
+            positions = allowed
+
+        if len(positions) <= count:
+            return positions
+        distances = np.sum((self.lab[positions] - lab) ** 2, axis=1)
+        return positions[np.argpartition(distances, count - 1)[:count]]
+
+    def nearest(self, lab: np.ndarray, k: int = 5, metric: str = "ciede2000",
+                allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Retorna [(id_cor, distância)] das k cores mais próximas (entre as posições permitidas)"""
+        if len(self.ids) == 0:
+            return []
+        lab = np.asarray(lab, dtype=np.float64)
+
+        count = k if metric == "cie76" else max(k * self.CANDIDATE_FACTOR, self.MIN_CANDIDATES)
+        positions = self._candidates(lab, min(count, len(self.ids)), allowed)
+        if len(positions) == 0:
+            return []
+
+        if metric == "cie76":
+            distances = np.sqrt(np.sum((self.lab[positions] - lab) ** 2, axis=1))
+        else:
+            distances = ciede2000(lab, self.lab[positions])
+
+        order = np.argsort(distances)[:k]
+        return [(int(self.ids[positions[i]]), float(distances[i])) for i in order]
+
+
+class ColorMatchService:
+    """Busca das cores de fábrica mais próximas de uma cor medida"""
+
+    def __init__(self):
+        self._index: Optional[ColorIndex] = None
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def is_ready(self, snapshot) -> bool:
+        return self._index is not None and self._version == snapshot.version
+
+    def get_index(self, snapshot) -> ColorIndex:
+        """Índice da versão atual do catálogo (reconstruído quando a versão muda)"""
+        if self._index is None or self._version != snapshot.version:
+            with self._lock:
+                if self._index is None or self._version != snapshot.version:
+                    index = ColorIndex(snapshot.colors.values())
+                    self._index, self._version = index, snapshot.version
+                    logger.info(f"🎨 Índice de cores montado: {len(index)} cores")
+        return self._index
+
+    def nearest(self, snapshot, lab: np.ndarray, k: int = 5, metric: str = "ciede2000",
+                brand_id: Optional[int] = None, year_id: Optional[int] = None,
+                model_id: Optional[int] = None) -> List[Dict]:
+        """Cores mais próximas, opcionalmente só as usadas pela montadora/ano/modelo"""
+        index = self.get_index(snapshot)
+        allowed_ids = snapshot.get_color_ids(brand_id, year_id)
+        if model_id is not None:
+            model_ids = (
+                {color.id_cor for color in snapshot.get_colors(model_id, year_id)}
+                if year_id is not None else snapshot.color_ids_by_model.get(model_id, set())
+            )
+            allowed_ids = model_ids if allowed_ids is None else allowed_ids & model_ids
+        allowed = None
+        if allowed_ids is not None:
+            allowed = index.subset((brand_id, year_id, model_id), allowed_ids)
+
+        results = []
+        for id_cor, distance in index.nearest(lab, k, metric, allowed):
+            color = snapshot.colors[id_cor]
+            results.append({**color.model_dump(), "distance": round(distance, 3)})
+        return results
+
+
+# Instância global
+color_match_service = ColorMatchService()
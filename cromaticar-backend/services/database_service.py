@@ -1,21 +1,86 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
+import asyncio
 import logging
+import os
+import re
+import time
+
+from services.metrics_service import count_error, observe_stage, timed
+from services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+POSITIONAL_PARAM = re.compile(r'\$(\d+)')
+
+class StatementRegistry:
+    """Guarda os text() já montados, para não recriá-los (nem recompilá-los) a cada chamada"""
+    
+    def __init__(self):
+        self._statements: Dict[str, TextClause] = {}
+    
+    def get(self, query: str) -> TextClause:
+        statement = self._statements.get(query)
+        if statement is None:
+            # Placeholders posicionais ($1, $2...) viram binds nomeados (:p1, :p2...)
+            statement = text(POSITIONAL_PARAM.sub(r':p\1', query))
+            self._statements[query] = statement
+        return statement
+    
+    @staticmethod
+    def bind_params(params: Optional[Dict]) -> Dict:
+        """Converte {"1": valor} no formato dos binds nomeados ({"p1": valor})"""
+        if not params:
+            return {}
+        return {
+            f"p{key}" if str(key).isdigit() else key: value
+            for key, value in params.items()
+        }
+    
+    def __len__(self):
+        return len(self._statements)
+
 class DatabaseService:
     """Serviço SIMPLIFICADO - apenas consultas"""
     
     def __init__(self, db_config):
         self.db_config = db_config
+        self.statements = StatementRegistry()
+        self._waiting = 0
+        # Leituras idênticas simultâneas (ex.: vários clientes pedindo o mesmo filtro) viram uma só
+        self.single_flight = SingleFlight("database")
+    
+    @asynccontextmanager
+    async def connect(self):
+        """Checkout de conexão do pool, contando quem está esperando"""
+        self._waiting += 1
+        acquired = False
+        started = time.perf_counter()
+        try:
+            async with self.db_config.async_engine.connect() as conn:
+                self._waiting -= 1
+                acquired = True
+                observe_stage("db_checkout", time.perf_counter() - started)
+                yield conn
+        finally:
+            if not acquired:
+                self._waiting -= 1
+    
+    def pool_status(self) -> Dict:
+        """Métricas do pool para o /health"""
+        status = self.db_config.pool_status()
+        status["waiting"] = self._waiting
+        status["cached_statements"] = len(self.statements)
+        return status
     
     async def test_connection(self) -> bool:
         """Testa a conexão com o banco"""
         try:
-            async with self.db_config.async_engine.connect() as conn:
-                result = await conn.execute(text("SELECT 1"))
+            async with self.connect() as conn:
+                result = await conn.execute(self.statements.get("SELECT 1"))
                 return result.scalar() == 1
         except ModuleNotFoundError as e:
             # Erro comum em ambientes sem o driver asyncpg instalado
@@ -29,23 +94,77 @@ class DatabaseService:
             logger.error(f"Erro na conexão com o banco: {e}")
             return False
     
+    async def warm_up(self, connections: Optional[int] = None) -> int:
+        """Abre conexões do pool antecipadamente (DB_POOL_WARM_CONNECTIONS); devolve quantas abriram
+
+        Segurar todas ao mesmo tempo obriga o pool a criar uma conexão nova para cada uma,
+        tirando o custo do handshake TLS das primeiras requisições.
+        """
+        if connections is None:
+            pool_size = self.db_config.get_pool_settings()["pool_size"]
+            connections = int(os.getenv("DB_POOL_WARM_CONNECTIONS", str(min(pool_size, 4))))
+        if connections <= 0:
+            return 0
+
+        finished = 0
+        release = asyncio.Event()
+
+        def done():
+            nonlocal finished
+            finished += 1
+            if finished == connections:
+                release.set()
+
+        async def hold():
+            counted = False
+            try:
+                async with self.connect() as conn:
+                    await conn.execute(self.statements.get("SELECT 1"))
+                    counted = True
+                    done()
+                    await release.wait()
+            finally:
+                # Uma que falhou também conta como terminada, para não prender as outras
+                if not counted:
+                    done()
+
+        results = await asyncio.gather(*(hold() for _ in range(connections)), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            logger.warning(f"Aquecimento do pool: {len(errors)} conexões falharam ({errors[0]})")
+        return connections - len(errors)
+
     async def fetch_all(self, query: str, params: Dict = None) -> List[Any]:
         """Busca todos os resultados - PARA CONSULTAS"""
+        key = (query, tuple(sorted((str(k), repr(v)) for k, v in (params or {}).items())))
+        
+        async def run() -> List[Any]:
+            async with self.connect() as conn:
+                with timed("db_execute"):
+                    result = await conn.execute(
+                        self.statements.get(query), self.statements.bind_params(params)
+                    )
+                    return result.fetchall()
+        
         try:
-            async with self.db_config.async_engine.connect() as conn:
-                result = await conn.execute(text(query), params or {})
-                return result.fetchall()
+            # Cada chamador recebe sua própria lista (as linhas são imutáveis)
+            return list(await self.single_flight.do(key, run))
         except Exception as e:
+            count_error("db_execute", type(e).__name__)
             logger.error(f"Erro buscando dados: {e}")
             raise
     
     async def fetch_one(self, query: str, params: Dict = None) -> Optional[Any]:
         """Busca um único resultado - PARA CONSULTAS"""
         try:
-            async with self.db_config.async_engine.connect() as conn:
-                result = await conn.execute(text(query), params or {})
-                return result.fetchone()
+            async with self.connect() as conn:
+                with timed("db_execute"):
+                    result = await conn.execute(
+                        self.statements.get(query), self.statements.bind_params(params)
+                    )
+                    return result.fetchone()
         except Exception as e:
+            count_error("db_execute", type(e).__name__)
             logger.error(f"Erro buscando um registro: {e}")
             raise
 
@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from multidict import CIMultiDict
+
+from services.metrics_service import count_error, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# Respostas que valem nova tentativa (sobrecarga ou falha temporária do servidor)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_host_rates(value: str) -> Dict[str, Tuple[float, float]]:
+    """'www.google.com=0.5:2,viacep.com.br=20' → {host: (requisições/s, rajada)}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        host, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        try:
+            rates[host.strip().lower()] = (float(rate), float(burst or max(float(rate), 1)))
+        except ValueError:
+            logger.warning(f"Limite de taxa inválido ignorado: {item}")
+    return rates
+
+
+class TokenBucket:
+    """Limite de taxa por host: `rate` requisições por segundo com rajadas de até `capacity`
+
+    rate <= 0 desliga o limite (FETCH_HOST_RATE=0).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        # Com capacidade abaixo de 1 o balde nunca juntaria uma ficha inteira
+        self.capacity = max(capacity, 1)
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Para de chamar um host depois de falhas seguidas; após o intervalo, libera uma tentativa"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    @property
+    def testing(self) -> bool:
+        """Tentativa de teste do half-open em andamento"""
+        return self._trial
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def abandon_trial(self):
+        """Tentativa de teste interrompida sem resposta (cancelada): libera uma nova tentativa"""
+        self._trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.threshold:
+            if self.opened_at is None or self._trial:
+                logger.warning(f"Circuito aberto após {self.failures} falhas seguidas")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+
+class FetchService:
+    """Cliente HTTP assíncrono compartilhado para chamadas externas (scraping, ViaCEP, OSRM)
+
+    Conexões keep-alive em pool, limite de taxa e de concorrência por host, novas tentativas
+    com backoff exponencial, circuit breaker por host e respeito ao robots.txt (quando pedido).
+    """
+
+    def __init__(self):
+        self.total_limit = int(os.getenv("FETCH_TOTAL_LIMIT", "20"))
+        self.per_host_limit = int(os.getenv("FETCH_PER_HOST_LIMIT", "2"))
+        self.request_timeout = float(os.getenv("FETCH_TIMEOUT_SECONDS", "10"))
+        # Páginas maiores que isso são truncadas (o conteúdo útil costuma estar no início)
+        self.max_body_bytes = int(os.getenv("FETCH_MAX_BODY_BYTES", str(1024 * 1024)))
+        self.headers = {'User-Agent': DEFAULT_USER_AGENT}
+
+        # Taxa padrão por host e exceções (FETCH_HOST_RATES="host=req/s:rajada,...")
+        self.host_rate = float(os.getenv("FETCH_HOST_RATE", "2"))
+        self.host_burst = float(os.getenv("FETCH_HOST_BURST", "4"))
+        # O Google bloqueia rápido quem consulta demais, por isso o padrão dele é mais baixo
+        self.host_rates = parse_host_rates(os.getenv("FETCH_HOST_RATES", "www.google.com=1:3"))
+
+        self.max_retries = int(os.getenv("FETCH_RETRIES", "2"))
+        self.retry_base_delay = float(os.getenv("FETCH_RETRY_BASE_SECONDS", "0.5"))
+        self.retry_max_delay = float(os.getenv("FETCH_RETRY_MAX_SECONDS", "8"))
+
+        self.breaker_threshold = int(os.getenv("FETCH_BREAKER_FAILURES", "5"))
+        self.breaker_cooldown = float(os.getenv("FETCH_BREAKER_COOLDOWN_SECONDS", "60"))
+
+        self.robots_ttl = float(os.getenv("FETCH_ROBOTS_TTL_SECONDS", "3600"))
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._robots: Dict[str, Tuple[Optional[RobotFileParser], float]] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Cria a sessão sob demanda (precisa de um event loop ativo)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.total_limit,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        return self._session
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        """Limita requisições simultâneas por host"""
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate, burst = self.host_rates.get(host, (self.host_rate, self.host_burst))
+            bucket = self._buckets[host] = TokenBucket(rate, burst)
+        return bucket
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return breaker
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        """Backoff exponencial com jitter completo (ou o Retry-After do servidor, se houver)"""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.retry_max_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def allowed_by_robots(self, url: str) -> bool:
+        """Consulta o robots.txt do site (em cache por FETCH_ROBOTS_TTL_SECONDS)"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        cached = self._robots.get(origin)
+        if cached is None or cached[1] <= time.monotonic():
+            lock = self._robots_locks.setdefault(origin, asyncio.Lock())
+            async with lock:
+                cached = self._robots.get(origin)
+                if cached is None or cached[1] <= time.monotonic():
+                    cached = self._robots[origin] = await self._load_robots(origin)
+        parser = cached[0]
+        return parser is None or parser.can_fetch(DEFAULT_USER_AGENT, url)
+
+    async def _load_robots(self, origin: str) -> Tuple[Optional[RobotFileParser], float]:
+        status, body, _ = await self.request(f"{origin}/robots.txt", retries=0, max_bytes=512 * 1024)
+        parser = RobotFileParser()
+        if status in (401, 403):
+            parser.disallow_all = True
+        elif status == 200 and body is not None:
+            parser.parse(body.decode("utf-8", errors="ignore").splitlines())
+        else:
+            # Sem robots.txt (ou inacessível): tudo liberado; erros são revistos mais cedo
+            ttl = self.robots_ttl if status is not None and status < 500 else min(self.robots_ttl, 300)
+            return None, time.monotonic() + ttl
+        return parser, time.monotonic() + self.robots_ttl
+
+    async def request(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                      max_bytes: Optional[int] = None,
+                      retries: Optional[int] = None) -> Tuple[Optional[int], Optional[bytes], Mapping[str, str]]:
+        """GET com limites por host, novas tentativas e circuit breaker
+
+        Retorna (status, corpo, cabeçalhos sem distinção de maiúsculas); status None quando não houve resposta
+        (erro de rede, timeout ou circuito aberto).
+        """
+        host = (urlsplit(url).hostname or "").lower()
+        max_bytes = max_bytes or self.max_body_bytes
+        retries = self.max_retries if retries is None else retries
+        breaker = self._breaker(host)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                logger.warning(f"Circuito aberto para {host}; ignorando {url}")
+                count_error("fetch", "circuit_open")
+                return None, None, {}
+
+            # allow() só libera uma requisição no half-open: se o teste está marcado, é esta
+            trial = breaker.testing
+            status, body, response_headers = None, None, {}
+            try:
+                await self._bucket(host).acquire()
+                async with self._host_semaphore(host):
+                    with timed("fetch"):
+                        async with self._get_session().get(url, params=params, headers=headers) as response:
+                            status = response.status
+                            response_headers = CIMultiDict(response.headers)
+                            if status < 400:
+                                body = await self._read_limited(response, max_bytes)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timeout ao buscar {url}")
+                count_error("fetch", "timeout")
+            except aiohttp.ClientError as e:
+                logger.warning(f"Erro ao buscar {url}: {e}")
+                count_error("fetch", "network")
+            except BaseException:
+                # Cancelada (prazo do scraping, job cancelado) ou erro inesperado: sem isso o teste
+                # do half-open ficaria "em andamento" para sempre e o host, bloqueado
+                if trial:
+                    breaker.abandon_trial()
+                raise
+
+            if status is not None and status >= 400:
+                count_error("fetch", f"http_{status // 100}xx")
+
+            failed = status is None or status in RETRY_STATUSES
+            if not failed:
+                # 4xx "normais" (404, 403...) não indicam host com problema
+                breaker.record_success()
+                return status, body, response_headers
+
+            # Uma falha por requisição (depois das novas tentativas), não por tentativa; a tentativa
+            # de teste do half-open não é repetida: falhou, o circuito volta a abrir
+            if attempt >= retries or trial:
+                breaker.record_failure()
+                return status, None, response_headers
+
+            await asyncio.sleep(self._retry_delay(attempt, response_headers.get("Retry-After")))
+            attempt += 1
+
+    async def fetch(self, url: str, params: Optional[Dict] = None,
+                    max_bytes: Optional[int] = None, check_robots: bool = False) -> Optional[bytes]:
+        """Baixa o corpo de uma URL (até max_bytes); retorna None em caso de erro ou timeout"""
+        if check_robots and not await self.allowed_by_robots(url):
+            logger.info(f"Bloqueado pelo robots.txt: {url}")
+            return None
+
+        status, body, _ = await self.request(url, params=params, max_bytes=max_bytes)
+        if status is not None and status >= 400:
+            logger.warning(f"HTTP {status} em {url}")
+            return None
+        return body
+
+    async def _read_limited(self, response: aiohttp.ClientResponse, max_bytes: int) -> bytes:
+        """Lê o corpo em blocos e para de ler ao atingir o limite"""
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+        return b"".join(chunks)[:max_bytes]
+
+    def host_status(self) -> Dict[str, Dict]:
+        """Estado por host (circuit breaker e tokens disponíveis) para o /health"""
+        status = {}
+        for host, breaker in self._breakers.items():
+            bucket = self._buckets.get(host)
+            status[host] = {
+                "breaker": breaker.state,
+                "failures": breaker.failures,
+                "tokens": round(bucket.tokens, 2) if bucket else None,
+            }
+        return status
+
+    async def close(self):
+        """Fecha a sessão HTTP (chamado no shutdown da aplicação)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Instância global
+fetch_service = FetchService()
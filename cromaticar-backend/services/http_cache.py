@@ -0,0 +1,212 @@
+import gzip
+import hashlib
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.routing import Match
+
+# brotli é opcional; sem ele respondemos com gzip
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+# orjson é opcional; sem ele serializamos com o json da biblioteca padrão
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+# Abaixo disso a compressão não compensa
+MIN_COMPRESS_BYTES = 1024
+
+
+def dumps_json(data: Any) -> bytes:
+    """Serializa direto para bytes UTF-8 (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def rows_to_json(rows, fields) -> bytes:
+    """Lista de objetos JSON a partir de tuplas/linhas do banco, sem passar por modelos Pydantic"""
+    return dumps_json([dict(zip(fields, row)) for row in rows])
+
+
+class EncodedPayload:
+    """Corpo JSON já serializado, com ETag e variantes comprimidas prontas"""
+
+    def __init__(self, body: bytes, etag: Optional[str] = None):
+        self.body = body
+        self.etag = etag or hashlib.sha1(body).hexdigest()[:20]
+        self._encoded: Dict[str, bytes] = {}
+
+    @classmethod
+    def from_data(cls, data: Any, etag: Optional[str] = None) -> "EncodedPayload":
+        return cls(dumps_json(data), etag)
+
+    def encoded(self, encoding: str) -> bytes:
+        """Corpo comprimido (calculado uma vez por encoding)"""
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Escolhe brotli ou gzip a partir do Accept-Encoding do cliente"""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, param = part.partition(";")
+        param = param.strip().lower()
+        if param.startswith("q="):
+            try:
+                if float(param[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara o If-None-Match com o ETag (ignora W/ e o sufixo de encoding)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate.removeprefix("W/").strip('"')
+        if candidate.split("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def cached_response(request: Request, payload: EncodedPayload,
+                    cache_control: str = "no-cache") -> Response:
+    """Responde 304 se o cliente já tem a versão, senão o corpo comprimido conforme o cliente aceita"""
+    headers = {
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        headers["ETag"] = f'"{payload.etag}"'
+        return Response(status_code=304, headers=headers)
+
+    encoding = None
+    if len(payload.body) >= MIN_COMPRESS_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'"{payload.etag}-{encoding}"'
+        body = payload.encoded(encoding)
+    else:
+        headers["ETag"] = f'"{payload.etag}"'
+        body = payload.body
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class CachePolicy:
+    """Política de cache HTTP de uma rota
+
+    versioned=True: o ETag vem da versão do catálogo + URL, e o 304 sai antes do handler.
+    versioned=False: o ETag é o hash do corpo (respostas que não dependem do catálogo).
+    """
+
+    def __init__(self, max_age: int, stale_while_revalidate: int = 0, versioned: bool = True):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.versioned = versioned
+
+    @property
+    def cache_control(self) -> str:
+        value = f"public, max-age={self.max_age}"
+        if self.stale_while_revalidate:
+            value += f", stale-while-revalidate={self.stale_while_revalidate}"
+        return value
+
+
+class HTTPCache:
+    """Middleware de cache HTTP: ETag, 304 e Cache-Control conforme a política de cada rota"""
+
+    def __init__(self, app, policies: Dict[str, CachePolicy], version: Callable[[], Optional[str]]):
+        self.app = app
+        # Template da rota (/api/brands/{brand_id}/years) → política
+        self.policies = policies
+        self.version = version
+
+    def match(self, request: Request) -> Optional[Tuple[Any, CachePolicy]]:
+        """Rota e política do request, resolvidas antes do roteamento"""
+        for route in self.app.router.routes:
+            policy = self.policies.get(getattr(route, "path", None))
+            if policy is None:
+                continue
+            match, _ = route.matches(request.scope)
+            if match == Match.FULL:
+                return route, policy
+        return None
+
+    @staticmethod
+    def _url_digest(request: Request) -> str:
+        # Parâmetros em ordem: ?a=1&b=2 e ?b=2&a=1 são a mesma representação
+        query = urlencode(sorted(parse_qsl(request.url.query, keep_blank_values=True)))
+        return hashlib.sha1(f"{request.url.path}?{query}".encode()).hexdigest()[:12]
+
+    @staticmethod
+    def _headers(policy: CachePolicy, etag: str) -> Dict[str, str]:
+        return {"ETag": f'"{etag}"', "Cache-Control": policy.cache_control, "Vary": "Accept-Encoding"}
+
+    def _finish(self, response: Response, policy: CachePolicy, etag: str) -> Response:
+        # O mesmo recurso comprimido é outra representação: ETag próprio por encoding
+        encoding = response.headers.get("content-encoding")
+        response.headers.update(self._headers(policy, f"{etag}-{encoding}" if encoding else etag))
+        return response
+
+    async def __call__(self, request: Request, call_next):
+        if request.method != "GET":
+            return await call_next(request)
+        matched = self.match(request)
+        if matched is None:
+            return await call_next(request)
+        route, policy = matched
+        # Rota já resolvida: as métricas usam o template mesmo quando o 304 sai daqui
+        request.scope["route"] = route
+        if_none_match = request.headers.get("if-none-match")
+
+        if policy.versioned:
+            version = self.version()
+            if version is None:
+                # Catálogo ainda não carregado: a resposta vem do banco e não é cacheada
+                return await call_next(request)
+            etag = f"{version}.{self._url_digest(request)}"
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers=self._headers(policy, etag))
+            response = await call_next(request)
+            if response.status_code != 200:
+                return response
+            return self._finish(response, policy, etag)
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=self._headers(policy, etag))
+        response = Response(content=body, status_code=response.status_code,
+                            headers=dict(response.headers), media_type=response.media_type)
+        return self._finish(response, policy, etag)
@@ -0,0 +1,60 @@
+"""Serviços pesados importados só no primeiro uso
+
+A busca de lojas (aiohttp, BeautifulSoup, base de CEPs, cadastro em SQLite) não é usada pelas
+rotas do catálogo; importá-la no startup só atrasa o cold start dos containers. As rotas chamam
+`await store_search.load()`, que faz o import numa thread na primeira vez.
+"""
+import asyncio
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyService:
+    """Instância global de um módulo (`module.attribute`), importada na primeira chamada"""
+
+    def __init__(self, module: str, attribute: str):
+        self.module = module
+        self.attribute = attribute
+        self.load_seconds: Optional[float] = None
+        self._instance: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Módulo já importado (por este objeto ou por quem importou o módulo direto)"""
+        return self._instance is not None or self.module in sys.modules
+
+    def get(self) -> Any:
+        """Instância do serviço; o primeiro acesso importa o módulo (bloqueia a thread atual)"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    instance = getattr(importlib.import_module(self.module), self.attribute)
+                    self.load_seconds = time.perf_counter() - started
+                    self._instance = instance
+                    logger.info(f"📦 {self.module} carregado em {self.load_seconds:.2f}s")
+        return self._instance
+
+    async def load(self) -> Any:
+        """Como get(), mas o import (e o que o módulo abre ao ser importado) roda fora do event loop"""
+        if self._instance is None:
+            return await asyncio.to_thread(self.get)
+        return self._instance
+
+    def status(self) -> Dict:
+        return {
+            "loaded": self.loaded,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+
+# Instâncias globais
+store_search = LazyService("services.store_search_service", "store_search_service")
+fetch = LazyService("services.fetch_service", "fetch_service")
@@ -1,43 +1,107 @@
-import requests
+import asyncio
+import json
+import logging
+import os
 import re
-from typing import List, Dict, Optional
-import math
+from typing import List, Dict, Optional, Sequence
+
+import numpy as np
+
+from services.cache_service import TTLCache
+from services.cep_database import open_database
+from services.fetch_service import fetch_service
+from services.metrics_service import timed
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+# Velocidade média usada na estimativa de tempo (área urbana)
+URBAN_SPEED_KMH = 60
+
+
+def haversine_km(origin_lat: float, origin_lng: float, lats, lngs) -> np.ndarray:
+    """Distâncias em linha reta (km) de uma origem para N destinos, numa passada só"""
+    lat1 = np.radians(origin_lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lngs, dtype=np.float64) - origin_lng)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def has_coordinates(location: Optional[Dict]) -> bool:
+    """Localização com lat/lng (as do ViaCEP têm só cidade/UF)"""
+    return bool(location) and location.get("lat") is not None and location.get("lng") is not None
+
 
 class LocationService:
     def __init__(self):
-        self.osrm_url = "http://router.project-osrm.org/route/v1/driving/"
+        # Aponte OSRM_URL para uma instância local do OSRM em produção
+        self.osrm_base_url = os.getenv("OSRM_URL", "http://router.project-osrm.org").rstrip("/")
+        self.osrm_url = f"{self.osrm_base_url}/route/v1/driving/"
+        # haversine (padrão) ou osrm (matriz de rotas pelo serviço table)
+        self.distance_mode = os.getenv("DISTANCE_MODE", "haversine").lower()
+        # Cache por par origem/destino (coordenadas arredondadas a ~1 m)
+        self.route_cache = TTLCache("osrm", ttl=float(os.getenv("OSRM_CACHE_TTL_SECONDS", "86400")),
+                                    max_entries=int(os.getenv("OSRM_CACHE_MAX_ENTRIES", "10000")))
+        self.cep_single_flight = SingleFlight("cep", copy_result=True)
+        # Base local (arquivo mapeado em memória); sem ela, cai no ViaCEP (só cidade/UF)
+        self.cep_database = open_database()
+        if self.cep_database is None:
+            logger.warning("Base de CEPs não encontrada (CEP_DB_PATH): CEPs só com cidade/UF pelo ViaCEP, sem coordenadas")
     
-    def get_coordinates_from_cep(self, cep: str) -> Optional[Dict]:
-        """Converte CEP em coordenadas usando API ViaCEP"""
-        try:
+    def lookup_local_cep(self, cep: str) -> Optional[Dict]:
+        """Consulta na base local de CEPs (microssegundos, sem rede)"""
+        if self.cep_database is None:
+            return None
+        return self.cep_database.lookup(cep)
+    
+    async def get_coordinates_from_cep(self, cep: str) -> Optional[Dict]:
+        """Converte CEP em coordenadas (base local; ViaCEP se o CEP não estiver nela)
+
+        O ViaCEP não devolve coordenadas: a localização vem só com cidade/UF e lat/lng None
+        (precision "city"), o que basta para as buscas por cidade mas não para distâncias.
+        """
+        with timed("geocode"):
+            location = self.lookup_local_cep(cep)
+            if location:
+                return location
+            
+            # CEPs iguais consultados ao mesmo tempo fazem uma só chamada ao ViaCEP
             cep_clean = re.sub(r'\D', '', cep)
-            response = requests.get(f'https://viacep.com.br/ws/{cep_clean}/json/')
-            data = response.json()
+            return await self.cep_single_flight.do(cep_clean, lambda: self._fetch_viacep(cep, cep_clean))
+    
+    async def _fetch_viacep(self, cep: str, cep_clean: str) -> Optional[Dict]:
+        try:
+            body = await fetch_service.fetch(f'https://viacep.com.br/ws/{cep_clean}/json/')
+            data = json.loads(body) if body else {'erro': True}
             
             if 'erro' not in data:
-                # Geocoding simples - em produção usar Google Maps API
                 return {
-                    "lat": -23.5505,  # São Paulo como fallback
-                    "lng": -46.6333,
+                    "lat": None,
+                    "lng": None,
                     "city": data.get('localidade', ''),
                     "state": data.get('uf', ''),
-                    "cep": cep
+                    "cep": cep,
+                    "precision": "city"
                 }
         except Exception as e:
-            print(f"Erro geocoding CEP {cep}: {e}")
+            logger.warning(f"Erro geocoding CEP {cep}: {e}")
         
         return None
     
-    def calculate_distance_osrm(self, origin_lat: float, origin_lng: float, 
-                              dest_lat: float, dest_lng: float) -> Optional[Dict]:
+    async def calculate_distance_osrm(self, origin_lat: float, origin_lng: float, 
+                                      dest_lat: float, dest_lng: float) -> Optional[Dict]:
         """Calcula distância e tempo usando OSRM"""
         try:
             origin = f"{origin_lng},{origin_lat}"
             destination = f"{dest_lng},{dest_lat}"
             
-            url = f"{self.osrm_url}{origin};{destination}?overview=false"
-            response = requests.get(url, timeout=10)
-            data = response.json()
+            url = f"{self.osrm_url}{origin};{destination}"
+            body = await fetch_service.fetch(url, params={"overview": "false"})
+            data = json.loads(body) if body else {}
             
             if data.get('code') == 'Ok' and data['routes']:
                 route = data['routes'][0]
@@ -47,41 +111,102 @@ class LocationService:
                 }
                 
         except Exception as e:
-            print(f"Erro OSRM: {e}")
+            logger.warning(f"Erro OSRM: {e}")
             
         return None
     
     def calculate_distance_haversine(self, lat1: float, lon1: float, 
                                    lat2: float, lon2: float) -> Dict:
         """Calcula distância em linha reta usando fórmula de Haversine"""
-        R = 6371  # Raio da Terra em km
+        return self.calculate_distances_haversine(lat1, lon1, [(lat2, lon2)])[0]
+    
+    def calculate_distances_haversine(self, origin_lat: float, origin_lng: float,
+                                      destinations: Sequence[Sequence[float]]) -> List[Dict]:
+        """Haversine de uma origem para N destinos [(lat, lng)] em uma operação vetorizada"""
+        if not destinations:
+            return []
+        points = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+        distances = haversine_km(origin_lat, origin_lng, points[:, 0], points[:, 1])
         
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
+        # Estimativa de tempo pela velocidade média urbana
+        times = distances / URBAN_SPEED_KMH * 60
         
-        a = (math.sin(dlat/2) * math.sin(dlat/2) + 
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-             math.sin(dlon/2) * math.sin(dlon/2))
+        return [
+            {"distance_km": distance, "time_min": time_min}
+            for distance, time_min in zip(np.round(distances, 1).tolist(), np.round(times, 1).tolist())
+        ]
+    
+    @staticmethod
+    def _pair_key(origin_lat: float, origin_lng: float, lat: float, lng: float) -> str:
+        return f"{origin_lat:.5f},{origin_lng:.5f}|{lat:.5f},{lng:.5f}"
+    
+    async def calculate_distances_osrm(self, origin_lat: float, origin_lng: float,
+                                       destinations: Sequence[Sequence[float]]) -> List[Optional[Dict]]:
+        """Matriz origem → N destinos pelo serviço table do OSRM, numa só requisição assíncrona
+        
+        Pares já consultados vêm do cache; os que o OSRM não resolver ficam como None.
+        """
+        results: List[Optional[Dict]] = [None] * len(destinations)
+        missing = []
+        for i, (lat, lng) in enumerate(destinations):
+            cached = await self.route_cache.get(self._pair_key(origin_lat, origin_lng, lat, lng))
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.append(i)
         
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
+        if not missing:
+            return results
         
-        # Estimativa de tempo (60 km/h em área urbana)
-        time_min = (distance / 60) * 60
+        # Coordenadas no formato do OSRM (lng,lat); a origem é o índice 0
+        coordinates = ";".join(
+            [f"{origin_lng},{origin_lat}"] +
+            [f"{destinations[i][1]},{destinations[i][0]}" for i in missing]
+        )
+        body = await fetch_service.fetch(
+            f"{self.osrm_base_url}/table/v1/driving/{coordinates}",
+            params={"sources": "0", "annotations": "distance,duration"}
+        )
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            data = {}
         
-        return {
-            "distance_km": round(distance, 1),
-            "time_min": round(time_min, 1)
-        }
+        if data.get('code') != 'Ok':
+            logger.warning(f"Erro OSRM table: {data.get('code') or 'sem resposta'}")
+            return results
+        
+        distances = data.get('distances', [[]])[0]
+        durations = data.get('durations', [[]])[0]
+        for column, i in enumerate(missing, start=1):
+            if column >= len(distances) or distances[column] is None or durations[column] is None:
+                continue
+            info = {
+                "distance_km": round(distances[column] / 1000, 1),
+                "time_min": round(durations[column] / 60, 1)
+            }
+            results[i] = info
+            lat, lng = destinations[i]
+            await self.route_cache.set(self._pair_key(origin_lat, origin_lng, lat, lng), info)
+        return results
+    
+    async def calculate_distances(self, origin_lat: float, origin_lng: float,
+                                  destinations: Sequence[Sequence[float]]) -> List[Dict]:
+        """Distâncias para N destinos: OSRM (se DISTANCE_MODE=osrm), completando com haversine"""
+        results = self.calculate_distances_haversine(origin_lat, origin_lng, destinations)
+        if self.distance_mode == "osrm" and destinations:
+            routes = await self.calculate_distances_osrm(origin_lat, origin_lng, destinations)
+            results = [route or fallback for route, fallback in zip(routes, results)]
+        return results
     
-    def get_user_coordinates(self, cep: Optional[str] = None, 
-                           lat: Optional[float] = None, 
-                           lng: Optional[float] = None) -> Optional[Dict]:
+    async def get_user_coordinates(self, cep: Optional[str] = None, 
+                                   lat: Optional[float] = None, 
+                                   lng: Optional[float] = None) -> Optional[Dict]:
         """Obtém coordenadas do usuário por CEP ou lat/lng"""
         if lat and lng:
             return {"lat": lat, "lng": lng}
         elif cep:
-            return self.get_coordinates_from_cep(cep)
+            return await self.get_coordinates_from_cep(cep)
         else:
             # Fallback para São Paulo
-            return {"lat": -23.5505, "lng": -46.6333, "city": "São Paulo"}
\ No newline at end of file
+            return {"lat": -23.5505, "lng": -46.6333, "city": "São Paulo"}
@@ -0,0 +1,168 @@
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Limites (segundos) dos buckets: de sub-milissegundo (cache, índice) até o prazo do scraping
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Tempos por etapa da requisição HTTP atual (para o cabeçalho Server-Timing)
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Contador monotônico com rótulos"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Histograma de durações (buckets cumulativos no formato do Prometheus)"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Por rótulo: [contagem por bucket (não cumulativa) + estouro, soma]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][position] += 1
+            entry[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: (list(counts), total[0]) for labels, (counts, total) in self._values.items()}
+        for labels, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsService:
+    """Registro das métricas da aplicação e exposição no formato texto do Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        # Cabeçalho Server-Timing com os tempos por etapa em cada resposta
+        self.timing_headers = os.getenv("METRICS_TIMING_HEADERS", "false").lower() == "true"
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    @contextmanager
+    def request_scope(self) -> Iterator[Dict[str, float]]:
+        """Coleta os tempos por etapa de uma requisição (inclusive das tasks/threads que ela criar)"""
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        try:
+            yield timings
+        finally:
+            _request_timings.reset(token)
+
+
+# Instância global
+metrics_service = MetricsService()
+
+STAGE_SECONDS = metrics_service.histogram(
+    "cromaticar_stage_seconds", "Duração das etapas internas (busca, download, parse, banco...)", ["stage"]
+)
+STAGE_ERRORS = metrics_service.counter(
+    "cromaticar_stage_errors_total", "Erros por etapa e tipo (timeout, rede, http...)", ["stage", "kind"]
+)
+CACHE_REQUESTS = metrics_service.counter(
+    "cromaticar_cache_requests_total", "Consultas aos caches por resultado (hit/miss)", ["cache", "result"]
+)
+HTTP_REQUEST_SECONDS = metrics_service.histogram(
+    "cromaticar_http_request_seconds", "Duração das requisições HTTP por rota", ["method", "route", "status"]
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Mede o bloco (síncrono ou com await dentro) como uma etapa"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def count_error(stage: str, kind: str):
+    STAGE_ERRORS.inc(stage, kind)
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """Valor do cabeçalho Server-Timing (durações em milissegundos)"""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+# zstd é opcional (pacote zstandard); sem ele as páginas são comprimidas com zlib
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "pages.db")
+
+
+def compress(data: bytes) -> tuple:
+    """(codec, bytes comprimidos)"""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("página comprimida com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PageStore:
+    """Páginas de lojas já baixadas: validadores HTTP (ETag/Last-Modified) e o conteúdo já extraído
+
+    Guarda os campos que não dependem da busca (nome, endereço, telefone) e o texto da página
+    comprimido, para que as checagens por cor/modelo rodem sem baixar nem reanalisar o HTML.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.getenv("SCRAPING_PAGE_STORE_DB", DEFAULT_PATH)
+        self.max_entries = max_entries or int(os.getenv("SCRAPING_PAGE_STORE_MAX_ENTRIES", "5000"))
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fields TEXT NOT NULL,
+                    codec TEXT NOT NULL,
+                    text BLOB NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Página salva: campos extraídos + text, etag, last_modified e fetched_at"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT etag, last_modified, fields, codec, text, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, fields, codec, text, fetched_at = row
+        try:
+            page = json.loads(fields)
+            page["text"] = decompress(codec, text).decode("utf-8")
+        except (ValueError, zlib.error) as e:
+            logger.warning(f"Página salva ilegível ({url}): {e}")
+            return None
+        page.update({"etag": etag, "last_modified": last_modified, "fetched_at": fetched_at})
+        return page
+
+    def put(self, url: str, page: Dict, etag: Optional[str], last_modified: Optional[str]):
+        fields = {key: value for key, value in page.items()
+                  if key not in ("text", "etag", "last_modified", "fetched_at")}
+        codec, text = compress(page["text"].encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, json.dumps(fields), codec, text, now, now)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune(conn)
+            conn.commit()
+
+    def touch(self, url: str):
+        """Página revalidada (304): conta como baixada agora"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            conn.commit()
+
+    def _prune(self, conn: sqlite3.Connection):
+        conn.execute('''
+            DELETE FROM pages WHERE url NOT IN (
+                SELECT url FROM pages ORDER BY accessed_at DESC LIMIT ?
+            )
+        ''', (self.max_entries,))
+
+    @staticmethod
+    def validators(page: Optional[Dict]) -> Dict[str, str]:
+        """Cabeçalhos da requisição condicional para revalidar a página"""
+        headers = {}
+        if page and page.get("etag"):
+            headers["If-None-Match"] = page["etag"]
+        if page and page.get("last_modified"):
+            headers["If-Modified-Since"] = page["last_modified"]
+        return headers
@@ -0,0 +1,245 @@
+import asyncio
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services.color_match_service import rgb_to_lab
+
+# Pillow é opcional (sem ele o endpoint de foto responde 503) e só é importado nos
+# processos do pool, que são os únicos que decodificam imagens
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+logger = logging.getLogger(__name__)
+
+# Pixels estourados (reflexo) e muito escuros (sombra) não dizem nada sobre a tinta
+CLIPPED_CHANNEL = 250
+MIN_LIGHTNESS = 8.0
+# Além dos limites fixos, descarta as pontas de luminosidade da própria foto
+SHADOW_PERCENTILE = 10
+HIGHLIGHT_PERCENTILE = 95
+# Se a máscara sobrar com menos que isso, usa a foto inteira
+MIN_MASKED_FRACTION = 0.05
+
+KMEANS_ITERATIONS = 20
+# Variação máxima dos centros (ΔE) para considerar que o k-means convergiu
+KMEANS_TOLERANCE = 0.5
+
+
+class PhotoError(ValueError):
+    """Imagem recusada (formato desconhecido, corrompida ou grande demais)"""
+
+
+class PhotoBusy(RuntimeError):
+    """Fila de fotos cheia: o cliente deve tentar de novo"""
+
+
+def load_pixels(data: bytes, max_side: int, max_pixels: int, crop: float = 1.0) -> np.ndarray:
+    """Decodifica a foto já reduzida e devolve os pixels (N, 3) uint8 do recorte central
+
+    No JPEG, o draft faz o decodificador entregar a imagem em 1/2, 1/4 ou 1/8 da resolução
+    direto da DCT, então uma foto de 12 MP nunca é decodificada por inteiro.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        raise PhotoError("Formato de imagem não reconhecido")
+
+    # Image.open só leu o cabeçalho: recusa antes de gastar memória com bombas de descompressão
+    if image.width * image.height > max_pixels:
+        raise PhotoError(f"Imagem grande demais ({image.width}x{image.height})")
+
+    image.draft("RGB", (max_side, max_side))
+    try:
+        image = image.convert("RGB")
+    except OSError as e:
+        raise PhotoError(f"Imagem corrompida: {e}")
+    image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    pixels = np.asarray(image)
+    if crop < 1.0:
+        height, width = pixels.shape[:2]
+        top = int(height * (1 - crop) / 2)
+        left = int(width * (1 - crop) / 2)
+        pixels = pixels[top:height - top, left:width - left]
+    return pixels.reshape(-1, 3)
+
+
+def paint_mask(pixels: np.ndarray, lab: np.ndarray) -> np.ndarray:
+    """Pixels que representam a tinta: sem canal estourado, sem sombra e fora das pontas de L*"""
+    lightness = lab[:, 0]
+    low, high = np.percentile(lightness, (SHADOW_PERCENTILE, HIGHLIGHT_PERCENTILE))
+    mask = (
+        (pixels.max(axis=1) < CLIPPED_CHANNEL)
+        & (lightness > MIN_LIGHTNESS)
+        & (lightness >= low)
+        & (lightness <= high)
+    )
+    if mask.mean() < MIN_MASKED_FRACTION:
+        return np.ones(len(pixels), dtype=bool)
+    return mask
+
+
+def kmeans(points: np.ndarray, k: int, rng: np.random.Generator,
+           iterations: int = KMEANS_ITERATIONS) -> Tuple[np.ndarray, np.ndarray]:
+    """k-means vetorizado (inicialização k-means++); devolve (centros (k, 3), rótulos (N,))"""
+    k = min(k, len(points))
+    centers = np.empty((k, points.shape[1]))
+    centers[0] = points[rng.integers(len(points))]
+    closest = np.sum((points - centers[0]) ** 2, axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers[i] = points[index]
+        closest = np.minimum(closest, np.sum((points - centers[i]) ** 2, axis=1))
+
+    squared_norms = np.sum(points ** 2, axis=1)
+    labels = np.zeros(len(points), dtype=np.int64)
+    for _ in range(iterations):
+        # |p - c|² = |p|² - 2p·c + |c|²: uma multiplicação de matrizes por iteração
+        distances = squared_norms[:, None] - 2 * points @ centers.T + np.sum(centers ** 2, axis=1)
+        labels = distances.argmin(axis=1)
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=points[:, c], minlength=k)
+                         for c in range(points.shape[1])], axis=1)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+
+        shift = np.max(np.sqrt(np.sum((updated - centers) ** 2, axis=1)))
+        centers = updated
+        if shift < KMEANS_TOLERANCE:
+            break
+    return centers, labels
+
+
+def extract_dominant_colors(data: bytes, k: int, crop: float, max_side: int, max_pixels: int,
+                            sample: int, seed: int = 0) -> Dict:
+    """Cores dominantes da foto (roda no pool de processos)
+
+    Devolve {"colors": [{"rgb", "lab", "share"}], "pixels": usados, "masked": fração descartada},
+    com as cores da mais para a menos presente.
+    """
+    pixels = load_pixels(data, max_side, max_pixels, crop)
+    if len(pixels) == 0:
+        raise PhotoError("Imagem vazia")
+
+    rng = np.random.default_rng(seed)
+    # Amostra de tamanho fixo: o custo do k-means não depende da foto
+    if len(pixels) > sample:
+        pixels = pixels[rng.choice(len(pixels), sample, replace=False)]
+
+    lab = rgb_to_lab(pixels)
+    mask = paint_mask(pixels, lab)
+    pixels, lab = pixels[mask], lab[mask]
+
+    centers, labels = kmeans(lab, k, rng)
+    counts = np.bincount(labels, minlength=len(centers))
+
+    colors = []
+    for cluster in np.argsort(-counts):
+        if counts[cluster] == 0:
+            continue
+        # Cor exibida: média dos pixels do grupo em RGB (o centro Lab é usado na busca)
+        mean_rgb = np.rint(pixels[labels == cluster].mean(axis=0)).astype(int)
+        colors.append({
+            "rgb": "#{:02X}{:02X}{:02X}".format(*mean_rgb),
+            "lab": [round(float(v), 2) for v in centers[cluster]],
+            "share": round(float(counts[cluster] / len(labels)), 4),
+        })
+    return {"colors": colors, "pixels": int(len(labels)), "masked": round(float(1 - mask.mean()), 4)}
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class PhotoColorService:
+    """Extração de cores de fotos num pool de processos, com fila e tempo limitados
+
+    A latência fica previsível porque cada etapa tem teto: bytes do upload, pixels do
+    cabeçalho, tamanho decodificado (draft + thumbnail), amostra do k-means e iterações.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv("PHOTO_WORKERS", str(min(os.cpu_count() or 1, 2))))
+        self.max_bytes = int(os.getenv("PHOTO_MAX_BYTES", str(15 * 1024 * 1024)))
+        self.max_pixels = int(os.getenv("PHOTO_MAX_PIXELS", "50000000"))
+        self.max_side = int(os.getenv("PHOTO_MAX_SIDE", "256"))
+        self.sample = int(os.getenv("PHOTO_SAMPLE_PIXELS", "20000"))
+        self.timeout = float(os.getenv("PHOTO_TIMEOUT_SECONDS", "5"))
+        # Fotos na fila + em processamento; acima disso o endpoint responde 503
+        self.max_pending = int(os.getenv("PHOTO_MAX_PENDING", str(self.workers * 4)))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return PILLOW_AVAILABLE
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: o fork de um processo com event loop e threads pode herdar locks presos
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def warm_up(self):
+        """Sobe os processos do pool antes da primeira foto (o spawn leva centenas de ms)"""
+        if not self.available or self.workers <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            pids = await asyncio.gather(*(loop.run_in_executor(pool, _ping) for _ in range(self.workers)))
+            logger.info(f"📷 Pool de fotos pronto: {len(set(pids))} processos")
+        except Exception as e:
+            logger.warning(f"Não foi possível iniciar o pool de fotos: {e}")
+
+    def _release(self, future):
+        # Chamado na thread do pool
+        with self._pending_lock:
+            self._pending -= 1
+
+    async def dominant_colors(self, data: bytes, k: int = 3, crop: float = 1.0) -> Dict:
+        """Cores dominantes da foto; PhotoBusy com a fila cheia, TimeoutError acima do limite"""
+        if self._pending >= self.max_pending:
+            raise PhotoBusy("Muitas fotos em processamento")
+
+        try:
+            future = self._get_pool().submit(
+                extract_dominant_colors, data, k, crop, self.max_side, self.max_pixels, self.sample
+            )
+        except BrokenProcessPool:
+            # Um processo morreu (ex.: falta de memória) e o pool não aceita mais tarefas
+            self._pool = None
+            raise
+        with self._pending_lock:
+            self._pending += 1
+        # A vaga só é liberada quando o processo termina, mesmo que a requisição já tenha desistido
+        # (no timeout, uma foto ainda na fila é cancelada; uma em execução vai até o fim)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+
+# Instância global
+photo_color_service = PhotoColorService()
@@ -1,19 +1,80 @@
-import requests
-from bs4 import BeautifulSoup
-from googlesearch import search
+import asyncio
+import logging
+import os
+import sqlite3
 import time
+from bs4 import BeautifulSoup
 import re
-from typing import List, Dict, Optional
-import random
+from typing import Callable, List, Dict, Optional
+
+from services.fetch_service import fetch_service
+from services.cache_service import TTLCache, make_key
+from services.metrics_service import count_error, timed
+from services.page_store import PageStore
+from services.single_flight import SingleFlight
+
+# lxml é bem mais rápido que o html.parser puro-Python; usado quando instalado
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ModuleNotFoundError:
+    HTML_PARSER = 'html.parser'
+
+logger = logging.getLogger(__name__)
+
+# Configurável para apontar para um buscador local (benchmarks)
+GOOGLE_SEARCH_URL = os.getenv("SCRAPING_SEARCH_URL", "https://www.google.com/search")
+
+# Padrões compilados uma única vez (na ordem de prioridade)
+ADDRESS_PATTERNS = [
+    re.compile(r'Rua\s+[\w\s]+\s*,\s*\d+[\s\w]*,\s*[\w\s]+-\s*[\w\s]+,?\s*CEP?\s*\d{5}-?\d{3}', re.IGNORECASE),
+    re.compile(r'Av\.?\s+[\w\s]+\s*,\s*\d+[\s\w]*,\s*[\w\s]+-\s*[\w\s]+,?\s*CEP?\s*\d{5}-?\d{3}', re.IGNORECASE),
+]
+PHONE_PATTERN = re.compile(r'\(?\d{2}\)?\s?\d{4,5}-\d{4}')
+PRODUCT_KEYWORDS = ('tinta', 'automotiva', 'pintura', 'cor', 'color', 'verniz')
+SHIPPING_KEYWORDS = (
+    'entregamos', 'frete', 'envio', 'entrega', 'shipping', 'enviamos',
+    'todo brasil', 'todo o país', 'nacional'
+)
 
 class AutomotiveScrapingService:
-    def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+    def __init__(self, fetcher=fetch_service, store_registry=None, page_store=None):
+        self.fetcher = fetcher
+        # Cadastro de lojas físicas: recebe cada loja extraída e fornece as coordenadas reais
+        self.store_registry = store_registry
+        # Prazo total de uma busca; o que não terminar até lá é descartado
+        self.search_deadline = float(os.getenv("SCRAPING_DEADLINE_SECONDS", "20"))
+        
+        self.single_flight = SingleFlight("scraping", copy_result=True)
+        
+        # Cache de resultados por busca e de dados extraídos por URL
+        cache_path = os.getenv("SCRAPING_CACHE_DB") or None
+        max_entries = int(os.getenv("SCRAPING_CACHE_MAX_ENTRIES", "1000"))
+        self.search_cache = TTLCache(
+            "search",
+            ttl=float(os.getenv("SCRAPING_SEARCH_TTL_SECONDS", "3600")),
+            max_entries=max_entries,
+            disk_path=cache_path
+        )
+        self.store_cache = TTLCache(
+            "store",
+            ttl=float(os.getenv("SCRAPING_STORE_TTL_SECONDS", "86400")),
+            max_entries=max_entries * 5,
+            disk_path=cache_path
+        )
+        
+        # Páginas já baixadas (validadores + conteúdo extraído) para requisições condicionais
+        self.page_store = page_store if page_store is not None else PageStore()
+        # Páginas baixadas há menos tempo que isso são reaproveitadas sem nem revalidar
+        self.page_fresh_seconds = float(os.getenv("SCRAPING_PAGE_FRESH_SECONDS", "600"))
+        self.revalidated = 0
     
-    def search_automotive_stores(self, color_name: str, car_model: str, location: Optional[Dict] = None) -> List[Dict]:
-        """Busca lojas físicas de tintas automotivas"""
+    async def search_automotive_stores(self, color_name: str, car_model: str, location: Optional[Dict] = None,
+                                       on_store: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Busca lojas físicas de tintas automotivas
+        
+        on_store, se informado, é chamado para cada loja assim que ela é extraída.
+        """
         base_queries = [
             f'loja tinta automotiva "{color_name}" "{car_model}"',
             f'pintura automotiva "{car_model}" loja',
@@ -25,143 +86,287 @@ class AutomotiveScrapingService:
         else:
             queries = base_queries
         
-        all_stores = []
+        city = location.get('city') if location else None
+        cache_key = make_key("physical", color_name, car_model, city)
         
-        for query in queries:
-            try:
-                stores = self._search_google_stores(query, color_name, car_model, location)
-                all_stores.extend(stores)
-                time.sleep(1)
-            except Exception as e:
-                print(f"Erro na busca: {query} - {e}")
-        
-        # Remove duplicatas
-        seen_urls = set()
-        unique_stores = []
+        async def compute() -> List[Dict]:
+            cached = await self.search_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            stores = await self._run_queries(
+                queries,
+                lambda url: self.extract_store_info(url, color_name, car_model),
+                on_store=notify
+            )
+            stores = self._unique_by_url(stores)[:8]
+            if stores:
+                await self.search_cache.set(cache_key, stores)
+            return stores
         
-        for store in all_stores:
-            if store['url'] not in seen_urls:
-                seen_urls.add(store['url'])
-                unique_stores.append(store)
+        emitted = set()
         
-        return unique_stores[:8]
-    
-    def _search_google_stores(self, query: str, color_name: str, car_model: str, location: Optional[Dict]) -> List[Dict]:
-        """Busca específica no Google"""
-        stores = []
+        def notify(store: Dict):
+            if on_store and store["url"] not in emitted:
+                emitted.add(store["url"])
+                on_store(dict(store))
         
-        try:
-            for url in search(query, num_results=3, lang='pt-br'):
-                store_data = self.extract_store_info(url, color_name, car_model)
-                if store_data:
-                    if location:
-                        store_data.update({
-                            "lat": location["lat"] + random.uniform(-0.05, 0.05),
-                            "lng": location["lng"] + random.uniform(-0.05, 0.05)
-                        })
-                    stores.append(store_data)
-                    
-        except Exception as e:
-            print(f"Erro Google search: {e}")
-            
+        # Buscas idênticas simultâneas (mesma cor/modelo/cidade) compartilham uma execução;
+        # quem não executou a busca (cache ou coalescido) recebe as lojas ao final
+        stores = await self.single_flight.do(cache_key, compute)
+        for store in stores:
+            notify(store)
         return stores
     
-    def extract_store_info(self, url: str, color_name: str, car_model: str) -> Optional[Dict]:
-        """Extrai informações da loja física"""
-        try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            store_name = self._extract_store_name(soup, url)
-            address = self._extract_address(soup)
-            phone = self._extract_phone(soup)
-            
-            has_product = self._check_product_availability(soup, color_name, car_model)
-            
-            if store_name:
-                return {
-                    "name": store_name,
-                    "url": url,
-                    "address": address,
-                    "phone": phone,
-                    "has_product": has_product,
-                    "product_match": f"{color_name} - {car_model}",
-                    "type": "physical"
-                }
-                
-        except Exception as e:
-            print(f"Erro scraping {url}: {e}")
-            
-        return None
-    
-    def search_online_stores(self, color_code: str, car_model: str, user_cep: str = None) -> List[Dict]:
-        """Busca lojas online"""
+    async def search_online_stores(self, color_code: str, car_model: str, user_cep: str = None,
+                                   on_store: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Busca lojas online (on_store: ver search_automotive_stores)"""
         queries = [
             f'comprar tinta automotiva "{color_code}" "{car_model}" online',
             f'tinta "{color_code}" "{car_model}" venda online',
         ]
         
-        all_stores = []
+        # O resultado online não depende da cidade do usuário
+        cache_key = make_key("online", color_code, car_model)
+        emitted = set()
         
-        for query in queries:
-            try:
-                stores = self._search_google_online(query, color_code, car_model, user_cep)
-                all_stores.extend(stores)
-                time.sleep(1)
-            except Exception as e:
-                print(f"Erro busca online: {query} - {e}")
+        def notify(store: Dict):
+            if on_store and store["url"] not in emitted:
+                emitted.add(store["url"])
+                on_store(dict(store))
         
-        # Remove duplicatas
-        seen_urls = set()
-        unique_stores = []
+        async def compute() -> List[Dict]:
+            cached = await self.search_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            stores = await self._run_queries(
+                queries,
+                lambda url: self.extract_online_store_info(url, color_code, car_model, user_cep),
+                on_store=notify
+            )
+            stores = self._unique_by_url(stores)[:6]
+            if stores:
+                await self.search_cache.set(cache_key, stores)
+            return stores
         
-        for store in all_stores:
-            if store['url'] not in seen_urls:
-                seen_urls.add(store['url'])
-                unique_stores.append(store)
+        unique_stores = await self.single_flight.do(cache_key, compute)
+        for store in unique_stores:
+            notify(store)
+        return unique_stores
+    
+    async def _run_queries(self, queries: List[str], extract,
+                           on_store: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Executa todas as buscas e extrações em paralelo, respeitando o prazo total"""
+        deadline = asyncio.get_running_loop().time() + self.search_deadline
+        url_lists = await self._gather_until_deadline(
+            [self._google_search(query) for query in queries], deadline
+        )
+        
+        # Mantém a ordem das buscas/resultados, como na versão sequencial
+        urls = []
+        for url_list in url_lists:
+            for url in url_list or []:
+                if url not in urls:
+                    urls.append(url)
         
-        return unique_stores[:6]
+        async def extract_and_notify(url: str) -> Optional[Dict]:
+            store = await extract(url)
+            if store and on_store:
+                on_store(store)
+            return store
+        
+        stores = await self._gather_until_deadline([extract_and_notify(url) for url in urls], deadline)
+        return [store for store in stores if store]
     
-    def _search_google_online(self, query: str, color_code: str, car_model: str, user_cep: str) -> List[Dict]:
-        """Busca específica para lojas online"""
-        stores = []
+    async def _gather_until_deadline(self, coros, deadline: float) -> List:
+        """Como asyncio.gather, mas cancela o que passar do prazo (resultado None)"""
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        if not tasks:
+            return []
         
-        try:
-            for url in search(query, num_results=3, lang='pt-br'):
-                store_data = self.extract_online_store_info(url, color_code, car_model, user_cep)
-                if store_data:
-                    stores.append(store_data)
-                    
-        except Exception as e:
-            print(f"Erro Google online: {e}")
+        timeout = max(0.0, deadline - asyncio.get_running_loop().time())
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        
+        results = []
+        for task in tasks:
+            if task in done and not task.cancelled() and task.exception() is None:
+                results.append(task.result())
+            else:
+                if task in done and not task.cancelled():
+                    logger.warning(f"Erro na busca: {task.exception()!r}")
+                    count_error("search", type(task.exception()).__name__)
+                results.append(None)
+        return results
+    
+    async def _google_search(self, query: str, num_results: int = 3, lang: str = 'pt-br') -> List[str]:
+        """Busca no Google e retorna as URLs dos primeiros resultados"""
+        with timed("search"):
+            body = await self.fetcher.fetch(
+                GOOGLE_SEARCH_URL,
+                params={"q": query, "num": num_results + 2, "hl": lang}
+            )
+            if not body:
+                logger.warning(f"Erro Google search: sem resposta para {query}")
+                count_error("search", "no_response")
+                return []
             
-        return stores
+            return await asyncio.to_thread(self._parse_google_results, body, num_results)
+    
+    def _parse_google_results(self, body: bytes, num_results: int) -> List[str]:
+        """Extrai links orgânicos da página de resultados do Google"""
+        soup = BeautifulSoup(body, HTML_PARSER)
+        urls = []
+        
+        for result in soup.find_all('div', attrs={'class': 'g'}):
+            link = result.find('a', href=True)
+            if link and result.find('h3') and link['href'].startswith('http'):
+                urls.append(link['href'])
+                if len(urls) >= num_results:
+                    break
+        
+        return urls
+    
+    async def extract_store_info(self, url: str, color_name: str, car_model: str) -> Optional[Dict]:
+        """Extrai informações da loja física"""
+        cache_key = make_key("physical", url, color_name, car_model)
+        store = await self.store_cache.get(cache_key)
+        if store is not None:
+            return store
+        
+        page = await self._load_page(url)
+        if page is None:
+            return None
+        store = self._build_store(page, url, color_name, car_model)
+        if store:
+            if self.store_registry is not None:
+                # Coordenadas vêm do CEP do endereço (lojas sem CEP ficam sem posição)
+                store = await self.store_registry.add_async(store, color_name, car_model)
+            await self.store_cache.set(cache_key, store)
+        return store
+    
+    def _build_store(self, page: Dict, url: str, color_name: str, car_model: str) -> Optional[Dict]:
+        """Monta a loja física a partir da página já analisada"""
+        if not page["name"]:
+            return None
+        return {
+            "name": page["name"],
+            "url": url,
+            "address": page["address"],
+            "phone": page["phone"],
+            "has_product": self._check_product_availability(page["text"], color_name, car_model),
+            "product_match": f"{color_name} - {car_model}",
+            "type": "physical"
+        }
     
-    def extract_online_store_info(self, url: str, color_code: str, car_model: str, cep: str) -> Optional[Dict]:
+    async def extract_online_store_info(self, url: str, color_code: str, car_model: str, cep: str) -> Optional[Dict]:
         """Extrai informações de lojas online"""
+        cache_key = make_key("online", url, color_code, car_model)
+        store = await self.store_cache.get(cache_key)
+        if store is not None:
+            return store
+        
+        page = await self._load_page(url)
+        if page is None:
+            return None
+        store = self._build_online_store(page, url, color_code, car_model, cep)
+        if store:
+            await self.store_cache.set(cache_key, store)
+        return store
+    
+    def _build_online_store(self, page: Dict, url: str, color_code: str, car_model: str, cep: str) -> Optional[Dict]:
+        """Monta a loja online a partir da página já analisada"""
+        ships_to_cep = self._check_shipping(page["text"], cep)
+        has_product = self._check_product_availability(page["text"], color_code, car_model)
+        
+        if page["name"] and (has_product or ships_to_cep):
+            return {
+                "name": page["name"],
+                "url": url,
+                "type": "online",
+                "ships_to_cep": ships_to_cep,
+                "has_product": has_product,
+                "product_match": f"{color_code} - {car_model}"
+            }
+        return None
+    
+    async def _load_page(self, url: str) -> Optional[Dict]:
+        """Página analisada (nome, endereço, telefone e texto em minúsculas)
+        
+        Páginas já vistas são revalidadas com If-None-Match/If-Modified-Since: um 304
+        reaproveita o conteúdo salvo sem baixar nem analisar o HTML de novo.
+        """
+        stored = None
+        if self.page_store is not None:
+            try:
+                stored = await asyncio.to_thread(self.page_store.get, url)
+            except sqlite3.Error as e:
+                logger.warning(f"Erro lendo página salva {url}: {e}")
+                count_error("page_store", "sqlite")
+            if stored and time.time() - stored["fetched_at"] < self.page_fresh_seconds:
+                return stored
+        
+        if not await self.fetcher.allowed_by_robots(url):
+            return None
+        
+        status, body, headers = await self.fetcher.request(url, headers=PageStore.validators(stored))
+        if status == 304 and stored:
+            self.revalidated += 1
+            try:
+                await asyncio.to_thread(self.page_store.touch, url)
+            except sqlite3.Error as e:
+                # O conteúdo continua válido; só a data da revalidação não foi gravada
+                logger.warning(f"Erro atualizando página salva {url}: {e}")
+                count_error("page_store", "sqlite")
+            return stored
+        if body is None:
+            # Sem resposta (rede/circuito aberto): a versão salva é melhor que nada
+            return stored if status is None else None
+        
+        page = await asyncio.to_thread(self._parse_page, body, url)
+        if page is not None and self.page_store is not None:
+            try:
+                await asyncio.to_thread(self.page_store.put, url, page, headers.get("ETag"), headers.get("Last-Modified"))
+            except sqlite3.Error as e:
+                logger.warning(f"Erro salvando página {url}: {e}")
+                count_error("page_store", "sqlite")
+        return page
+    
+    def _parse_page(self, body: bytes, url: str) -> Optional[Dict]:
+        """Analisa o HTML uma única vez (CPU - roda fora do event loop)"""
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            store_name = self._extract_store_name(soup, url)
-            ships_to_cep = self._check_shipping(soup, cep)
-            has_product = self._check_product_availability(soup, color_code, car_model)
+            with timed("parse"):
+                soup = BeautifulSoup(body, HTML_PARSER)
+                text = soup.get_text()
             
-            if store_name and (has_product or ships_to_cep):
+            with timed("extract"):
                 return {
-                    "name": store_name,
-                    "url": url,
-                    "type": "online",
-                    "ships_to_cep": ships_to_cep,
-                    "has_product": has_product,
-                    "product_match": f"{color_code} - {car_model}"
+                    "name": self._extract_store_name(soup, url),
+                    "address": self._extract_address(text),
+                    "phone": self._extract_phone(text),
+                    "text": text.lower()
                 }
                 
         except Exception as e:
-            print(f"Erro scraping online {url}: {e}")
+            logger.exception(f"Erro scraping {url}: {e}")
+            count_error("parse", type(e).__name__)
             
         return None
     
+    def _unique_by_url(self, stores: List[Dict]) -> List[Dict]:
+        """Remove duplicatas mantendo a primeira ocorrência"""
+        seen_urls = set()
+        unique_stores = []
+        
+        for store in stores:
+            if store['url'] not in seen_urls:
+                seen_urls.add(store['url'])
+                unique_stores.append(store)
+        
+        return unique_stores
+    
     def _extract_store_name(self, soup, url: str) -> str:
         """Extrai nome da loja"""
         title = soup.find('title')
@@ -177,59 +382,29 @@ class AutomotiveScrapingService:
         domain = url.split('//')[-1].split('/')[0]
         return domain.replace('www.', '').split('.')[0].title()
     
-    def _extract_address(self, soup) -> str:
-        """Extrai endereço do site"""
-        text = soup.get_text()
-        
-        address_patterns = [
-            r'Rua\s+[\w\s]+\s*,\s*\d+[\s\w]*,\s*[\w\s]+-\s*[\w\s]+,?\s*CEP?\s*\d{5}-?\d{3}',
-            r'Av\.?\s+[\w\s]+\s*,\s*\d+[\s\w]*,\s*[\w\s]+-\s*[\w\s]+,?\s*CEP?\s*\d{5}-?\d{3}',
-        ]
-        
-        for pattern in address_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+    def _extract_address(self, text: str) -> str:
+        """Extrai endereço do texto da página"""
+        for pattern in ADDRESS_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group().strip()
                 
         return ""
     
-    def _extract_phone(self, soup) -> str:
-        """Extrai telefone do site"""
-        text = soup.get_text()
-        
-        phone_patterns = [
-            r'\(?\d{2}\)?\s?\d{4,5}-\d{4}',
-            r'\(?\d{2}\)?\s?\d{5}-\d{4}',
-        ]
-        
-        for pattern in phone_patterns:
-            matches = re.findall(pattern, text)
-            if matches:
-                return matches[0]
-                
-        return ""
+    def _extract_phone(self, text: str) -> str:
+        """Extrai telefone do texto da página"""
+        match = PHONE_PATTERN.search(text)
+        return match.group() if match else ""
     
-    def _check_product_availability(self, soup, color_name: str, car_model: str) -> bool:
-        """Verifica se o site menciona o produto"""
-        text = soup.get_text().lower()
-        color_lower = color_name.lower()
-        model_lower = car_model.lower()
+    def _check_product_availability(self, text_lower: str, color_name: str, car_model: str) -> bool:
+        """Verifica se o site menciona o produto (texto já em minúsculas)"""
+        color_mentions = color_name.lower() in text_lower
+        model_mentions = car_model.lower() in text_lower
         
-        color_mentions = color_lower in text
-        model_mentions = model_lower in text
-        
-        keywords = ['tinta', 'automotiva', 'pintura', 'cor', 'color', 'verniz']
-        has_keywords = any(keyword in text for keyword in keywords)
-        
-        return (color_mentions or model_mentions) and has_keywords
+        if not (color_mentions or model_mentions):
+            return False
+        return any(keyword in text_lower for keyword in PRODUCT_KEYWORDS)
     
-    def _check_shipping(self, soup, cep: str) -> bool:
-        """Verifica se entrega no CEP"""
-        text = soup.get_text().lower()
-        
-        shipping_keywords = [
-            'entregamos', 'frete', 'envio', 'entrega', 'shipping', 'enviamos',
-            'todo brasil', 'todo o país', 'nacional'
-        ]
-        
-        return any(keyword in text for keyword in shipping_keywords)
\ No newline at end of file
+    def _check_shipping(self, text_lower: str, cep: str) -> bool:
+        """Verifica se entrega no CEP (texto já em minúsculas)"""
+        return any(keyword in text_lower for keyword in SHIPPING_KEYWORDS)
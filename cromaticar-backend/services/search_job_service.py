@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+from models.schemas import AutomotiveSearchRequest, StoreResult
+from services.cache_service import make_key
+from services.lazy_service import store_search
+
+logger = logging.getLogger(__name__)
+
+
+class SearchJob:
+    """Uma busca de lojas rodando em segundo plano, com resultados parciais"""
+
+    def __init__(self, key: str, request: AutomotiveSearchRequest):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.request = request
+        self.status = "queued"  # queued → running → done | error
+        self.partial_results: List[StoreResult] = []
+        self.results: Optional[List[StoreResult]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._seen_urls = set()
+        self._waiter: Optional[asyncio.Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def add_result(self, result: StoreResult):
+        if result.url in self._seen_urls:
+            return
+        self._seen_urls.add(result.url)
+        self.partial_results.append(result)
+        self._notify()
+
+    def set_status(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        if self.finished:
+            self.finished_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Espera um novo resultado ou mudança de status; False em timeout"""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waiter), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self, since: int = 0) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "partial_results": [r.model_dump() for r in self.partial_results[since:]],
+            "results": [r.model_dump() for r in self.results] if self.results is not None else None,
+            "error": self.error,
+        }
+
+    async def events(self, keepalive: float = 15.0) -> AsyncIterator[Dict]:
+        """Eventos incrementais: uma loja por evento e, no fim, 'done' ou 'error'"""
+        sent = 0
+        while True:
+            while sent < len(self.partial_results):
+                yield {"type": "store", "store": self.partial_results[sent].model_dump()}
+                sent += 1
+
+            if self.status == "done":
+                yield {"type": "done", "results": [r.model_dump() for r in self.results or []]}
+                return
+            if self.status == "error":
+                yield {"type": "error", "detail": self.error}
+                return
+
+            if not await self.wait_for_change(keepalive):
+                yield {"type": "keepalive", "status": self.status}
+
+
+class SearchJobService:
+    """Fila de buscas de lojas com concorrência limitada e deduplicação das buscas em andamento"""
+
+    def __init__(self):
+        self.max_concurrent = int(os.getenv("STORE_SEARCH_MAX_JOBS", "4"))
+        self.retention = float(os.getenv("STORE_SEARCH_JOB_RETENTION_SECONDS", "300"))
+        self._jobs: Dict[str, SearchJob] = {}
+        self._in_flight: Dict[str, SearchJob] = {}
+        self._tasks = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @staticmethod
+    def request_key(request: AutomotiveSearchRequest) -> str:
+        """Buscas com os mesmos parâmetros efetivos compartilham o mesmo job"""
+        lat = f"{request.user_lat:.3f}" if request.user_lat is not None else None
+        lng = f"{request.user_lng:.3f}" if request.user_lng is not None else None
+        return make_key(request.color_name, request.color_code, request.car_model,
+                        request.user_cep, lat, lng)
+
+    def submit(self, request: AutomotiveSearchRequest) -> SearchJob:
+        """Cria (ou reaproveita, se idêntica e em andamento) uma busca em segundo plano"""
+        self._purge_expired()
+
+        key = self.request_key(request)
+        job = self._in_flight.get(key)
+        if job is not None:
+            return job
+
+        job = SearchJob(key, request)
+        self._jobs[job.id] = job
+        self._in_flight[key] = job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[SearchJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: SearchJob):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        try:
+            async with self._semaphore:
+                job.set_status("running")
+                store_search_service = await store_search.load()
+                job.results = await store_search_service.search(job.request, on_result=job.add_result)
+                job.set_status("done")
+        except Exception as e:
+            logger.error(f"Erro no job de busca {job.id}: {e}")
+            job.set_status("error", f"Erro na busca: {str(e)}")
+        finally:
+            self._in_flight.pop(job.key, None)
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.retention
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def stop(self):
+        """Cancela os jobs em andamento (shutdown)"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Instância global
+search_job_service = SearchJobService()
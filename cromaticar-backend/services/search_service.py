@@ -0,0 +1,281 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.cache_service import normalize_key_part
+from services.catalog_service import catalog_service
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+KINDS = ("brand", "model", "color")
+KIND_ORDER = {kind: order for order, kind in enumerate(KINDS)}
+
+# Pesos de pontuação por tipo de casamento do termo
+EXACT_SCORE = 1.0
+PREFIX_BASE_SCORE = 0.6
+FUZZY_BASE_SCORE = 0.7
+FUZZY_MIN_SIMILARITY = 0.45
+MAX_PREFIX_TERMS = 100
+
+# Acima desta fração de documentos alterados, reconstruir é mais barato que aplicar o diff
+REBUILD_FRACTION = 0.2
+
+DocKey = Tuple[str, int]
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Tokens sem acento e em minúsculas"""
+    return TOKEN_PATTERN.findall(normalize_key_part(text))
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchDocument:
+    """Um item pesquisável (montadora, modelo ou cor) e seus tokens com peso"""
+
+    __slots__ = ("kind", "id", "label", "data", "tokens")
+
+    def __init__(self, kind: str, id: int, label: str, data: Dict, tokens: Dict[str, float]):
+        self.kind = kind
+        self.id = id
+        self.label = label
+        self.data = data
+        self.tokens = tokens
+
+    @property
+    def key(self) -> DocKey:
+        return self.kind, self.id
+
+    def signature(self) -> Tuple:
+        return self.label, tuple(sorted(self.tokens.items())), tuple(sorted(self.data.items(), key=str))
+
+
+def _weighted_tokens(*parts: Tuple[Optional[str], float]) -> Dict[str, float]:
+    tokens: Dict[str, float] = {}
+    for text, weight in parts:
+        for token in tokenize(text):
+            tokens[token] = max(tokens.get(token, 0.0), weight)
+    return tokens
+
+
+def documents_from_snapshot(snapshot) -> Dict[DocKey, SearchDocument]:
+    """Documentos de busca a partir do snapshot do catálogo"""
+    documents = {}
+
+    for brand in snapshot.brands:
+        doc = SearchDocument("brand", brand.id_montadora, brand.nome, brand.model_dump(),
+                             _weighted_tokens((brand.nome, 1.0)))
+        documents[doc.key] = doc
+
+    for model in snapshot.models.values():
+        brand = snapshot.brands_by_id.get(model.id_montadora)
+        # O nome da montadora ajuda em buscas como "vw gol", com peso menor
+        tokens = _weighted_tokens((brand.nome if brand else None, 0.5), (model.nome, 1.0))
+        doc = SearchDocument("model", model.id_modelo, model.nome, model.model_dump(), tokens)
+        documents[doc.key] = doc
+
+    for color in snapshot.colors.values():
+        compact_code = "".join(tokenize(color.codigo_cor))
+        tokens = _weighted_tokens((color.nome_cor, 1.0), (color.codigo_cor, 1.0), (compact_code, 1.0))
+        doc = SearchDocument("color", color.id_cor, color.nome_cor, color.model_dump(), tokens)
+        documents[doc.key] = doc
+
+    return documents
+
+
+class SearchIndex:
+    """Índice invertido com prefixos (vocabulário ordenado) e trigramas para erros de digitação"""
+
+    def __init__(self, documents: Iterable[SearchDocument] = ()):
+        self.documents: Dict[DocKey, SearchDocument] = {}
+        self.postings: Dict[str, Dict[DocKey, float]] = {}
+        self.trigram_terms: Dict[str, Set[str]] = {}
+        for doc in documents:
+            self._add(doc)
+        self.vocabulary: List[str] = sorted(self.postings)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _add(self, doc: SearchDocument) -> List[str]:
+        new_terms = []
+        self.documents[doc.key] = doc
+        for term, weight in doc.tokens.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                new_terms.append(term)
+                for gram in trigrams(term):
+                    self.trigram_terms.setdefault(gram, set()).add(term)
+            posting[doc.key] = weight
+        return new_terms
+
+    def _remove(self, key: DocKey) -> List[str]:
+        removed_terms = []
+        doc = self.documents.pop(key, None)
+        if doc is None:
+            return removed_terms
+        for term in doc.tokens:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(key, None)
+            if not posting:
+                del self.postings[term]
+                removed_terms.append(term)
+                for gram in trigrams(term):
+                    terms = self.trigram_terms.get(gram)
+                    if terms is not None:
+                        terms.discard(term)
+                        if not terms:
+                            del self.trigram_terms[gram]
+        return removed_terms
+
+    def diff(self, documents: Dict[DocKey, SearchDocument]) -> Tuple[List[SearchDocument], List[DocKey]]:
+        """Documentos novos/alterados e chaves removidas em relação ao índice atual (só leitura)"""
+        changed = [
+            doc for key, doc in documents.items()
+            if key not in self.documents or self.documents[key].signature() != doc.signature()
+        ]
+        removed = [key for key in self.documents if key not in documents]
+        return changed, removed
+
+    def apply(self, changed: List[SearchDocument], removed: List[DocKey]):
+        """Aplica um diff incremental, mantendo o vocabulário ordenado"""
+        dropped_terms: Set[str] = set()
+        new_terms: List[str] = []
+        for key in removed:
+            dropped_terms.update(self._remove(key))
+        for doc in changed:
+            dropped_terms.update(self._remove(doc.key))
+            new_terms.extend(self._add(doc))
+
+        dropped_terms -= set(self.postings)
+        if dropped_terms:
+            self.vocabulary = [term for term in self.vocabulary if term not in dropped_terms]
+        for term in new_terms:
+            position = bisect.bisect_left(self.vocabulary, term)
+            if position == len(self.vocabulary) or self.vocabulary[position] != term:
+                self.vocabulary.insert(position, term)
+
+    def _expand(self, token: str) -> Dict[str, float]:
+        """Termos do vocabulário que casam com o token: exato, prefixo ou aproximado"""
+        matches: Dict[str, float] = {}
+        if token in self.postings:
+            matches[token] = EXACT_SCORE
+
+        start = bisect.bisect_left(self.vocabulary, token)
+        for term in self.vocabulary[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            if term != token:
+                matches[term] = PREFIX_BASE_SCORE + 0.3 * len(token) / len(term)
+
+        # Tolerância a erros só quando o casamento exato/prefixo não resolveu
+        if len(token) >= 3 and token not in matches and len(matches) < 5:
+            token_grams = trigrams(token)
+            shared = Counter()
+            for gram in token_grams:
+                shared.update(self.trigram_terms.get(gram, ()))
+            for term, count in shared.items():
+                similarity = 2 * count / (len(token_grams) + len(term))
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    score = FUZZY_BASE_SCORE * similarity
+                    if score > matches.get(term, 0.0):
+                        matches[term] = score
+        return matches
+
+    def search(self, query: str, limit: int = 10, kinds: Optional[Set[str]] = None,
+               accept: Optional[Callable[[SearchDocument], bool]] = None) -> List[Tuple[SearchDocument, float]]:
+        """Busca ranqueada; todos os tokens da consulta precisam casar"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        scores: Optional[Dict[DocKey, float]] = None
+        for token in tokens:
+            token_scores: Dict[DocKey, float] = {}
+            for term, term_score in self._expand(token).items():
+                for key, weight in self.postings[term].items():
+                    if kinds is not None and key[0] not in kinds:
+                        continue
+                    score = term_score * weight
+                    if score > token_scores.get(key, 0.0):
+                        token_scores[key] = score
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {key: scores[key] + score for key, score in token_scores.items() if key in scores}
+            if not scores:
+                return []
+
+        candidates = (
+            (self.documents[key], score / len(tokens))
+            for key, score in scores.items()
+        )
+        if accept is not None:
+            candidates = ((doc, score) for doc, score in candidates if accept(doc))
+
+        return heapq.nlargest(
+            limit, candidates,
+            key=lambda item: (item[1], -KIND_ORDER[item[0].kind], -len(item[0].label))
+        )
+
+
+class SearchService:
+    """Mantém o índice de busca em sincronia com o snapshot do catálogo"""
+
+    def __init__(self):
+        self.index = SearchIndex()
+        self.version: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    def is_ready(self, snapshot) -> bool:
+        return self.version == snapshot.version
+
+    async def update(self, snapshot):
+        """Atualiza o índice para o snapshot: diff incremental ou reconstrução completa"""
+        async with self._lock:
+            if self.version == snapshot.version:
+                return
+            started = time.perf_counter()
+            documents = await asyncio.to_thread(documents_from_snapshot, snapshot)
+            changed, removed = await asyncio.to_thread(self.index.diff, documents)
+
+            if len(changed) + len(removed) > REBUILD_FRACTION * max(len(self.index), 1):
+                # Reconstrói fora do event loop e troca o índice de uma vez
+                self.index = await asyncio.to_thread(SearchIndex, documents.values())
+                mode = "reconstruído"
+            else:
+                # Diffs pequenos são aplicados no próprio loop (sem concorrência com as buscas)
+                self.index.apply(changed, removed)
+                mode = f"atualizado (+{len(changed)} -{len(removed)})"
+
+            self.version = snapshot.version
+            logger.info(
+                f"🔎 Índice de busca {mode}: {len(self.index)} itens "
+                f"em {time.perf_counter() - started:.2f}s"
+            )
+
+    def search(self, query: str, limit: int = 10, kinds: Optional[Set[str]] = None,
+               accept: Optional[Callable[[SearchDocument], bool]] = None) -> List[Dict]:
+        return [
+            {"type": doc.kind, "id": doc.id, "label": doc.label, "score": round(score, 4), "data": doc.data}
+            for doc, score in self.index.search(query, limit, kinds, accept)
+        ]
+
+
+# Instância global
+search_service = SearchService()
+catalog_service.add_listener(search_service.update)
@@ -0,0 +1,95 @@
+import asyncio
+import copy
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+# Quantas chaves guardar nas métricas por chave (as mais recentes)
+MAX_TRACKED_KEYS = 200
+
+
+class _Call:
+    """Execução compartilhada de uma chave e quantos chamadores ainda a aguardam"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce chamadas concorrentes idênticas: só a primeira executa, as demais aguardam o resultado"""
+
+    def __init__(self, name: str, copy_result: bool = False):
+        self.name = name
+        # Resultados mutáveis (listas de dicts) são copiados para cada chamador extra
+        self.copy_result = copy_result
+        self._in_flight: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self._per_key: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        _registry.append(self)
+
+    def _track(self, key: Hashable, coalesced: bool):
+        self.calls += 1
+        if coalesced:
+            self.coalesced += 1
+
+        label = str(key)[:200]
+        stats = self._per_key.get(label)
+        if stats is None:
+            stats = self._per_key[label] = {"calls": 0, "coalesced": 0}
+            while len(self._per_key) > MAX_TRACKED_KEYS:
+                self._per_key.popitem(last=False)
+        else:
+            self._per_key.move_to_end(label)
+        stats["calls"] += 1
+        if coalesced:
+            stats["coalesced"] += 1
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa fn() uma vez por chave em andamento e compartilha o resultado (ou a exceção)
+
+        fn() roda numa task própria que todos os chamadores aguardam com shield: cancelar um
+        deles (deadline, job cancelado, cliente que desconectou) não cancela os outros. A task só
+        é cancelada quando o último chamador desiste.
+        """
+        call = self._in_flight.get(key)
+        leader = call is None
+        self._track(key, coalesced=not leader)
+        if leader:
+            call = _Call(asyncio.create_task(fn()))
+            self._in_flight[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Ninguém mais espera o resultado; um chamador novo começa outra execução
+                self._forget(key, call)
+                call.task.cancel()
+        return copy.deepcopy(result) if self.copy_result and not leader else result
+
+    def _forget(self, key: Hashable, call: "_Call"):
+        if self._in_flight.get(key) is call:
+            del self._in_flight[key]
+
+    def stats(self, top: int = 10) -> Dict:
+        busiest = sorted(self._per_key.items(), key=lambda item: item[1]["coalesced"], reverse=True)
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "top_keys": [{"key": key, **stats} for key, stats in busiest[:top] if stats["coalesced"]],
+        }
+
+
+_registry: List[SingleFlight] = []
+
+
+def single_flight_stats() -> Dict[str, Dict]:
+    """Métricas de todos os grupos de single-flight (para o /health)"""
+    return {group.name: group.stats() for group in _registry}
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import json
+import os
+import stat
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+# flock só existe em sistemas Unix; sem ele cada worker carrega do banco por conta própria
+try:
+    import fcntl
+except ModuleNotFoundError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def default_shared_dir() -> str:
+    """Diretório privado do usuário do serviço em /dev/shm (memória compartilhada) ou no temporário
+
+    /dev/shm e /tmp são graváveis por todos; o arquivo fica num subdiretório 0700 nosso, que
+    SharedSnapshotStore confere antes de ler.
+    """
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    owner = os.geteuid() if hasattr(os, "geteuid") else "shared"
+    return os.path.join(base, f"cromaticar-{owner}")
+
+
+def _is_private(info: os.stat_result, allowed_bits: int) -> bool:
+    """Pertence a este usuário e não tem permissões além de allowed_bits para grupo/outros"""
+    if not hasattr(os, "geteuid"):
+        return True
+    return info.st_uid == os.geteuid() and not (info.st_mode & 0o077 & ~allowed_bits)
+
+
+class SharedSnapshotStore:
+    """Arquivo compartilhado entre os workers com os dados já carregados do banco
+
+    O primeiro worker que precisa dos dados consulta o banco e grava o arquivo; os demais
+    (e os que reiniciarem depois) leem o arquivo enquanto ele estiver dentro do prazo.
+    Os dados são JSON (nunca pickle) e só são lidos se o diretório e o arquivo forem do
+    usuário do serviço, sem escrita para outros usuários.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.lock_path = f"{path}.lock"
+
+    def _ensure_directory(self):
+        """Cria o diretório (0700) e recusa um que não seja privado (ex.: criado por outro usuário)"""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        info = os.lstat(self.directory)
+        if not stat.S_ISDIR(info.st_mode) or not _is_private(info, allowed_bits=0o055):
+            raise PermissionError(f"Diretório do snapshot compartilhado não é privado: {self.directory}")
+
+    def load(self, max_age: Optional[float]) -> Optional[Any]:
+        """Dados gravados há menos de max_age segundos (None: sem limite), ou None"""
+        try:
+            self._ensure_directory()
+            flags = os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0)
+            with open(os.open(self.path, flags), "rb") as file:
+                info = os.fstat(file.fileno())
+                if not stat.S_ISREG(info.st_mode) or not _is_private(info, allowed_bits=0o044):
+                    logger.warning(f"Snapshot compartilhado ignorado: dono ou permissões inesperados ({self.path})")
+                    return None
+                if max_age is not None and time.time() - info.st_mtime > max_age:
+                    return None
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Snapshot compartilhado ilegível ({self.path}): {e}")
+            return None
+
+    def save(self, data: Any):
+        """Grava de forma atômica (quem está lendo vê o arquivo antigo ou o novo)"""
+        self._ensure_directory()
+        # NamedTemporaryFile cria o arquivo com modo 0600
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.directory, delete=False) as file:
+            json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+            temporary = file.name
+        os.replace(temporary, self.path)
+
+    @asynccontextmanager
+    async def lock(self) -> AsyncIterator[None]:
+        """Trava entre processos: só um worker por vez consulta o banco; os outros esperam"""
+        if fcntl is None:
+            yield
+            return
+        try:
+            self._ensure_directory()
+        except OSError as e:
+            # Sem diretório privado não há arquivo compartilhado: cada worker usa o banco
+            logger.warning(f"Snapshot compartilhado desativado: {e}")
+            yield
+            return
+        with open(self.lock_path, "a") as file:
+            # A espera pela trava é bloqueante; fica numa thread para não parar o event loop
+            await asyncio.to_thread(fcntl.flock, file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.cache_service import make_key
+from services.location_service import EARTH_RADIUS_KM, haversine_km
+
+# KD-tree do scipy é opcional; sem ele a busca é força bruta vetorizada
+try:
+    from scipy.spatial import cKDTree
+except ModuleNotFoundError:
+    cKDTree = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "stores.db")
+
+CEP_PATTERN = re.compile(r'\b(\d{5})-?(\d{3})\b')
+
+STORE_FIELDS = ("url", "name", "address", "phone", "cep", "lat", "lng", "last_seen")
+
+
+def extract_cep(text: Optional[str]) -> Optional[str]:
+    """Primeiro CEP (00000-000) encontrado no texto"""
+    match = CEP_PATTERN.search(text or "")
+    return f"{match.group(1)}-{match.group(2)}" if match else None
+
+
+def _unit_vectors(lats, lngs) -> np.ndarray:
+    """Coordenadas como vetores unitários 3D: distância euclidiana cresce com a distância real"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+def _chord(distance_km: float) -> float:
+    """Distância na esfera (km) → corda entre os vetores unitários"""
+    return 2 * np.sin(min(distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+class GeoIndex:
+    """Índice espacial imutável das lojas com coordenadas"""
+
+    def __init__(self, stores: List[Dict]):
+        self.stores = stores
+        self.lats = np.array([store["lat"] for store in stores], dtype=np.float64)
+        self.lngs = np.array([store["lng"] for store in stores], dtype=np.float64)
+        self.points = _unit_vectors(self.lats, self.lngs).reshape(-1, 3)
+        self.tree = cKDTree(self.points) if cKDTree is not None and stores else None
+
+    def __len__(self):
+        return len(self.stores)
+
+    def query(self, lat: float, lng: float, limit: int,
+              radius_km: Optional[float] = None) -> List[Tuple[Dict, float]]:
+        """As `limit` lojas mais próximas (opcionalmente só dentro do raio), com a distância em km"""
+        if not self.stores or limit <= 0:
+            return []
+        center = _unit_vectors([lat], [lng])[0]
+        limit = min(limit, len(self.stores))
+        bound = _chord(radius_km) if radius_km is not None else np.inf
+
+        if self.tree is not None:
+            _, positions = self.tree.query(center, k=limit, distance_upper_bound=bound)
+            positions = np.atleast_1d(positions)
+            # Vizinhos fora do raio voltam com posição == len(stores)
+            positions = positions[positions < len(self.stores)]
+        else:
+            chords = np.linalg.norm(self.points - center, axis=1)
+            positions = np.flatnonzero(chords <= bound)
+            if len(positions) > limit:
+                positions = positions[np.argpartition(chords[positions], limit - 1)[:limit]]
+
+        distances = haversine_km(lat, lng, self.lats[positions], self.lngs[positions])
+        order = np.argsort(distances)
+        return [(self.stores[positions[i]], float(distances[i])) for i in order]
+
+
+class StoreRegistry:
+    """Cadastro persistente (SQLite) das lojas físicas já encontradas, com índice geoespacial em memória"""
+
+    def __init__(self, path: Optional[str] = None,
+                 geocoder: Optional[Callable[[str], Optional[Dict]]] = None):
+        self.path = path or os.getenv("STORE_REGISTRY_DB", DEFAULT_PATH)
+        # Converte CEP em coordenadas (ex.: LocationService.lookup_local_cep)
+        self.geocoder = geocoder
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._index: Optional[GeoIndex] = None
+        self._dirty = True
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stores (
+                    url TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    address TEXT,
+                    phone TEXT,
+                    cep TEXT,
+                    lat REAL,
+                    lng REAL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            ''')
+            # Resultado da checagem de produto por loja e busca (cor + modelo)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS store_products (
+                    url TEXT NOT NULL,
+                    product_key TEXT NOT NULL,
+                    has_product INTEGER NOT NULL,
+                    checked_at REAL NOT NULL,
+                    PRIMARY KEY (url, product_key)
+                )
+            ''')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def locate(self, store: Dict) -> Dict:
+        """Preenche cep/lat/lng da loja a partir do CEP do endereço (sem rede)"""
+        cep = store.get("cep") or extract_cep(store.get("address"))
+        if cep:
+            store["cep"] = cep
+            location = self.geocoder(cep) if self.geocoder else None
+            if location:
+                store["lat"] = location["lat"]
+                store["lng"] = location["lng"]
+        return store
+
+    def add(self, store: Dict, color_name: str, car_model: str) -> Dict:
+        """Registra (ou atualiza) uma loja extraída; devolve a loja com as coordenadas reais"""
+        self.locate(store)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('''
+                INSERT INTO stores (url, name, address, phone, cep, lat, lng, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    name = excluded.name,
+                    address = COALESCE(NULLIF(excluded.address, ''), stores.address),
+                    phone = COALESCE(NULLIF(excluded.phone, ''), stores.phone),
+                    cep = COALESCE(excluded.cep, stores.cep),
+                    lat = COALESCE(excluded.lat, stores.lat),
+                    lng = COALESCE(excluded.lng, stores.lng),
+                    last_seen = excluded.last_seen
+            ''', (store["url"], store["name"], store.get("address"), store.get("phone"),
+                  store.get("cep"), store.get("lat"), store.get("lng"), now, now))
+            conn.execute(
+                "INSERT OR REPLACE INTO store_products VALUES (?, ?, ?, ?)",
+                (store["url"], make_key(color_name, car_model), int(bool(store.get("has_product"))), now)
+            )
+            conn.commit()
+            if store.get("lat") is not None:
+                self._dirty = True
+        return store
+
+    def _get_index(self) -> GeoIndex:
+        """Índice das lojas com coordenadas (remontado só quando houve mudança)"""
+        with self._lock:
+            if self._dirty or self._index is None:
+                rows = self._connect().execute(
+                    f"SELECT {', '.join(STORE_FIELDS)} FROM stores WHERE lat IS NOT NULL AND lng IS NOT NULL"
+                ).fetchall()
+                self._index = GeoIndex([dict(zip(STORE_FIELDS, row)) for row in rows])
+                self._dirty = False
+            return self._index
+
+    def nearest(self, lat: float, lng: float, color_name: str, car_model: str,
+                limit: int = 10, radius_km: Optional[float] = None) -> List[Dict]:
+        """Lojas mais próximas (ou dentro do raio) no formato do scraping, com distância
+
+        has_product só vale para lojas já checadas para esta cor + modelo (product_checked_at).
+        """
+        found = self._get_index().query(lat, lng, limit, radius_km)
+        if not found:
+            return []
+
+        urls = [store["url"] for store, _ in found]
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT url, has_product, checked_at FROM store_products WHERE product_key = ? "
+                f"AND url IN ({', '.join('?' * len(urls))})",
+                [make_key(color_name, car_model), *urls]
+            ).fetchall()
+        checks = {url: (bool(value), checked_at) for url, value, checked_at in rows}
+
+        results = []
+        for store, distance in found:
+            has_product, checked_at = checks.get(store["url"], (False, None))
+            results.append({
+                **store,
+                "has_product": has_product,
+                # None: a loja nunca foi checada para esta busca (cor + modelo)
+                "product_checked_at": checked_at,
+                "product_match": f"{color_name} - {car_model}",
+                "type": "physical",
+                "distance_km": round(distance, 1),
+            })
+        return results
+
+    def count(self) -> int:
+        return len(self._get_index())
+
+    async def add_async(self, store: Dict, color_name: str, car_model: str) -> Dict:
+        return await asyncio.to_thread(self.add, store, color_name, car_model)
+
+    async def nearest_async(self, lat: float, lng: float, color_name: str, car_model: str,
+                            limit: int = 10, radius_km: Optional[float] = None) -> List[Dict]:
+        return await asyncio.to_thread(self.nearest, lat, lng, color_name, car_model, limit, radius_km)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from models.schemas import AutomotiveSearchRequest, StoreResult
+from services.scraping_service import AutomotiveScrapingService
+from services.location_service import LocationService, has_coordinates
+from services.store_registry import StoreRegistry
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 10
+
+
+class StoreSearchService:
+    """Orquestra a busca de lojas: localização, scraping, distâncias e ordenação"""
+
+    def __init__(self, scraping_service: AutomotiveScrapingService, location_service: LocationService,
+                 store_registry: Optional[StoreRegistry] = None):
+        self.scraping_service = scraping_service
+        self.location_service = location_service
+        self.store_registry = store_registry
+        # Raio das lojas físicas do cadastro e quantas bastam para dispensar o scraping ao vivo
+        self.registry_radius_km = float(os.getenv("STORE_REGISTRY_RADIUS_KM", "50"))
+        self.registry_min_results = int(os.getenv("STORE_REGISTRY_MIN_RESULTS", "5"))
+        # Lojas vistas há mais tempo que isso disparam um scraping de atualização em segundo plano
+        self.registry_refresh_age = float(os.getenv("STORE_REGISTRY_REFRESH_SECONDS", str(7 * 86400)))
+        self._refresh_tasks = set()
+
+    def to_store_result(self, store: Dict, store_type: str, user_location: Optional[Dict]) -> StoreResult:
+        """Converte o dicionário do scraping em StoreResult (com distância para lojas físicas)"""
+        if store_type == "physical":
+            # Lojas emitidas durante a busca ainda não passaram pelo cálculo em lote
+            if store.get('distance_km') is None and store.get('lat') and store.get('lng') and has_coordinates(user_location):
+                distance_info = self.location_service.calculate_distance_haversine(
+                    user_location["lat"], user_location["lng"],
+                    store["lat"], store["lng"]
+                )
+                store.update(distance_info)
+
+            return StoreResult(
+                name=store["name"],
+                url=store["url"],
+                type="physical",
+                address=store.get("address"),
+                phone=store.get("phone"),
+                distance_km=store.get("distance_km"),
+                time_min=store.get("time_min"),
+                ships_to_cep=False,
+                has_product=store["has_product"],
+                product_match=store["product_match"]
+            )
+
+        return StoreResult(
+            name=store["name"],
+            url=store["url"],
+            type="online",
+            ships_to_cep=store["ships_to_cep"],
+            has_product=store["has_product"],
+            product_match=store["product_match"]
+        )
+
+    async def add_distances(self, stores: List[Dict], user_location: Optional[Dict]):
+        """Preenche distance_km/time_min das lojas com coordenadas (uma chamada em lote)"""
+        located = [store for store in stores if store.get('lat') and store.get('lng')]
+        if not located or not has_coordinates(user_location):
+            return
+        distances = await self.location_service.calculate_distances(
+            user_location["lat"], user_location["lng"],
+            [(store["lat"], store["lng"]) for store in located]
+        )
+        for store, distance_info in zip(located, distances):
+            store.update(distance_info)
+
+    async def find_registered_stores(self, request: AutomotiveSearchRequest,
+                                     user_location: Optional[Dict]) -> List[Dict]:
+        """Lojas do cadastro dentro do raio, das mais próximas para as mais distantes"""
+        if self.store_registry is None or not has_coordinates(user_location):
+            return []
+        try:
+            return await self.store_registry.nearest_async(
+                user_location["lat"], user_location["lng"],
+                request.color_name, request.car_model,
+                limit=MAX_RESULTS, radius_km=self.registry_radius_km
+            )
+        except Exception as e:
+            logger.error(f"Erro consultando o cadastro de lojas: {e}")
+            return []
+
+    def _is_stale(self, stores: List[Dict]) -> bool:
+        """Alguma checagem de produto mais velha que STORE_REGISTRY_REFRESH_SECONDS"""
+        oldest = min((store.get("product_checked_at") or 0 for store in stores), default=0)
+        return time.time() - oldest > self.registry_refresh_age
+
+    def _refresh_in_background(self, request: AutomotiveSearchRequest, user_location: Optional[Dict]):
+        """Scraping da região em segundo plano; as lojas extraídas atualizam o cadastro"""
+        task = asyncio.create_task(self.scraping_service.search_automotive_stores(
+            request.color_name, request.car_model, user_location
+        ))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def search(self, request: AutomotiveSearchRequest,
+                     on_result: Optional[Callable[[StoreResult], None]] = None) -> List[StoreResult]:
+        """Executa a busca completa; on_result recebe cada loja assim que é encontrada"""
+        # 1. Obter localização do usuário (base local de CEPs ou ViaCEP assíncrono)
+        user_location = await self.location_service.get_user_coordinates(
+            request.user_cep,
+            request.user_lat,
+            request.user_lng
+        )
+
+        def notify(store_type: str):
+            if on_result is None:
+                return None
+            return lambda store: on_result(self.to_store_result(store, store_type, user_location))
+
+        # 2. Lojas físicas já cadastradas perto do usuário (índice geoespacial local). Só valem as
+        # já checadas para esta cor + modelo: as outras estão no cadastro por causa de outras buscas
+        # e não dizem nada sobre este produto (o scraping ao vivo as checa e registra)
+        registry_stores = [
+            store for store in await self.find_registered_stores(request, user_location)
+            if store.get("product_checked_at") is not None
+        ]
+        if on_result is not None:
+            for store in registry_stores:
+                on_result(self.to_store_result(store, "physical", user_location))
+
+        physical_search = None
+        if len(registry_stores) < self.registry_min_results:
+            # Poucas lojas checadas na região: completa com o scraping ao vivo
+            physical_search = self.scraping_service.search_automotive_stores(
+                request.color_name,
+                request.car_model,
+                user_location,
+                on_store=notify("physical")
+            )
+        elif self._is_stale(registry_stores):
+            self._refresh_in_background(request, user_location)
+
+        # 3. Buscar lojas físicas (se preciso) e online em paralelo, sem bloquear o event loop
+        live_stores, online_stores = await asyncio.gather(
+            physical_search or asyncio.sleep(0, []),
+            self.scraping_service.search_online_stores(
+                request.color_code,
+                request.car_model,
+                request.user_cep or "",
+                on_store=notify("online")
+            )
+        )
+        known_urls = {store["url"] for store in registry_stores}
+        physical_stores = registry_stores + [store for store in live_stores if store["url"] not in known_urls]
+
+        # 4. Calcular as distâncias de todas as lojas físicas de uma vez
+        await self.add_distances(physical_stores, user_location)
+        
+        # 5. Formatar resultados
+        physical_results = [self.to_store_result(store, "physical", user_location) for store in physical_stores]
+        online_results = [self.to_store_result(store, "online", user_location) for store in online_stores]
+
+        # 6. Ordenar resultados
+        physical_results.sort(key=lambda x: x.distance_km or float('inf'))
+
+        final_results = physical_results + online_results
+
+        return final_results[:MAX_RESULTS]
+
+
+# Instância global
+_location_service = LocationService()
+_store_registry = StoreRegistry(geocoder=_location_service.lookup_local_cep)
+store_search_service = StoreSearchService(
+    AutomotiveScrapingService(store_registry=_store_registry),
+    _location_service,
+    _store_registry
+)
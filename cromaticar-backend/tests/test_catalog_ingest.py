@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from services.catalog_ingest import CatalogMaps
+
+
+class CatalogConnection:
+    """Catálogo com a Fiat usando o código de tinta 'P01' (Branco Banchisa)"""
+
+    async def fetch(self, query):
+        if "FROM montadora" in query:
+            return [{"id_montadora": 1, "nome": "Fiat"}, {"id_montadora": 2, "nome": "Volkswagen"}]
+        if "FROM ano" in query:
+            return [{"id_ano": 1, "ano": 2020}]
+        if "FROM modelo_ano_cor" in query:
+            return [{"id_montadora": 1, "id_cor": 1}]
+        if "FROM modelo" in query:
+            return [{"id_modelo": 1, "nome": "Uno", "id_montadora": 1},
+                    {"id_modelo": 2, "nome": "Gol", "id_montadora": 2}]
+        if "FROM cor" in query:
+            return [{"id_cor": 1, "nome_cor": "Branco Banchisa", "codigo_cor": "P01", "rgb": "#F4F4F4"}]
+        raise AssertionError(f"consulta inesperada: {query}")
+
+    async def fetchval(self, query):
+        return 2
+
+
+def _maps(update_colors=False):
+    maps = CatalogMaps(update_colors)
+    asyncio.run(maps.load(CatalogConnection()))
+    return maps
+
+
+def _row(brand, model, code, name, rgb=None):
+    return {"brand": brand, "model": model, "year": "2020", "color": name, "code": code, "rgb": rgb}
+
+
+def test_same_paint_code_from_another_brand_is_a_new_color():
+    maps = _maps(update_colors=True)
+
+    model_id, _, color_id = maps.resolve(_row("Volkswagen", "Gol", "P01", "Preto Ninja", "111111"))
+
+    new, updates = maps.take_new()
+    assert model_id == 2
+    assert color_id != 1
+    assert new["cor"] == [(color_id, "Preto Ninja", "P01", "#111111")]
+    assert updates == []
+
+
+def test_existing_color_of_the_same_brand_is_reused_without_update():
+    maps = _maps()
+
+    _, _, color_id = maps.resolve(_row("Fiat", "Uno", "P01", "Branco", "FFFFFF"))
+
+    new, updates = maps.take_new()
+    assert color_id == 1
+    assert new["cor"] == [] and updates == []
+
+
+def test_color_update_requires_opt_in():
+    maps = _maps(update_colors=True)
+
+    maps.resolve(_row("Fiat", "Uno", "P01", "Branco", "FFFFFF"))
+
+    _, updates = maps.take_new()
+    assert updates == [(1, "Branco", "#FFFFFF")]
+
+
+def test_rejected_row_does_not_register_new_entities():
+    maps = _maps()
+
+    with pytest.raises(ValueError):
+        maps.resolve(_row("Renault", "Kwid", "X9", "Laranja"))
+
+    new, _ = maps.take_new()
+    assert all(rows == [] for rows in new.values())
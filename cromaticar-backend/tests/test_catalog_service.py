@@ -0,0 +1,46 @@
+from services.catalog_service import CatalogService, CatalogSnapshot
+
+ROWS = (
+    [(1, "Fiat"), (2, "Volkswagen")],
+    [(1, 2020)],
+    [(1, "Uno", 1), (2, "Gol", 2)],
+    [(1, "Branco", "P01", "#FFFFFF"), (2, "Preto", "N01", "#000000")],
+    [(1, 1, 1), (2, 1, 2)],
+)
+
+
+def test_splice_replaces_only_the_changed_brand():
+    fresh = {"montadora": [(2, "Volkswagen")], "modelo": [(3, "Polo", 2)], "modelo_ano_cor": [(3, 1, 2)]}
+
+    brands, years, models, colors, links = CatalogService._splice(ROWS, {2}, fresh)
+
+    assert sorted(models) == [(1, "Uno", 1), (3, "Polo", 2)]
+    assert sorted(links) == [(1, 1, 1), (3, 1, 2)]
+    assert years == ROWS[1] and colors == ROWS[3]
+
+
+def test_version_changes_with_the_rows():
+    same = CatalogSnapshot.from_rows(*ROWS)
+    changed = CatalogSnapshot.from_rows(*CatalogService._splice(
+        ROWS, {2}, {"montadora": [(2, "Volkswagen")], "modelo": [(2, "Gol", 2)], "modelo_ano_cor": []}
+    ))
+
+    assert CatalogSnapshot.from_rows(*ROWS).version == same.version
+    assert changed.version != same.version
+
+
+def test_carried_over_tree_has_no_stale_version():
+    previous = CatalogSnapshot.from_rows(*ROWS)
+    previous.response_cache[("tree", 1, ("rgb",))] = "fiat"
+    previous.response_cache[("tree", 2, ("rgb",))] = "vw"
+    previous.response_cache[("tree", None, ("rgb",))] = "tudo"
+
+    current = CatalogSnapshot.from_rows(*CatalogService._splice(
+        ROWS, {2}, {"montadora": [(2, "Volkswagen")], "modelo": [(2, "Gol", 2)], "modelo_ano_cor": []}
+    ))
+    current.carry_over_responses(previous, {2})
+
+    assert current.response_cache == {("tree", 1, ("rgb",)): "fiat"}
+    # O corpo reaproveitado não pode trazer a versão do snapshot anterior
+    assert "version" not in previous.build_tree(1)
+    assert previous.build_tree(1) == current.build_tree(1)
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from services.cep_database import CepDatabase, build, open_database, read_csv
+
+ROWS = [
+    (1310100, -23.5614, -46.6559, "São Paulo", "SP"),
+    (1310200, -23.5630, -46.6543, "São Paulo", "SP"),
+    (13010000, -22.9056, -47.0608, "Campinas", "SP"),
+]
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "ceps.bin")
+    build(ROWS, path)
+    database = CepDatabase(path)
+    yield database
+    database.close()
+
+
+def test_exact_cep(database):
+    location = database.lookup("13010-000")
+
+    assert location["city"] == "Campinas" and location["state"] == "SP"
+    assert location["precision"] == "cep"
+    assert location["lat"] == pytest.approx(-22.9056, abs=1e-4)
+
+
+def test_unknown_cep_falls_back_to_the_prefix_centroid(database):
+    location = database.lookup("01310-999")
+
+    assert location["precision"] == "prefix"
+    assert location["city"] == "São Paulo"
+    assert location["lat"] == pytest.approx((-23.5614 - 23.5630) / 2, abs=1e-4)
+
+
+def test_missing_prefix_and_invalid_cep(database):
+    assert database.lookup("99999-999") is None
+    assert database.lookup("123") is None
+
+
+def test_read_csv_skips_invalid_rows(tmp_path):
+    path = tmp_path / "ceps.csv"
+    path.write_text(
+        "cep;latitude;longitude;cidade;uf\n"
+        "01310-100;-23,5614;-46,6559;São Paulo;sp\n"
+        "0131;-23.5;-46.6;São Paulo;SP\n"
+        "01310-200;abc;-46.6;São Paulo;SP\n"
+        "01310-300;-123.0;-46.6;São Paulo;SP\n",
+        encoding="utf-8",
+    )
+
+    assert list(read_csv(str(path))) == [(1310100, -23.5614, -46.6559, "São Paulo", "SP")]
+
+
+def test_open_database_without_file(tmp_path):
+    assert open_database(os.path.join(tmp_path, "ausente.bin")) is None
@@ -0,0 +1,101 @@
+import asyncio
+
+from services.fetch_service import CircuitBreaker, FetchService, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status = status
+        self.headers = {}
+
+
+class FakeSession:
+    """Responde sempre com `status`; com `hang`, a requisição fica pendurada até ser cancelada"""
+
+    closed = False
+
+    def __init__(self, status=200, hang=False):
+        self.status = status
+        self.hang = hang
+        self.calls = 0
+
+    def get(self, url, params=None, headers=None):
+        session = self
+
+        class Request:
+            async def __aenter__(self):
+                session.calls += 1
+                if session.hang:
+                    await asyncio.sleep(10)
+                return FakeResponse(session.status)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Request()
+
+
+def _service(session):
+    service = FetchService()
+    service.max_retries = 2
+    service._retry_delay = lambda attempt, retry_after: 0
+    service._get_session = lambda: session
+    return service
+
+
+def test_retries_count_as_a_single_breaker_failure():
+    session = FakeSession(status=503)
+    service = _service(session)
+
+    status, body, _ = asyncio.run(service.request("http://loja.test/"))
+
+    breaker = service._breaker("loja.test")
+    assert status == 503 and body is None
+    assert session.calls == 3
+    assert breaker.failures == 1 and breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_does_not_block_the_host():
+    async def scenario():
+        service = _service(FakeSession(hang=True))
+        breaker = service._breaker("loja.test")
+        breaker.opened_at = 0.0  # cooldown já passou: half-open
+
+        trial = asyncio.create_task(service.request("http://loja.test/"))
+        await asyncio.sleep(0.01)
+        assert breaker.testing
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        return breaker
+
+    breaker = asyncio.run(scenario())
+    assert not breaker.testing
+    assert breaker.allow()
+
+
+def test_failed_half_open_trial_reopens_without_retrying():
+    session = FakeSession(status=503)
+    service = _service(session)
+    breaker = service._breaker("loja.test")
+    breaker.opened_at = 0.0
+
+    asyncio.run(service.request("http://loja.test/"))
+
+    assert session.calls == 1
+    assert breaker.state == "open"
+
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_token_bucket_without_rate_does_not_limit():
+    async def scenario():
+        bucket = TokenBucket(rate=0, capacity=0)
+        await asyncio.wait_for(asyncio.gather(*(bucket.acquire() for _ in range(10))), 1)
+
+    asyncio.run(scenario())
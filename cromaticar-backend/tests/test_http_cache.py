@@ -0,0 +1,70 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services.http_cache import CachePolicy, HTTPCache, etag_matches
+
+
+def _client(version):
+    app = FastAPI()
+    calls = []
+
+    @app.get("/api/brands")
+    async def brands(q: str = ""):
+        calls.append(q)
+        return [{"id_montadora": 1, "nome": "Fiat"}]
+
+    @app.get("/api/location")
+    async def location():
+        calls.append("location")
+        return {"city": "Campinas"}
+
+    app.middleware("http")(HTTPCache(app, {
+        "/api/brands": CachePolicy(300, 600),
+        "/api/location": CachePolicy(86400, versioned=False),
+    }, lambda: version[0]))
+    return TestClient(app), calls
+
+
+def test_versioned_route_answers_304_before_the_handler():
+    version = ["v1"]
+    client, calls = _client(version)
+
+    first = client.get("/api/brands", params={"q": "a", "x": "1"})
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "public, max-age=300, stale-while-revalidate=600"
+
+    # Mesmos parâmetros em outra ordem: mesma representação
+    again = client.get("/api/brands?x=1&q=a", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert calls == ["a"]
+
+    version[0] = "v2"
+    changed = client.get("/api/brands", params={"q": "a", "x": "1"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+
+def test_versioned_route_is_not_cached_before_the_catalog_loads():
+    client, _ = _client([None])
+
+    response = client.get("/api/brands")
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+
+def test_unversioned_route_uses_the_body_hash():
+    client, calls = _client(["v1"])
+
+    etag = client.get("/api/location").headers["etag"]
+    response = client.get("/api/location", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert calls == ["location", "location"]
+
+
+def test_etag_matches_ignores_weak_prefix_and_encoding_suffix():
+    assert etag_matches('W/"abc-gzip", "other"', "abc")
+    assert etag_matches("*", "abc")
+    assert not etag_matches('"abcd"', "abc")
+    assert not etag_matches(None, "abc")
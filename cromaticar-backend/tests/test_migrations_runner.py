@@ -0,0 +1,93 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from migrations.runner import VIEW_REFRESH_LOCK_KEY, try_refresh_views
+
+
+class PooledCluster:
+    """Travas consultivas de um Postgres atrás de um pooler em modo transação
+
+    Fora de transação, cada comando cai no próximo backend; travas de sessão ficam presas ao
+    backend que as pegou e as de transação caem no fim da transação.
+    """
+
+    def __init__(self, backends=3):
+        self.session_locks = [set() for _ in range(backends)]
+        self.xact_locks = set()
+        self.next_backend = 0
+
+    def held(self, key):
+        return key in self.xact_locks or any(key in locks for locks in self.session_locks)
+
+
+class PooledConnection:
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.statements = []
+        self._pinned = None
+        self._xact = set()
+
+    def _backend(self):
+        if self._pinned is not None:
+            return self._pinned
+        backend = self.cluster.next_backend
+        self.cluster.next_backend = (backend + 1) % len(self.cluster.session_locks)
+        return backend
+
+    @asynccontextmanager
+    async def transaction(self):
+        self._pinned = self._backend()
+        try:
+            yield
+        finally:
+            self.cluster.xact_locks -= self._xact
+            self._xact = set()
+            self._pinned = None
+
+    async def fetchval(self, query, *args):
+        backend = self._backend()
+        key = args[0] if args else None
+        if "pg_try_advisory_xact_lock" in query:
+            if self._pinned is None or self.cluster.held(key):
+                return False
+            self._xact.add(key)
+            self.cluster.xact_locks.add(key)
+            return True
+        if "pg_try_advisory_lock" in query:
+            if self.cluster.held(key):
+                return False
+            self.cluster.session_locks[backend].add(key)
+            return True
+        raise AssertionError(f"consulta inesperada: {query}")
+
+    async def execute(self, query, *args):
+        backend = self._backend()
+        if "pg_advisory_unlock" in query:
+            self.cluster.session_locks[backend].discard(args[0])
+        self.statements.append(query)
+
+
+def test_view_refresh_lock_is_released_behind_a_transaction_pooler():
+    async def scenario():
+        cluster = PooledCluster()
+        first = await try_refresh_views(PooledConnection(cluster))
+        held_after = cluster.held(VIEW_REFRESH_LOCK_KEY)
+        second = await try_refresh_views(PooledConnection(cluster))
+        return first, held_after, second
+
+    first, held_after, second = asyncio.run(scenario())
+    assert first is not None
+    assert not held_after
+    assert second is not None
+
+
+def test_view_refresh_is_skipped_while_another_worker_holds_the_lock():
+    async def scenario():
+        cluster = PooledCluster()
+        cluster.xact_locks.add(VIEW_REFRESH_LOCK_KEY)
+        conn = PooledConnection(cluster)
+        return await try_refresh_views(conn), conn.statements
+
+    result, statements = asyncio.run(scenario())
+    assert result is None
+    assert not any("REFRESH" in statement for statement in statements)
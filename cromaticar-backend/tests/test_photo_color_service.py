@@ -0,0 +1,59 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+
+from services.photo_color_service import (
+    PhotoBusy, PhotoColorService, PhotoError, extract_dominant_colors, kmeans,
+)
+
+
+def _photo(colors, size=64):
+    """PNG com faixas verticais de cores iguais"""
+    image_module = pytest.importorskip("PIL.Image")
+    pixels = np.zeros((size, size, 3), dtype=np.uint8)
+    for index, color in enumerate(colors):
+        width = size // len(colors)
+        pixels[:, index * width:(index + 1) * width] = color
+    buffer = io.BytesIO()
+    image_module.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_kmeans_separates_distant_clusters():
+    rng = np.random.default_rng(0)
+    points = np.concatenate([
+        rng.normal((20, 0, 0), 1, size=(200, 3)),
+        rng.normal((80, 40, -40), 1, size=(100, 3)),
+    ])
+
+    centers, labels = kmeans(points, 2, rng)
+
+    assert sorted(np.bincount(labels).tolist()) == [100, 200]
+    assert sorted(round(center[0]) for center in centers) == [20, 80]
+
+
+def test_dominant_color_of_a_two_tone_photo():
+    data = _photo([(200, 30, 30), (30, 30, 200), (200, 30, 30)], size=60)
+
+    result = extract_dominant_colors(data, k=2, crop=1.0, max_side=64, max_pixels=10_000, sample=5_000)
+
+    assert result["colors"][0]["rgb"] == "#C81E1E"
+    assert result["colors"][0]["share"] > result["colors"][1]["share"]
+
+
+def test_oversized_and_invalid_photos_are_rejected():
+    with pytest.raises(PhotoError):
+        extract_dominant_colors(_photo([(10, 10, 10)], size=64), 1, 1.0, 64, max_pixels=100, sample=100)
+    with pytest.raises(PhotoError):
+        extract_dominant_colors(b"not an image", 1, 1.0, 64, 10_000, 100)
+
+
+def test_full_queue_is_refused_without_touching_the_pool():
+    service = PhotoColorService()
+    service.max_pending = 0
+
+    with pytest.raises(PhotoBusy):
+        asyncio.run(service.dominant_colors(b""))
+    assert service._pool is None
@@ -0,0 +1,86 @@
+import asyncio
+
+from services.single_flight import SingleFlight
+
+
+def test_followers_share_the_leader_result():
+    async def scenario():
+        group = SingleFlight("test-shared")
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return [1, 2]
+
+        results = await asyncio.gather(*(group.do("key", fetch) for _ in range(5)))
+        return calls, results, group.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert results == [[1, 2]] * 5
+    assert stats["coalesced"] == 4 and stats["in_flight"] == 0
+
+
+def test_cancelling_the_leader_does_not_cancel_followers():
+    async def scenario():
+        group = SingleFlight("test-leader-cancel")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "ok"
+
+        leader = asyncio.create_task(group.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(group.do("key", fetch))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await follower
+
+    leader, result = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert result == "ok"
+
+
+def test_execution_is_cancelled_when_every_caller_gives_up():
+    async def scenario():
+        group = SingleFlight("test-all-cancel")
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(group.do("key", fetch)) for _ in range(2)]
+        await started.wait()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return group.stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_exception_reaches_every_caller():
+    async def scenario():
+        group = SingleFlight("test-error")
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        return await asyncio.gather(*(group.do("key", fetch) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)